@@ -114,7 +114,10 @@ def apply_gaintable(vis: BlockVisibility, gt: GainTable, inverse=False, **kwargs
     is_scalar = gt.gain.shape[-2:] == (1, 1)
     if is_scalar:
         log.debug('apply_gaintable: scalar gains')
-        
+    
+    # The baselines a1 < a2 are held in vis[time, a2, a1]
+    a1, a2 = numpy.triu_indices(vis.nants, 1)
+    
     for chunk, rows in enumerate(vis_timeslice_iter(vis, **kwargs)):
         if numpy.sum(rows) > 0:
             vistime = numpy.average(vis.time[rows])
@@ -128,33 +131,57 @@ def apply_gaintable(vis: BlockVisibility, gt: GainTable, inverse=False, **kwargs
             
             original = vis.vis[rows]
             applied = copy.deepcopy(original)
-            for time in range(ntimes):
-                for a1 in range(vis.nants - 1):
-                    for a2 in range(a1 + 1, vis.nants):
-                        if is_scalar:
-                            smueller = gain[time, a1, :, 0] * numpy.conjugate(gain[time, a2, :, 0])
-                            if inverse:
-                                if numpy.abs(smueller).all() > 0.0:
-                                    applied[time, a2, a1, :, 0][..., numpy.newaxis] = original[time, a2, a1, :, 0][..., numpy.newaxis] / smueller
-                            else:
-                                applied[time, a2, a1, :, 0][..., numpy.newaxis] = original[time, a2, a1, :, 0][..., numpy.newaxis] * smueller
-                        else:
-                            for chan in range(nchan):
-                                mueller = numpy.kron(gain[time, a1, chan, :, :], numpy.conjugate(gain[time, a2, chan, :, :]))
-                                if inverse:
-                                    # If the Mueller is singular, ignore it
-                                    try:
-                                        mueller = numpy.linalg.inv(mueller)
-                                        applied[time, a2, a1, chan, :] = numpy.matmul(mueller, original[time, a2, a1, chan, :])
-                                    except numpy.linalg.linalg.LinAlgError:
-                                        applied[time, a2, a1, chan, :] = original[time, a2, a1, chan, :]
-                                else:
-                                    applied[time, a2, a1, chan, :] = numpy.matmul(mueller, original[time, a2, a1, chan, :])
             
+            # [ntimes, nbaselines, nchan, npol]
+            baseline_vis = original[:ntimes, a2, a1]
+            if is_scalar:
+                smueller = gain[:, a1, :, 0, 0] * numpy.conjugate(gain[:, a2, :, 0, 0])
+                if inverse:
+                    # If the gain is zero for any channel, leave the baseline unchanged
+                    valid = numpy.all(numpy.abs(smueller) > 0.0, axis=-1)[..., numpy.newaxis]
+                    corrected = baseline_vis / numpy.where(valid, smueller, 1.0)[..., numpy.newaxis]
+                else:
+                    corrected = baseline_vis * smueller[..., numpy.newaxis]
+            else:
+                # The mueller matrix g_1 kron conj(g_2) acting on the visibility vector is the same as
+                # g_1 V g_2^H acting on the 2x2 visibility matrix V. The inverse is the same with the
+                # inverse Jones matrices.
+                if inverse:
+                    jones, valid = invert_jones(gain)
+                    # If the Mueller is singular, ignore it
+                    valid = valid[:, a1] & valid[:, a2]
+                else:
+                    jones = gain
+                vmatrix = baseline_vis.reshape(baseline_vis.shape[:-1] + (nrec, nrec))
+                corrected = numpy.einsum('...ij,...jl,...kl->...ik', jones[:, a1], vmatrix,
+                                         numpy.conjugate(jones[:, a2])).reshape(baseline_vis.shape)
+                if inverse:
+                    corrected = numpy.where(valid[..., numpy.newaxis], corrected, baseline_vis)
+            
+            applied[:ntimes, a2, a1] = corrected
             vis.data['vis'][rows] = applied
     return vis
 
 
+def invert_jones(jones):
+    """ Invert a stack of 2x2 Jones matrices analytically
+
+    :param jones: Jones matrices [..., 2, 2]
+    :return: inverses [..., 2, 2], boolean mask [...] of the non-singular matrices. The singular matrices are
+        left unchanged.
+    """
+    det = jones[..., 0, 0] * jones[..., 1, 1] - jones[..., 0, 1] * jones[..., 1, 0]
+    valid = numpy.abs(det) > 0.0
+    det = numpy.where(valid, det, 1.0)
+    inverse = numpy.empty_like(jones)
+    inverse[..., 0, 0] = jones[..., 1, 1] / det
+    inverse[..., 0, 1] = - jones[..., 0, 1] / det
+    inverse[..., 1, 0] = - jones[..., 1, 0] / det
+    inverse[..., 1, 1] = jones[..., 0, 0] / det
+    inverse[~valid] = jones[~valid]
+    return inverse, valid
+
+
 def append_gaintable(gt: GainTable, othergt: GainTable) -> GainTable:
     """Append othergt to gt
 
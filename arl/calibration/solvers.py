@@ -16,9 +16,10 @@ import logging
 
 import numpy
 
-from arl.calibration.operations import create_gaintable_from_blockvisibility, create_gaintable_from_rows
+from arl.calibration.operations import create_gaintable_from_blockvisibility, create_gaintable_from_rows, \
+    invert_jones
 from arl.data.data_models import GainTable, BlockVisibility, assert_vis_gt_compatible
-from arl.visibility.base import create_visibility_from_rows
+from arl.data.parameters import get_parameter
 from arl.visibility.operations import divide_visibility
 
 log = logging.getLogger(__name__)
@@ -36,6 +37,7 @@ def solve_gaintable(vis: BlockVisibility, modelvis: BlockVisibility = None, phas
     :param niter: Number of iterations (default 30)
     :param tol: Iteration stops when the fractional change in the gain solution is below this tolerance
     :param crosspol: Do solutions including cross polarisations i.e. XY, YX or RL, LR
+    :param solver: 'itsubs' (iterative substitution, default) or 'stefcal'
     :return: GainTable containing solution
 
     """
@@ -48,29 +50,19 @@ def solve_gaintable(vis: BlockVisibility, modelvis: BlockVisibility = None, phas
     else:
         log.info('solve_gaintable: Solving for complex gain')
     
+    solver = get_parameter(kwargs, 'solver', 'itsubs')
+    solvers = {'itsubs': solve_antenna_gains_itsubs_batch, 'stefcal': solve_antenna_gains_stefcal_batch}
+    assert solver in solvers, "Unknown gain solver %s" % solver
+    
     gt = create_gaintable_from_blockvisibility(vis)
     
-    for row in range(gt.ntimes):
-        vis_rows = numpy.abs(vis.time - gt.time[row]) < gt.interval[row] / 2.0
-        if numpy.sum(vis_rows) > 0:
-            subvis = create_visibility_from_rows(vis, vis_rows)
-            if modelvis is not None:
-                model_subvis = create_visibility_from_rows(modelvis, vis_rows)
-                pointvis = divide_visibility(subvis, model_subvis)
-                x = numpy.sum(pointvis.vis * pointvis.weight, axis=0)
-                xwt = numpy.sum(pointvis.weight, axis=0)
-            else:
-                x = numpy.sum(subvis.vis * subvis.weight, axis=0)
-                xwt = numpy.sum(subvis.weight, axis=0)
-            
-            mask = numpy.abs(xwt) > 0.0
-            x_shape = x.shape
-            x[mask] = x[mask] / xwt[mask]
-            x[~mask] = 0.0
-            x = x.reshape(x_shape)
-            
-            gt = solve_from_X(gt, x, xwt, row, crosspol, niter, phase_only,
-                              tol, npol=vis.polarisation_frame.npol)
+    x, xwt, rows = point_source_equivalents(vis, modelvis, gt)
+    
+    if len(rows) > 0:
+        gainshape = gt.data['gain'][rows, ...].shape
+        gt.data['gain'][rows, ...], gt.data['weight'][rows, ...], gt.data['residual'][rows, ...] = \
+            solvers[solver](gainshape, x, xwt, phase_only=phase_only, niter=niter, tol=tol,
+                            crosspol=crosspol)
     
     assert isinstance(gt, GainTable), "gt is not a GainTable: %r" % gt
     
@@ -79,36 +71,37 @@ def solve_gaintable(vis: BlockVisibility, modelvis: BlockVisibility = None, phas
     return gt
 
 
-def solve_from_X(gt: GainTable, x: numpy.ndarray, xwt: numpy.ndarray, chunk, crosspol, niter, phase_only, tol, npol) \
-        -> GainTable:
-    """ Solve for gains from the point source equivalents
+def point_source_equivalents(vis: BlockVisibility, modelvis: BlockVisibility, gt: GainTable) \
+        -> (numpy.ndarray, numpy.ndarray, numpy.ndarray):
+    """ Reduce the visibility to point source equivalents for all solution intervals at once
+    
+    The visibility is divided by the model (if present) and then summed over time within each
+    gain table interval using a single weighted reduction.
 
-    :param x: point source visibility
-    :param xwt: point source weight
-    :param chunk: which chunk of the gaintable?
-    :param crosspol:
-    :param niter:
-    :param phase_only:
-    :param tol:
-    :param npol:
-    :return:
+    :param vis: BlockVisibility containing the observed data
+    :param modelvis: BlockVisibility containing the visibility predicted by a model (or None)
+    :param gt: GainTable defining the solution intervals
+    :return: x [nrows, nants, nants, nchan, npol], xwt, indices of gain table rows that have data
     """
-    gainshape = gt.data['gain'][chunk, ...].shape
-    if npol > 1:
-        if crosspol:
-            gt.data['gain'][chunk, ...], gt.data['weight'][chunk, ...], gt.data['residual'][chunk, ...] = \
-                solve_antenna_gains_itsubs_matrix(gainshape, x, xwt, phase_only=phase_only, niter=niter,
-                                                  tol=tol)
-        else:
-            gt.data['gain'][chunk, ...], gt.data['weight'][chunk, ...], gt.data['residual'][chunk, ...] = \
-                solve_antenna_gains_itsubs_vector(gainshape, x, xwt, phase_only=phase_only, niter=niter,
-                                                  tol=tol)
-    
+    if modelvis is not None:
+        pointvis = divide_visibility(vis, modelvis)
     else:
-        gt.data['gain'][chunk, ...], gt.data['weight'][chunk, ...], gt.data['residual'][chunk, ...] = \
-            solve_antenna_gains_itsubs_scalar(gainshape, x, xwt, phase_only=phase_only, niter=niter,
-                                              tol=tol)
-    return gt
+        pointvis = vis
+    
+    # membership[row, time] is True if the visibility time falls within the gain table interval
+    membership = numpy.abs(vis.time[numpy.newaxis, :] - gt.time[:, numpy.newaxis]) < \
+                 gt.interval[:, numpy.newaxis] / 2.0
+    rows = numpy.flatnonzero(numpy.sum(membership, axis=1) > 0)
+    membership = membership[rows].astype('float')
+    
+    x = numpy.tensordot(membership, pointvis.vis * pointvis.weight, axes=(1, 0))
+    xwt = numpy.tensordot(membership, pointvis.weight, axes=(1, 0))
+    
+    mask = numpy.abs(xwt) > 0.0
+    x[mask] = x[mask] / xwt[mask]
+    x[~mask] = 0.0
+    
+    return x, xwt, rows
 
 
 def solve_antenna_gains_itsubs_scalar(gainshape, x, xwt, niter=30, tol=1e-8, phase_only=True, refant=0):
@@ -353,6 +346,241 @@ def gain_substitution_matrix(gain, x, xwt):
     return newgain, gwt
 
 
+def solve_antenna_gains_itsubs_batch(gainshape, x, xwt, niter=30, tol=1e-8, phase_only=True, refant=0,
+                                     crosspol=False):
+    """Solve for the antenna gains for all solution intervals and channels at once
+    
+    x(antenna2, antenna1) = gain(antenna1) conj(gain(antenna2))
+    
+    This is the same iterative substitution as solve_antenna_gains_itsubs_scalar, _vector and _matrix
+    but vectorised across the leading (time, channel) axes. Each (time, channel) solution stops
+    updating once its change is below tol.
+
+    :param gainshape: Shape of output gains [ntimes, nants, nchan, nrec, nrec]
+    :param x: Equivalent point source visibility [ntimes, nants, nants, nchan, npol]
+    :param xwt: Equivalent point source weight [ntimes, nants, nants, nchan, npol]
+    :param niter: Number of iterations
+    :param tol: tolerance on solution change
+    :param phase_only: Do solution for only the phase? (default True)
+    :param refant: Reference antenna for phase (default=0.0)
+    :param crosspol: Solve for the off-diagonal terms of the Jones matrices
+    :return: gain [ntimes, nants, ...], weight [ntimes, nants, ...], residual [ntimes, nchan, nrec, nrec]
+    """
+    ntimes, nants, nchan, nrec, _ = gainshape
+    x, xwt, gain, gwt = _prepare_batch(gainshape, x, xwt, crosspol)
+    
+    rec = numpy.arange(nrec)
+    active = numpy.ones(ntimes * nchan, dtype='bool')
+    for iter in range(niter):
+        m = numpy.flatnonzero(active)
+        gainLast = gain[m]
+        newgain, newgwt = gain_substitution_batch(gainLast, x[m], xwt[m])
+        if phase_only:
+            mask = numpy.abs(newgain) > 0.0
+            newgain[mask] = newgain[mask] / numpy.abs(newgain[mask])
+        if not crosspol:
+            newgain[..., rec, rec] *= numpy.exp(-1j * numpy.angle(newgain[:, refant, rec, rec]))[:, numpy.newaxis, :]
+        gain[m] = 0.5 * (newgain + gainLast)
+        # The change is that of the damped solution, as in solve_antenna_gains_itsubs_scalar
+        change = numpy.max(numpy.abs(gain[m] - gainLast).reshape(len(m), -1), axis=1)
+        gwt[m] = newgwt
+        active[m[change < tol]] = False
+        if not numpy.any(active):
+            break
+    
+    return _finish_batch(gainshape, gain, gwt, solution_residual_batch(gain, x, xwt))
+
+
+def solve_antenna_gains_stefcal_batch(gainshape, x, xwt, niter=30, tol=1e-8, phase_only=True, refant=0,
+                                      crosspol=False):
+    """Solve for the antenna gains using StefCal for all solution intervals and channels at once
+
+    x(antenna2, antenna1) = gain(antenna1) conj(gain(antenna2))
+
+    StefCal is an alternating least squares method. Each step solves for the gain of every antenna
+    with the gains of the other antennas held fixed, and the new and previous solutions are averaged
+    only on every second step. See util/stefcal.py and:
+
+    S. Salvini and S. J. Wijnholds, "Fast gain calibration in radio astronomy using alternating
+    direction implicit methods: Analysis and applications," Astronomy & Astrophysics, vol. 571, A97, 2014.
+
+    For the scalar and vector cases the step is the same as gain_substitution_batch. With crosspol
+    the full Jones matrices are solved for using the 2x2 normal equations.
+
+    :param gainshape: Shape of output gains [ntimes, nants, nchan, nrec, nrec]
+    :param x: Equivalent point source visibility [ntimes, nants, nants, nchan, npol]
+    :param xwt: Equivalent point source weight [ntimes, nants, nants, nchan, npol]
+    :param niter: Number of iterations
+    :param tol: tolerance on solution change
+    :param phase_only: Do solution for only the phase? (default True)
+    :param refant: Reference antenna for phase (default=0.0)
+    :param crosspol: Solve for the off-diagonal terms of the Jones matrices
+    :return: gain [ntimes, nants, ...], weight [ntimes, nants, ...], residual [ntimes, nchan, nrec, nrec]
+    """
+    ntimes, nants, nchan, nrec, _ = gainshape
+    matrix = crosspol and nrec > 1
+    x, xwt, gain, gwt = _prepare_batch(gainshape, x, xwt, crosspol, matrix=matrix)
+    
+    rec = numpy.arange(nrec)
+    active = numpy.ones(ntimes * nchan, dtype='bool')
+    for iter in range(niter):
+        m = numpy.flatnonzero(active)
+        gainLast = gain[m]
+        if matrix:
+            newgain, newgwt = gain_substitution_stefcal_matrix(gainLast, x[m], xwt[m])
+        else:
+            newgain, newgwt = gain_substitution_batch(gainLast, x[m], xwt[m])
+        if phase_only:
+            mask = numpy.abs(newgain) > 0.0
+            newgain[mask] = newgain[mask] / numpy.abs(newgain[mask])
+        # Rotating each column of the Jones matrices leaves the model unchanged
+        newgain *= numpy.exp(-1j * numpy.angle(newgain[:, refant, rec, rec]))[:, numpy.newaxis, numpy.newaxis, :]
+        change = numpy.max(numpy.abs(newgain - gainLast).reshape(len(m), -1), axis=1)
+        if iter % 2 == 1:
+            newgain = 0.5 * (newgain + gainLast)
+        gain[m] = newgain
+        gwt[m] = newgwt
+        active[m[change < tol]] = False
+        if not numpy.any(active):
+            break
+    
+    return _finish_batch(gainshape, gain, gwt, solution_residual_batch(gain, x, xwt, matrix=matrix))
+
+
+def gain_substitution_stefcal_matrix(gain, x, xwt):
+    """One StefCal step for a batch of full Jones matrix solutions
+    
+    For each antenna a, with the other gains J_b held fixed, this solves the normal equations
+    
+    J_a = (sum_b w_ba X_ba J_b) (sum_b w_ba J_b^H J_b)^-1
+    
+    where the baseline weight w_ba is the mean of the weights of the parallel hand terms.
+
+    :param gain: gain [m, nants, 2, 2]
+    :param x: Point source equivalent visibility [m, nants, nants, 2, 2]
+    :param xwt: Point source equivalent weight [m, nants, nants, 2, 2]
+    :return: newgain [m, nants, 2, 2], weight [m, nants, 2, 2]
+    """
+    wt = 0.5 * (xwt[..., 0, 0] + xwt[..., 1, 1])
+    top = numpy.einsum('mba,mbaij,mbjk->maik', wt, x, gain)
+    bot = numpy.einsum('mba,mbji,mbjk->maik', wt, numpy.conjugate(gain), gain)
+    
+    inverse, valid = invert_jones(bot)
+    newgain = numpy.zeros_like(top)
+    newgain[valid] = numpy.matmul(top[valid], inverse[valid])
+    return newgain, bot.real
+
+
+def _finish_batch(gainshape, gain, gwt, residual):
+    """Rearrange the batch solutions back into gain table order
+
+    :param gainshape: Shape of output gains [ntimes, nants, nchan, nrec, nrec]
+    :param gain: gain [m, nants, nrec, nrec]
+    :param gwt: gain weight [m, nants, nrec, nrec]
+    :param residual: residual [m, nrec, nrec]
+    :return: gain [ntimes, nants, ...], weight [ntimes, nants, ...], residual [ntimes, nchan, nrec, nrec]
+    """
+    ntimes, nants, nchan, nrec, _ = gainshape
+    gain = gain.reshape(ntimes, nchan, nants, nrec, nrec).transpose(0, 2, 1, 3, 4)
+    gwt = gwt.reshape(ntimes, nchan, nants, nrec, nrec).transpose(0, 2, 1, 3, 4)
+    residual = residual.reshape(ntimes, nchan, nrec, nrec)
+    return gain, gwt, residual
+
+
+def _prepare_batch(gainshape, x, xwt, crosspol, matrix=False):
+    """Rearrange the point source equivalents for a batch solution and make the initial gains
+
+    The leading axis of the outputs runs over (time, channel). The visibility is made Hermitean
+    in the antennas and, without cross polarisation, the off-diagonal terms are given zero weight.
+    Element by element, as for the iterative substitution, the mirrored baselines are X_ab = conj(X_ba).
+    For a full matrix solution they are X_ab = X_ba^H so that the model J_a J_b^H holds for both.
+
+    :param gainshape: Shape of output gains [ntimes, nants, nchan, nrec, nrec]
+    :param x: Equivalent point source visibility [ntimes, nants, nants, nchan, npol]
+    :param xwt: Equivalent point source weight [ntimes, nants, nants, nchan, npol]
+    :param crosspol: Solve for the off-diagonal terms of the Jones matrices
+    :param matrix: Mirror the baselines as 2x2 matrices
+    :return: x, xwt [m, nants, nants, nrec, nrec], gain, gwt [m, nants, nrec, nrec]
+    """
+    ntimes, nants, nchan, nrec, _ = gainshape
+    
+    # Work with (time, channel) as a single leading axis: x[m, ant2, ant1, rec, rec]
+    x = x.reshape(ntimes, nants, nants, nchan, nrec, nrec).transpose(0, 3, 1, 2, 4, 5)
+    xwt = xwt.reshape(ntimes, nants, nants, nchan, nrec, nrec).transpose(0, 3, 1, 2, 4, 5)
+    x = x.reshape(ntimes * nchan, nants, nants, nrec, nrec).copy()
+    xwt = xwt.reshape(ntimes * nchan, nants, nants, nrec, nrec).copy()
+    
+    ant1, ant2 = numpy.triu_indices(nants, 1)
+    if matrix:
+        x[:, ant1, ant2, ...] = numpy.conjugate(x[:, ant2, ant1, ...]).swapaxes(-1, -2)
+        xwt[:, ant1, ant2, ...] = xwt[:, ant2, ant1, ...].swapaxes(-1, -2)
+    else:
+        x[:, ant1, ant2, ...] = numpy.conjugate(x[:, ant2, ant1, ...])
+        xwt[:, ant1, ant2, ...] = xwt[:, ant2, ant1, ...]
+    diag = numpy.arange(nants)
+    x[:, diag, diag, ...] = 0.0
+    xwt[:, diag, diag, ...] = 0.0
+    
+    # Without cross polarisation only the diagonal terms take part
+    if nrec > 1 and not crosspol:
+        x[..., 0, 1] = 0.0
+        x[..., 1, 0] = 0.0
+        xwt[..., 0, 1] = 0.0
+        xwt[..., 1, 0] = 0.0
+    
+    gain = numpy.ones([ntimes * nchan, nants, nrec, nrec], dtype='complex')
+    if nrec > 1:
+        gain[..., 0, 1] = 0.0
+        gain[..., 1, 0] = 0.0
+    gwt = numpy.zeros([ntimes * nchan, nants, nrec, nrec])
+    return x, xwt, gain, gwt
+
+
+def gain_substitution_batch(gain, x, xwt):
+    """One iterative substitution step for a batch of independent solutions
+    
+    The gains, visibility and weights are combined element by element as in the matrix case,
+    so the scalar and vector cases are included by zero weights on the unused terms.
+
+    :param gain: gain [m, nants, nrec, nrec]
+    :param x: Point source equivalent visibility [m, nants, nants, nrec, nrec]
+    :param xwt: Point source equivalent weight [m, nants, nants, nrec, nrec]
+    :return: newgain [m, nants, nrec, nrec], weight [m, nants, nrec, nrec]
+    """
+    top = numpy.einsum('mbaij,mbij->maij', x * xwt, gain)
+    bot = numpy.einsum('mbaij,mbij->maij', xwt, (gain * numpy.conjugate(gain)).real)
+    
+    newgain = numpy.zeros_like(top)
+    mask = bot > 0.0
+    newgain[mask] = top[mask] / bot[mask]
+    return newgain, bot
+
+
+def solution_residual_batch(gain, x, xwt, matrix=False):
+    """Calculate residual across all baselines of gain for a batch of point source equivalent visibilities
+
+    The model is x(antenna2, antenna1) = gain(antenna1) conj(gain(antenna2)) element by element or, for
+    matrix=True, the Jones matrix product J_antenna1 J_antenna2^H.
+
+    :param gain: gain [m, nants, nrec, nrec]
+    :param x: Point source equivalent visibility [m, nants, nants, nrec, nrec]
+    :param xwt: Point source equivalent weight [m, nants, nants, nrec, nrec]
+    :param matrix: Use the Jones matrix model
+    :return: residual[m, nrec, nrec]
+    """
+    if matrix:
+        error = x - numpy.einsum('maij,mbkj->mbaik', gain, numpy.conjugate(gain))
+    else:
+        error = x - gain[:, numpy.newaxis, ...] * numpy.conjugate(gain[:, :, numpy.newaxis, ...])
+    residual = numpy.sum((error * xwt * numpy.conjugate(error)).real, axis=(1, 2))
+    sumwt = numpy.sum(xwt, axis=(1, 2))
+    
+    mask = sumwt > 0.0
+    residual[mask] = numpy.sqrt(residual[mask] / sumwt[mask])
+    residual[~mask] = 0.0
+    return residual
+
+
 def solution_residual_scalar(gain, x, xwt):
     """Calculate residual across all baselines of gain for point source equivalent visibilities
     
@@ -24,6 +24,7 @@ The principle transitions between the data models:
 
 """
 
+import copy
 import logging
 import sys
 from typing import Union
@@ -338,6 +339,76 @@ class Skycomponent:
         return s
 
 
+class ColumnTable:
+    """ Table of named columns held as separate native-endian, C-contiguous numpy arrays
+
+    The first axis of every column is the row. This supports the parts of the numpy structured array
+    interface used for visibility data: data['vis'] gives the column, data[rows] gives a new table
+    holding the selected rows, and data[rows] = other writes the rows of every column. Arithmetic on a
+    column therefore needs neither byte swapping nor strided access.
+    """
+    
+    def __init__(self, columns):
+        """ColumnTable
+
+        :param columns: list of (name, array) pairs or dict of arrays, all with the same number of rows
+        """
+        self.columns = dict()
+        for name, col in (columns.items() if isinstance(columns, dict) else columns):
+            self[name] = col
+    
+    @property
+    def dtype(self):
+        """ Equivalent structured dtype
+        """
+        return numpy.dtype([(name, col.dtype, col.shape[1:]) for name, col in self.columns.items()])
+    
+    @property
+    def shape(self):
+        return (len(self),)
+    
+    @property
+    def size(self):
+        return len(self)
+    
+    def __len__(self):
+        if len(self.columns) == 0:
+            return 0
+        return next(iter(self.columns.values())).shape[0]
+    
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.columns[key]
+        return ColumnTable([(name, col[key]) for name, col in self.columns.items()])
+    
+    def __setitem__(self, key, value):
+        if isinstance(key, str):
+            if key in self.columns:
+                self.columns[key][...] = value
+            else:
+                col = numpy.ascontiguousarray(value)
+                self.columns[key] = col.astype(col.dtype.newbyteorder('='), copy=False)
+        else:
+            for name, col in self.columns.items():
+                col[key] = value[name]
+    
+    def hstack(self, other):
+        """ Append the rows of other, returning a new table
+
+        :param other: ColumnTable or structured array with the same columns
+        :return: ColumnTable
+        """
+        return ColumnTable([(name, numpy.concatenate((col, other[name]))) for name, col in self.columns.items()])
+    
+    def sort(self, order):
+        """ Sort the rows on the given one-dimensional columns, returning a new table
+
+        :param order: list of column names, the first being the primary key
+        :return: ColumnTable
+        """
+        return self[numpy.lexsort([self.columns[name] for name in reversed(order)])]
+
+
 class Visibility:
     """ Visibility table class
 
@@ -356,6 +427,12 @@ class Visibility:
     row in the original block visibility that this row has a value for. The original blockvisibility
     is also preserves as n attribute so that decoalescence is expedited. If you don't need that then
     the storage can be released by setting self.blockvis to None
+
+    If columnar is True, the columns are held as separate native-endian, contiguous arrays in a
+    :class:`ColumnTable` instead of a structured array. The accessors are the same for both.
+
+    Sortings of the rows by uv tile (see :py:func:`arl.imaging.params.get_tile_sort`) are cached in
+    tile_sort_cache.
     """
     
     def __init__(self,
@@ -364,7 +441,7 @@ class Visibility:
                  time=None, antenna1=None, antenna2=None, vis=None,
                  weight=None, imaging_weight=None, integration_time=None,
                  polarisation_frame=PolarisationFrame('stokesI'), cindex=None,
-                 blockvis=None):
+                 blockvis=None, columnar=False):
         """Visibility
 
         :param data:
@@ -383,6 +460,7 @@ class Visibility:
         :param polarisation_frame:
         :param cindex:
         :param blockvis:
+        :param columnar: Hold the columns as separate contiguous arrays in a :class:`ColumnTable`
         """
         if data is None and vis is not None:
             if imaging_weight is None:
@@ -395,33 +473,34 @@ class Visibility:
             assert len(antenna2) == nvis
             
             npol = polarisation_frame.npol
-            desc = [('index', '>i8'),
-                    ('uvw', '>f8', (3,)),
-                    ('time', '>f8'),
-                    ('frequency', '>f8'),
-                    ('channel_bandwidth', '>f8'),
-                    ('integration_time', '>f8'),
-                    ('antenna1', '>i8'),
-                    ('antenna2', '>i8'),
-                    ('vis', '>c16', (npol,)),
-                    ('weight', '>f8', (npol,)),
-                    ('imaging_weight', '>f8', (npol,))]
-            data = numpy.zeros(shape=[nvis], dtype=desc)
-            data['index'] = list(range(nvis))
-            data['uvw'] = uvw
-            data['time'] = time
-            data['frequency'] = frequency
-            data['channel_bandwidth'] = channel_bandwidth
-            data['integration_time'] = integration_time
-            data['antenna1'] = antenna1
-            data['antenna2'] = antenna2
-            data['vis'] = vis
-            data['weight'] = weight
-            data['imaging_weight'] = imaging_weight
+            columns = [('index', numpy.arange(nvis)),
+                       ('uvw', uvw),
+                       ('time', time),
+                       ('frequency', frequency),
+                       ('channel_bandwidth', channel_bandwidth),
+                       ('integration_time', integration_time),
+                       ('antenna1', antenna1),
+                       ('antenna2', antenna2),
+                       ('vis', vis),
+                       ('weight', weight),
+                       ('imaging_weight', imaging_weight)]
+            desc = [('index', 'i8'),
+                    ('uvw', 'f8', (3,)),
+                    ('time', 'f8'),
+                    ('frequency', 'f8'),
+                    ('channel_bandwidth', 'f8'),
+                    ('integration_time', 'f8'),
+                    ('antenna1', 'i8'),
+                    ('antenna2', 'i8'),
+                    ('vis', 'c16', (npol,)),
+                    ('weight', 'f8', (npol,)),
+                    ('imaging_weight', 'f8', (npol,))]
+            data = _make_table(nvis, desc, columns, columnar)
         
-        self.data = data  # numpy structured array
+        self.data = data  # numpy structured array or ColumnTable
         self.cindex = cindex
         self.blockvis = blockvis
+        self.tile_sort_cache = dict()
         self.phasecentre = phasecentre  # Phase centre of observation
         self.configuration = configuration  # Antenna/station configuration
         self.polarisation_frame = polarisation_frame
@@ -434,6 +513,10 @@ class Visibility:
             size += self.data[col].nbytes
         return size / 1024.0 / 1024.0 / 1024.0
     
+    @property
+    def columnar(self):
+        return isinstance(self.data, ColumnTable)
+    
     @property
     def index(self):
         return self.data['index']
@@ -514,13 +597,16 @@ class BlockVisibility:
     Polarisation frame is the same for the entire data set and can be stokesI, circular, linear
     
     The configuration is also an attribute
+
+    If columnar is True, the columns are held as separate native-endian, contiguous arrays in a
+    :class:`ColumnTable` instead of a structured array.
     """
     
     def __init__(self,
                  data=None, frequency=None, channel_bandwidth=None,
                  phasecentre=None, configuration=None, uvw=None,
                  time=None, vis=None, weight=None, integration_time=None,
-                 polarisation_frame=PolarisationFrame('stokesI')):
+                 polarisation_frame=PolarisationFrame('stokesI'), columnar=False):
         """BlockVisibility
 
         :param data:
@@ -534,27 +620,28 @@ class BlockVisibility:
         :param weight:
         :param integration_time:
         :param polarisation_frame:
+        :param columnar: Hold the columns as separate contiguous arrays in a :class:`ColumnTable`
         """
         if data is None and vis is not None:
             ntimes, nants, _, nchan, npol = vis.shape
             assert vis.shape == weight.shape
             assert len(frequency) == nchan
             assert len(channel_bandwidth) == nchan
-            desc = [('index', '>i8'),
-                    ('uvw', '>f8', (nants, nants, 3)),
-                    ('time', '>f8'),
-                    ('integration_time', '>f8'),
-                    ('vis', '>c16', (nants, nants, nchan, npol)),
-                    ('weight', '>f8', (nants, nants, nchan, npol))]
-            data = numpy.zeros(shape=[ntimes], dtype=desc)
-            data['index'] = list(range(ntimes))
-            data['uvw'] = uvw
-            data['time'] = time
-            data['integration_time'] = integration_time
-            data['vis'] = vis
-            data['weight'] = weight
+            columns = [('index', numpy.arange(ntimes)),
+                       ('uvw', uvw),
+                       ('time', time),
+                       ('integration_time', integration_time),
+                       ('vis', vis),
+                       ('weight', weight)]
+            desc = [('index', 'i8'),
+                    ('uvw', 'f8', (nants, nants, 3)),
+                    ('time', 'f8'),
+                    ('integration_time', 'f8'),
+                    ('vis', 'c16', (nants, nants, nchan, npol)),
+                    ('weight', 'f8', (nants, nants, nchan, npol))]
+            data = _make_table(ntimes, desc, columns, columnar)
         
-        self.data = data  # numpy structured array
+        self.data = data  # numpy structured array or ColumnTable
         self.frequency = frequency
         self.channel_bandwidth = channel_bandwidth
         self.phasecentre = phasecentre  # Phase centre of observation
@@ -569,6 +656,10 @@ class BlockVisibility:
             size += self.data[col].nbytes
         return size / 1024.0 / 1024.0 / 1024.0
     
+    @property
+    def columnar(self):
+        return isinstance(self.data, ColumnTable)
+    
     @property
     def nchan(self):
         return self.data['vis'].shape[3]
@@ -618,6 +709,113 @@ class BlockVisibility:
         return self.data.size
 
 
+class RowView:
+    """ Selection of rows of a parent visibility that shares the parent data
+
+    The rows are a slice, in which case the data are numpy views of the parent data and nothing is
+    copied, or an index array, in which case the rows are copied on first use. Views of the parent data
+    are read-only: call materialise before changing the data in place. Assigning to data also
+    detaches the view from the parent.
+    """
+    
+    def _set_view(self, vis, rows):
+        self.__dict__.update({k: v for k, v in vis.__dict__.items()
+                              if k not in ['data', '_data', '_parent_data', 'rows']})
+        self._parent_data = vis.data
+        self._data = None
+        self.rows = rows
+    
+    @property
+    def data(self):
+        if self._data is not None:
+            return self._data
+        if not isinstance(self.rows, slice):
+            return self.materialise()._data
+        return _readonly(self._parent_data[self.rows])
+    
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._parent_data = None
+    
+    @property
+    def materialised(self):
+        return self._data is not None
+    
+    def materialise(self):
+        """ Copy the selected rows so that the data can be changed in place
+
+        :return: self
+        """
+        if self._data is None:
+            if isinstance(self.rows, slice):
+                self.data = copy.deepcopy(self._parent_data[self.rows])
+            else:
+                self.data = self._parent_data[self.rows]
+        return self
+
+
+class VisibilityView(RowView, Visibility):
+    """ Selection of rows of a Visibility that shares the parent data (see :class:`RowView`)
+    """
+    
+    def __init__(self, vis: Visibility, rows):
+        """VisibilityView
+
+        :param vis: Parent Visibility
+        :param rows: slice or index array of selected rows
+        """
+        self._set_view(vis, rows)
+        self.tile_sort_cache = dict()
+        if vis.cindex is not None and len(vis.cindex) == vis.nvis:
+            self.cindex = vis.cindex[rows]
+        else:
+            self.cindex = None
+
+
+class BlockVisibilityView(RowView, BlockVisibility):
+    """ Selection of rows of a BlockVisibility that shares the parent data (see :class:`RowView`)
+    """
+    
+    def __init__(self, vis: BlockVisibility, rows):
+        """BlockVisibilityView
+
+        :param vis: Parent BlockVisibility
+        :param rows: slice or index array of selected rows
+        """
+        self._set_view(vis, rows)
+
+
+def _readonly(data):
+    """ Mark a view of a structured array or ColumnTable as read-only
+    """
+    if isinstance(data, ColumnTable):
+        for col in data.columns.values():
+            col.flags.writeable = False
+    else:
+        data.flags.writeable = False
+    return data
+
+
+def _make_table(nrows, desc, columns, columnar=False):
+    """ Fill a structured array or ColumnTable from the given columns
+
+    :param nrows: Number of rows
+    :param desc: Structured dtype description, giving the type and row shape of each column
+    :param columns: list of (name, values) in the same order as desc
+    :param columnar: Make a ColumnTable instead of a structured array
+    :return: numpy structured array or ColumnTable
+    """
+    if columnar:
+        table = ColumnTable([(d[0], numpy.zeros((nrows,) + (d[2] if len(d) > 2 else ()), dtype=d[1]))
+                             for d in desc])
+    else:
+        table = numpy.zeros(shape=[nrows], dtype=desc)
+    for name, values in columns:
+        table[name] = values
+    return table
+
+
 class QA:
     """ Quality assessment
 
@@ -9,9 +9,12 @@ This module contains functions for performing the gridding process and the inver
 """
 
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy
 
+from arl.fourier_transforms.kernel_cache import get_kernel_cache
+
 log = logging.getLogger(__name__)
 
 
@@ -66,7 +69,7 @@ def coordinates2Offset(npixel: int, cx: int, cy: int):
     return ((mg[0] - cy) / npixel, (mg[1] - cx) / npixel)
 
 
-def anti_aliasing_calculate(shape, oversampling=1, support=3):
+def anti_aliasing_calculate(shape, oversampling=1, support=3, dtype='complex'):
     """
     Compute the prolate spheroidal anti-aliasing function
     
@@ -76,19 +79,46 @@ def anti_aliasing_calculate(shape, oversampling=1, support=3):
     
     Return the 2D grid correction function (gcf), and the convolving kernel (kernel
 
+    Both are held in the process-wide kernel cache (see arl.fourier_transforms.kernel_cache) and so
+    are read-only.
+
     See VLA Scientific Memoranda 129, 131, 132
     :param shape: (height, width) pair
     :param oversampling: Number of sub-samples per grid pixel
     :param support: Support of kernel (in pixels) width is 2*support+2
+    :param dtype: Type of the kernel 'complex' | 'complex64'
     """
+    cache = get_kernel_cache()
+    ny, nx = shape
+    gcf = cache.get(('anti_aliasing_gcf', int(ny), int(nx)), lambda: anti_aliasing_gcf(shape))
+    kernel = cache.get(('anti_aliasing_kernel', int(oversampling), int(support), numpy.dtype(dtype).str),
+                       lambda: anti_aliasing_kernel(oversampling, support, dtype))
+    return gcf, kernel
+
+
+def anti_aliasing_gcf(shape):
+    """ Compute the prolate spheroidal grid correction function
     
+    :param shape: (height, width) pair
+    :return: gcf [ny, nx]
+    """
     # 2D Prolate spheroidal angular function is separable
     ny, nx = shape
     nu = numpy.abs(2.0 * coordinates(nx))
     gcf1d, _ = grdsf(nu)
     gcf = numpy.outer(gcf1d, gcf1d)
     gcf[gcf > 0.0] = gcf.max() / gcf[gcf > 0.0]
+    return gcf
+
+
+def anti_aliasing_kernel(oversampling=1, support=3, dtype='complex'):
+    """ Compute the prolate spheroidal gridding kernel
     
+    :param oversampling: Number of sub-samples per grid pixel
+    :param support: Support of kernel (in pixels) width is 2*support+2
+    :param dtype: Type of the kernel 'complex' | 'complex64'
+    :return: kernel [oversampling, oversampling, 2*support+2, 2*support+2]
+    """
     s1d = 2 * support + 2
     nu = numpy.arange(-support, +support, 1.0 / oversampling)
     kernel1d = grdsf(nu / support)[1]
@@ -101,7 +131,7 @@ def anti_aliasing_calculate(shape, oversampling=1, support=3):
         for xf in range(oversampling):
             mx = range(xf, l1d, oversampling)[::-1]
             kernel4d[yf, xf, 2:, 2:] = numpy.outer(kernel1d[my], kernel1d[mx])
-    return gcf, (kernel4d / numpy.sum(kernel4d[0, 0, :, :])).astype('complex')
+    return (kernel4d / numpy.sum(kernel4d[0, 0, :, :])).astype(dtype)
 
 
 def grdsf(nu):
@@ -183,6 +213,44 @@ def w_beam(npixel, field_of_view, w, cx=None, cy=None, remove_shift=False):
     return cp
 
 
+def oversampled_kernel(screen, oversampling, kernelwidth):
+    """ Calculate the oversampled gridding kernel whose image plane form is screen
+    
+    This gives the same result as padding the screen by oversampling on each axis, taking the inverse FFT
+    and extracting the central kernelwidth * oversampling samples (see
+    :py:func:`arl.image.operations.convert_image_to_kernel`). Since only those samples are needed, they
+    are calculated directly by a partial DFT, as a product of matrices along each axis. This takes
+    O(kernelwidth * oversampling * npixel ** 2) operations and O(npixel ** 2) memory rather than
+    O((oversampling * npixel) ** 2 log(oversampling * npixel)) operations and O((oversampling * npixel) ** 2)
+    memory.
+    
+    :param screen: Image plane form of kernel [ny, nx] (including any gridding correction)
+    :param oversampling: Oversampling factor
+    :param kernelwidth: Width of kernel (even)
+    :return: kernel [oversampling, oversampling, kernelwidth, kernelwidth]
+    """
+    assert kernelwidth % 2 == 0, "kernelwidth must be even"
+    ny, nx = screen.shape
+    assert kernelwidth < nx and kernelwidth < ny, "Specified kernel width %d too large" % kernelwidth
+    
+    # Offsets in the oversampled grid of the samples needed: these are consecutive
+    koffsets = numpy.arange(-oversampling * kernelwidth // 2 + oversampling,
+                            oversampling * kernelwidth // 2 + oversampling)
+    
+    def dft_matrix(npixel):
+        # Take the phase modulo the padded size in integers to keep full precision
+        npadded = oversampling * npixel
+        phase = numpy.outer(koffsets, numpy.arange(npixel) - npixel // 2) % npadded
+        return numpy.exp(2j * numpy.pi * phase / npadded) / npixel
+    
+    full = numpy.dot(dft_matrix(ny), numpy.dot(screen, dft_matrix(nx).T))
+    
+    # Sample (yf, t) has offset oversampling * (kernelwidth / 2 - t) + yf i.e. the kernel is flipped
+    index = oversampling * (kernelwidth - 1 - numpy.arange(kernelwidth))[numpy.newaxis, :] + \
+            numpy.arange(oversampling)[:, numpy.newaxis]
+    return full[index[:, numpy.newaxis, :, numpy.newaxis], index[numpy.newaxis, :, numpy.newaxis, :]]
+
+
 def frac_coord(npixel, kernel_oversampling, p):
     """ Compute whole and fractional parts of coordinates, rounded to
     kernel_oversampling-th fraction of pixel size
@@ -203,18 +271,293 @@ def frac_coord(npixel, kernel_oversampling, p):
     return flx.astype(int), fracx.astype(int)
 
 
-def convolutional_degrid(kernel_list, vshape, uvgrid, vuvwmap, vfrequencymap, vpolarisationmap=None):
+def grid_coordinates(shape, kernels, vuvwmap):
+    """ Compute the integer and fractional grid coordinates of the kernel patches for all rows
+    
+    :param shape: Shape of grid [nchan, npol, ny, nx]
+    :param kernels: list of oversampled convolution kernels (only the shape of the first is used)
+    :param vuvwmap: map uvw to grid fractions
+    :return: x, y (lower corners of the patches), xf, yf (oversampling offsets)
+    """
+    kernel_oversampling, _, gh, gw = kernels[0].shape
+    ny, nx = shape[-2:]
+    y, yf = frac_coord(ny, kernel_oversampling, vuvwmap[:, 1])
+    y -= gh // 2
+    x, xf = frac_coord(nx, kernel_oversampling, vuvwmap[:, 0])
+    x -= gw // 2
+    return x, y, xf, yf
+
+
+def _import_numba_gridding():
+    """ Import the compiled gridding kernels. If numba is not installed an exception ModuleNotFoundError is raised.
+    
+    """
+    try:
+        from arl.fourier_transforms import numba_gridding
+    except ModuleNotFoundError:
+        raise ModuleNotFoundError("numba is not installed")
+    return numba_gridding
+
+
+def _kernel_index_array(kernel_indices, kernels, nrows):
+    """ Kernel index per row as an integer array. A single kernel is always index 0.
+    
+    """
+    if len(kernels) > 1:
+        return numpy.array(kernel_indices, dtype='int')
+    else:
+        return numpy.zeros([nrows], dtype='int')
+
+
+def patch_flat_indices(shape, chans, x, y, gh, gw):
+    """ Flat indices into a grid of the (gh, gw) patch for each row and polarisation
+
+    :param shape: Shape of grid [nchan, npol, ny, nx]
+    :param chans: Image channel per row
+    :param x: Lower left integer grid coordinate per row
+    :param y: Lower left integer grid coordinate per row
+    :param gh: Height of patch
+    :param gw: Width of patch
+    :return: Indices into the flattened grid [nrows, npol, gh * gw]
+    """
+    inchan, inpol, ny, nx = shape
+    offsets = (numpy.arange(gh)[:, numpy.newaxis] * nx + numpy.arange(gw)[numpy.newaxis, :]).flatten()
+    base = (numpy.asarray(chans)[:, numpy.newaxis] * inpol + numpy.arange(inpol)[numpy.newaxis, :]) * ny * nx
+    base += (y * nx + x)[:, numpy.newaxis]
+    return base[..., numpy.newaxis] + offsets[numpy.newaxis, numpy.newaxis, :]
+
+
+def batch_chunksize(npol, gh, gw, itemsize=16, maxbytes=64 * 1024 * 1024):
+    """ Number of rows per chunk such that the gathered patches, their indices and the kernels fit in maxbytes
+
+    :param npol: Number of polarisations
+    :param gh: Height of kernel
+    :param gw: Width of kernel
+    :param itemsize: Size of a complex grid value (bytes)
+    :param maxbytes: Memory budget (bytes)
+    :return: Number of rows (at least 1)
+    """
+    rowbytes = gh * gw * (npol * (itemsize + 8) + itemsize)
+    return max(1, maxbytes // rowbytes)
+
+
+def batch_degrid(uvgrid, ckernels, kernel_indices, chans, x, y, xf, yf, npol, chunksize=None):
+    """ Degrid using fancy-indexed patches, processing rows in chunks
+
+    All grid patches for a chunk of rows are gathered at once and the kernel multiply-sum is done
+    by one einsum. The chunksize bounds the memory used by the gathered patches and kernels. By default
+    it is set from the kernel size by batch_chunksize, so large w kernels are degridded in smaller chunks.
+
+    :param uvgrid: Grid to degrid from [nchan, npol, ny, nx]
+    :param ckernels: Conjugated kernels [nkernels, oversampling, oversampling, gh, gw]
+    :param kernel_indices: Kernel index per row
+    :param chans: Image channel per row
+    :param x: Lower left integer grid coordinate per row
+    :param y: Lower left integer grid coordinate per row
+    :param xf: Fractional (oversampled) coordinate per row
+    :param yf: Fractional (oversampled) coordinate per row
+    :param npol: Number of polarisations in the visibility
+    :param chunksize: Number of rows per chunk (default from batch_chunksize)
+    :return: Visibilities [nrows, npol]
+    """
+    _, _, _, gh, gw = ckernels.shape
+    nrows = len(x)
+    if chunksize is None:
+        chunksize = batch_chunksize(npol, gh, gw, uvgrid.itemsize)
+    uvflat = uvgrid.reshape([-1])
+    vis = numpy.zeros([nrows, npol], dtype='complex')
+    for start in range(0, nrows, chunksize):
+        rows = slice(start, min(start + chunksize, nrows))
+        indices = patch_flat_indices(uvgrid.shape, chans[rows], x[rows], y[rows], gh, gw)[:, :npol, :]
+        patches = uvflat[indices]
+        kernels = ckernels[kernel_indices[rows], yf[rows], xf[rows]].reshape([-1, gh * gw])
+        vis[rows] = numpy.einsum('rpk,rk->rp', patches, kernels)
+    return vis
+
+
+def tile_sort(shape, vuvwmap, vfrequencymap, tilesize=64):
+    """ Sort rows by the (channel, tile_y, tile_x) of the uv cell in which they fall
+
+    The grid is divided into tiles of tilesize x tilesize cells. Gridding the rows tile by tile keeps
+    the accumulation in a small, cache resident subgrid.
+
+    :param shape: Shape of grid [nchan, npol, ny, nx]
+    :param vuvwmap: map uvw to grid fractions
+    :param vfrequencymap: map frequency to image channels
+    :param tilesize: Size of tile in cells
+    :return: (permutation of rows, start of each tile in the permutation (ntiles+1),
+        (chan, tile_y, tile_x) for each tile [ntiles, 3])
+    """
+    inchan, inpol, ny, nx = shape
+    y, _ = frac_coord(ny, 1, vuvwmap[:, 1])
+    x, _ = frac_coord(nx, 1, vuvwmap[:, 0])
+    ntilesy = (ny + tilesize - 1) // tilesize
+    ntilesx = (nx + tilesize - 1) // tilesize
+    key = (numpy.array(vfrequencymap, dtype='int') * ntilesy + y // tilesize) * ntilesx + x // tilesize
+    perm = numpy.argsort(key, kind='stable')
+    skey = key[perm]
+    bounds = numpy.concatenate([[0], numpy.flatnonzero(numpy.diff(skey)) + 1, [len(skey)]])
+    tkey = skey[bounds[:-1]]
+    tiles = numpy.stack([tkey // (ntilesy * ntilesx), (tkey // ntilesx) % ntilesy, tkey % ntilesx], axis=1)
+    return perm, bounds, tiles
+
+
+def _grid_tile(tile, shape, kernels, kernel_indices, viswt, x, y, xf, yf, sort, tilesize=64, chunksize=10000,
+               numba_gridding=None):
+    """ Grid the rows of one tile into a subgrid
+
+    :return: chan, (oy, ey, ox, ex) location of the subgrid in the grid, subgrid [npol, ey - oy, ex - ox]
+    """
+    inchan, inpol, ny, nx = shape
+    _, _, _, gh, gw = kernels.shape
+    npol = viswt.shape[-1]
+    perm, bounds, tiles = sort
+    chan, ty, tx = tiles[tile]
+    # The patches start up to half a kernel plus one cell before the uv cell
+    my = gh // 2 + 1
+    mx = gw // 2 + 1
+    oy = max(ty * tilesize - my, 0)
+    ey = min((ty + 1) * tilesize + my, ny)
+    ox = max(tx * tilesize - mx, 0)
+    ex = min((tx + 1) * tilesize + mx, nx)
+    sh, sw = ey - oy, ex - ox
+    rows = perm[bounds[tile]:bounds[tile + 1]]
+    if numba_gridding is not None:
+        subgrid = numpy.zeros([1, npol, sh, sw], dtype=kernels.dtype)
+        numba_gridding.numba_grid(subgrid, numpy.zeros([1, npol]), kernels, kernel_indices[rows],
+                                  viswt[rows].astype(kernels.dtype), numpy.zeros([len(rows), npol]),
+                                  numpy.zeros([len(rows)], dtype='int'), x[rows] - ox, y[rows] - oy,
+                                  xf[rows], yf[rows])
+        return chan, (oy, ey, ox, ex), subgrid[0]
+    offsets = (numpy.arange(gh)[:, numpy.newaxis] * sw + numpy.arange(gw)[numpy.newaxis, :]).flatten()
+    subgrid = numpy.zeros([npol, sh * sw], dtype=kernels.dtype)
+    for start in range(0, len(rows), chunksize):
+        chunk = rows[start:start + chunksize]
+        indices = (((y[chunk] - oy) * sw + x[chunk] - ox)[:, numpy.newaxis] + offsets).flatten()
+        kernel = kernels[kernel_indices[chunk], yf[chunk], xf[chunk]].reshape([-1, gh * gw])
+        for pol in range(npol):
+            values = (kernel * viswt[chunk, pol][:, numpy.newaxis]).flatten()
+            subgrid[pol] += numpy.bincount(indices, values.real, sh * sw) + \
+                            1j * numpy.bincount(indices, values.imag, sh * sw)
+    return chan, (oy, ey, ox, ex), subgrid.reshape([npol, sh, sw])
+
+
+def tiled_grid(uvgrid, sumwt, kernels, kernel_indices, viswt, wts, chans, x, y, xf, yf, sort, tilesize=64,
+               chunksize=10000, nthreads=1, numba_gridding=None):
+    """ Grid tile by tile into small subgrids that are then added to the main grid
+
+    Within a tile, the kernel patches for up to chunksize rows are accumulated into the subgrid
+    in one vectorised operation, or by the compiled loop if numba_gridding is given.
+
+    If nthreads > 1, the tiles are gridded by a pool of threads. The subgrids are added to the
+    main grid in tile order by the calling thread so the result does not depend on nthreads. Only
+    a few subgrids per thread are held at any time so the memory used is bounded by the tile size, not
+    the grid size.
+
+    :param uvgrid: Grid to add to [nchan, npol, ny, nx] (updated in place)
+    :param sumwt: Sum of weights [nchan, npol] (updated in place)
+    :param kernels: Kernels [nkernels, oversampling, oversampling, gh, gw]
+    :param kernel_indices: Kernel index per row
+    :param viswt: Weighted visibilities [nrows, npol]
+    :param wts: Weights [nrows, npol]
+    :param chans: Image channel per row
+    :param x: Lower left integer grid coordinate per row
+    :param y: Lower left integer grid coordinate per row
+    :param xf: Fractional (oversampled) coordinate per row
+    :param yf: Fractional (oversampled) coordinate per row
+    :param sort: Tile sorting as returned by tile_sort (using the same tilesize)
+    :param tilesize: Size of tile in cells
+    :param chunksize: Maximum number of rows to accumulate at once
+    :param nthreads: Number of threads
+    :param numba_gridding: Module of compiled gridding loops to use within each tile (optional)
+    """
+    inchan, inpol, ny, nx = uvgrid.shape
+    npol = viswt.shape[-1]
+    ntiles = len(sort[2])
+    
+    def grid_tile(tile):
+        return _grid_tile(tile, uvgrid.shape, kernels, kernel_indices, viswt, x, y, xf, yf, sort, tilesize,
+                          chunksize, numba_gridding)
+    
+    def add_subgrid(chan, extent, subgrid):
+        oy, ey, ox, ex = extent
+        uvgrid[chan, :npol, oy:ey, ox:ex] += subgrid
+    
+    if nthreads > 1:
+        batch = 4 * nthreads
+        with ThreadPoolExecutor(nthreads) as executor:
+            for first in range(0, ntiles, batch):
+                for result in executor.map(grid_tile, range(first, min(first + batch, ntiles))):
+                    add_subgrid(*result)
+    else:
+        for tile in range(ntiles):
+            add_subgrid(*grid_tile(tile))
+    for pol in range(npol):
+        sumwt[:, pol] += numpy.bincount(chans, wts[:, pol], inchan)
+    return uvgrid, sumwt
+
+
+def threaded_grid(kernel_list, uvgrid, vis, visweights, vuvwmap, vfrequencymap, nthreads=4, **kwargs):
+    """ Grid disjoint chunks of rows in a pool of threads, each onto a private grid, followed by a reduction
+
+    Each thread needs a grid of the full size. For large grids use shard='tiles' in convolutional_grid
+    instead. Only the compiled gridder='numba' releases the GIL, so convolutional_grid uses this only for that
+    gridder.
+
+    :param kernel_list: (kernel indices, list of oversampled convolution kernels)
+    :param uvgrid: Grid to add to [nchan, npol, npixel, npixel]
+    :param vis: Visibility values
+    :param visweights: Visibility weights
+    :param vuvwmap: map uvw to grid fractions
+    :param vfrequencymap: map frequency to image channels
+    :param nthreads: Number of threads
+    :param kwargs: Passed to convolutional_grid for each chunk
+    :return: uv grid[nchan, npol, ny, nx], sumwt[nchan, npol]
+    """
+    kernel_indices, kernels = kernel_list
+    kernel_indices = numpy.array(kernel_indices)
+    vfrequencymap = numpy.array(vfrequencymap)
+    bounds = numpy.linspace(0, vis.shape[0], nthreads + 1).astype('int')
+    coords = kwargs.pop('coords', None)
+    
+    def grid_rows(shard):
+        rows = slice(bounds[shard], bounds[shard + 1])
+        shard_coords = None if coords is None else tuple(c[rows] for c in coords)
+        return convolutional_grid((kernel_indices[rows], kernels), numpy.zeros_like(uvgrid), vis[rows],
+                                  visweights[rows], vuvwmap[rows], vfrequencymap[rows], coords=shard_coords,
+                                  **kwargs)
+    
+    with ThreadPoolExecutor(nthreads) as executor:
+        results = list(executor.map(grid_rows, range(nthreads)))
+    
+    sumwt = numpy.zeros(uvgrid.shape[:2])
+    for grid, wt in results:
+        uvgrid += grid
+        sumwt += wt
+    return uvgrid, sumwt
+
+
+def convolutional_degrid(kernel_list, vshape, uvgrid, vuvwmap, vfrequencymap, vpolarisationmap=None,
+                         gridder='numpy', chunksize=None, coords=None):
     """Convolutional degridding with frequency and polarisation independent
 
     Takes into account fractional `uv` coordinate values where the GCF
     is oversampled
 
+    The gridder 'numba' uses a compiled loop (requires numba). The gridder 'batch' gathers the grid patches
+    for chunksize rows at a time and degrids them in one vectorised operation. Both agree with 'numpy' to
+    rounding error. There is no
+    tiled degridding so 'tiled' is the same as 'numpy'.
+
     :param kernels: list of oversampled convolution kernel
     :param vshape: Shape of visibility
     :param uvgrid:   The uv plane to de-grid from
     :param vuvwmap: function to map uvw to grid fractions
     :param vfrequencymap: function to map frequency to image channels
     :param vpolarisationmap: function to map polarisation to image polarisation
+    :param gridder: 'numpy' | 'numba' | 'batch' | 'tiled'
+    :param chunksize: Number of rows per chunk for gridder='batch' (default from batch_chunksize)
+    :param coords: Grid coordinates from grid_coordinates (calculated if None)
     :return: Array of visibilities.
     """
     kernel_indices, kernels = kernel_list
@@ -226,12 +569,22 @@ def convolutional_degrid(kernel_list, vshape, uvgrid, vuvwmap, vfrequencymap, vp
     vis = numpy.zeros(vshape, dtype='complex')
     
     # uvw -> fraction of grid mapping
-    y, yf = frac_coord(ny, kernel_oversampling, vuvwmap[:, 1])
-    y -= gh // 2
-    x, xf = frac_coord(nx, kernel_oversampling, vuvwmap[:, 0])
-    x -= gw // 2
+    if coords is None:
+        coords = grid_coordinates(uvgrid.shape, kernels, vuvwmap)
+    x, y, xf, yf = coords
     
-    if len(kernels) > 1:
+    if gridder == 'numba':
+        numba_gridding = _import_numba_gridding()
+        ckernels = numpy.conjugate(numpy.array(kernels, dtype=uvgrid.dtype))
+        numba_gridding.numba_degrid(vis, uvgrid, ckernels, _kernel_index_array(kernel_indices, kernels, len(x)),
+                                    numpy.array(vfrequencymap, dtype='int'), x, y, xf, yf)
+    elif gridder == 'batch':
+        ckernels = numpy.conjugate(numpy.array(kernels, dtype=uvgrid.dtype))
+        vis[...] = batch_degrid(uvgrid, ckernels, _kernel_index_array(kernel_indices, kernels, len(x)),
+                                numpy.array(vfrequencymap, dtype='int'), x, y, xf, yf, vnpol, chunksize)
+    elif gridder not in ['numpy', 'tiled']:
+        raise ValueError("Unknown gridder %s" % gridder)
+    elif len(kernels) > 1:
         coords = kernel_indices, list(vfrequencymap), x, y, xf, yf
         ckernels = numpy.conjugate(kernels)
         for pol in range(vnpol):
@@ -252,11 +605,25 @@ def convolutional_degrid(kernel_list, vshape, uvgrid, vuvwmap, vfrequencymap, vp
     return numpy.array(vis)
 
 
-def convolutional_grid(kernel_list, uvgrid, vis, visweights, vuvwmap, vfrequencymap, vpolarisationmap=None):
+def convolutional_grid(kernel_list, uvgrid, vis, visweights, vuvwmap, vfrequencymap, vpolarisationmap=None,
+                       gridder='numpy', sort=None, tilesize=64, chunksize=10000, nthreads=1, shard='rows',
+                       coords=None):
     """Grid after convolving with frequency and polarisation independent gcf
 
     Takes into account fractional `uv` coordinate values where the GCF is oversampled
 
+    The gridder 'numba' uses a compiled loop (requires numba) that agrees with the 'numpy' gridder to
+    rounding error. There is no batched gridding so 'batch' is the same as 'numpy'. The gridder 'tiled'
+    grids the rows sorted by uv tile (see tile_sort) into small subgrids. The sort may be passed in to
+    avoid recalculation.
+
+    If nthreads > 1 the gridding is done by a pool of threads. For shard='rows' each thread grids a disjoint
+    chunk of rows onto a private copy of the grid (see threaded_grid). This needs the GIL to be released
+    so it is only done for gridder='numba': the other gridders grid in one thread. For shard='tiles' the
+    threads grid whole uv tiles into subgrids (see tiled_grid), which needs only a little more memory than
+    the grid itself. With shard='tiles' the gridder 'numba' is used within each tile and any other gridder
+    is treated as 'tiled'.
+
     :param kernels: List of oversampled convolution kernels
     :param uvgrid: Grid to add to [nchan, npol, npixel, npixel]
     :param vis: Visibility values
@@ -264,9 +631,28 @@ def convolutional_grid(kernel_list, uvgrid, vis, visweights, vuvwmap, vfrequency
     :param vuvwmap: map uvw to grid fractions
     :param vfrequencymap: map frequency to image channels
     :param vpolarisationmap: map polarisation to image polarisation
+    :param gridder: 'numpy' | 'numba' | 'batch' | 'tiled'
+    :param sort: Tile sorting from tile_sort for gridder='tiled' (calculated if None)
+    :param tilesize: Size of tile in cells for gridder='tiled'
+    :param chunksize: Maximum number of rows to accumulate at once for gridder='tiled'
+    :param nthreads: Number of threads
+    :param shard: Division of work between threads 'rows' | 'tiles'
+    :param coords: Grid coordinates from grid_coordinates (calculated if None)
     :return: uv grid[nchan, npol, ny, nx], sumwt[nchan, npol]
     """
     
+    if shard not in ['rows', 'tiles']:
+        raise ValueError("Unknown shard %s" % shard)
+    
+    if nthreads > 1 and shard == 'rows' and gridder != 'numba':
+        log.warning("convolutional_grid: gridder %s holds the GIL so shard 'rows' would not be faster, "
+                    "gridding in one thread" % gridder)
+        nthreads = 1
+    
+    if nthreads > 1 and shard == 'rows':
+        return threaded_grid(kernel_list, uvgrid, vis, visweights, vuvwmap, vfrequencymap, nthreads=nthreads,
+                             gridder=gridder, tilesize=tilesize, chunksize=chunksize, coords=coords)
+    
     kernel_indices, kernels = kernel_list
     kernel_oversampling, _, gh, gw = kernels[0].shape
     assert gh % 2 == 0, "Convolution kernel must have even number of pixels"
@@ -277,10 +663,9 @@ def convolutional_grid(kernel_list, uvgrid, vis, visweights, vuvwmap, vfrequency
     sumwt = numpy.zeros([inchan, inpol])
     
     # uvw -> fraction of grid mapping
-    y, yf = frac_coord(ny, kernel_oversampling, vuvwmap[:, 1])
-    y -= gh // 2
-    x, xf = frac_coord(nx, kernel_oversampling, vuvwmap[:, 0])
-    x -= gw // 2
+    if coords is None:
+        coords = grid_coordinates(uvgrid.shape, kernels, vuvwmap)
+    x, y, xf, yf = coords
     
     # About 228k samples per second for standard kernel so about 10 million CMACs per second
     
@@ -289,7 +674,30 @@ def convolutional_grid(kernel_list, uvgrid, vis, visweights, vuvwmap, vfrequency
     viswt = vis[...] * visweights[...]
     npol = vis.shape[-1]
 
-    if len(kernels) > 1:
+    if nthreads > 1:
+        if sort is None:
+            sort = tile_sort(uvgrid.shape, vuvwmap, vfrequencymap, tilesize)
+        numba_gridding = _import_numba_gridding() if gridder == 'numba' else None
+        tiled_grid(uvgrid, sumwt, numpy.array(kernels, dtype=uvgrid.dtype),
+                   _kernel_index_array(kernel_indices, kernels, len(x)), viswt, wts.astype('float'),
+                   numpy.array(vfrequencymap, dtype='int'), x, y, xf, yf, sort, tilesize, chunksize,
+                   nthreads=nthreads, numba_gridding=numba_gridding)
+    elif gridder == 'numba':
+        numba_gridding = _import_numba_gridding()
+        # The compiled loops need native byte order
+        numba_gridding.numba_grid(uvgrid, sumwt, numpy.array(kernels, dtype=uvgrid.dtype),
+                                  _kernel_index_array(kernel_indices, kernels, len(x)),
+                                  viswt.astype(uvgrid.dtype), wts.astype('float'),
+                                  numpy.array(vfrequencymap, dtype='int'), x, y, xf, yf)
+    elif gridder == 'tiled':
+        if sort is None:
+            sort = tile_sort(uvgrid.shape, vuvwmap, vfrequencymap, tilesize)
+        tiled_grid(uvgrid, sumwt, numpy.array(kernels, dtype=uvgrid.dtype),
+                   _kernel_index_array(kernel_indices, kernels, len(x)), viswt, wts,
+                   numpy.array(vfrequencymap, dtype='int'), x, y, xf, yf, sort, tilesize, chunksize)
+    elif gridder not in ['numpy', 'batch']:
+        raise ValueError("Unknown gridder %s" % gridder)
+    elif len(kernels) > 1:
         coords = kernel_indices, list(vfrequencymap), x, y, xf, yf
         for pol in range(npol):
             for v, vwt, kind, chan, xx, yy, xxf, yyf in zip(viswt[..., pol], wts[..., pol], *coords):
@@ -306,6 +714,26 @@ def convolutional_grid(kernel_list, uvgrid, vis, visweights, vuvwmap, vfrequency
     return uvgrid, sumwt
 
 
+def density_grid(shape, visweights, x, y, vfrequencymap):
+    """ Accumulate the weights on the cells (x, y)
+
+    :param shape: Shape of grid [nchan, npol, ny, nx]
+    :param visweights: Visibility weights
+    :param x: Integer grid coordinate per row
+    :param y: Integer grid coordinate per row
+    :param vfrequencymap: map frequency to image channels
+    :return: Density grid [nchan, npol, ny, nx]
+    """
+    inchan, inpol, ny, nx = shape
+    chans = numpy.array(vfrequencymap, dtype='int')
+    densitygrid = numpy.zeros(shape, dtype='float')
+    indices = (chans * ny + y) * nx + x
+    for pol in range(inpol):
+        densitygrid[:, pol, ...] += numpy.bincount(indices, visweights[:, pol],
+                                                   inchan * ny * nx).reshape([inchan, ny, nx])
+    return densitygrid
+
+
 def weight_gridding(shape, visweights, vuvwmap, vfrequencymap, vpolarisationmap=None, weighting='uniform'):
     """Reweight data using one of a number of algorithms
 
@@ -327,19 +755,16 @@ def weight_gridding(shape, visweights, vuvwmap, vfrequencymap, vpolarisationmap=
         for flip in [-1.0, 1.0]:
             y, yf = frac_coord(ny, 1.0, flip * vuvwmap[:, 1])
             x, xf = frac_coord(nx, 1.0, flip * vuvwmap[:, 0])
-            coords = list(vfrequencymap), x, y
-            for pol in range(inpol):
-                for vwt, chan, x, y in zip(wts, *coords):
-                    densitygrid[chan, pol, y, x] += vwt[..., pol]
+            densitygrid += density_grid(shape, wts, x, y, vfrequencymap)
                     
         # Find the total weight per sample counting redundancies with other samples
         newvisweights = numpy.zeros_like(visweights)
         density = numpy.zeros_like(visweights)
         y, _ = frac_coord(ny, 1.0, vuvwmap[:, 1])
         x, _ = frac_coord(nx, 1.0, vuvwmap[:, 0])
-        coords = list(vfrequencymap), x, y
+        chans = numpy.array(vfrequencymap, dtype='int')
         for pol in range(inpol):
-            density[..., pol] += [densitygrid[chan, pol, y, x] for chan, x, y in zip(*coords)]
+            density[..., pol] += densitygrid[chans, pol, y, x]
 
         # Normalise each visibility weight to sum to one in a grid cell
         if numpy.sum(density[:, 0] > 0.0) < visweights.shape[0]:
@@ -363,7 +788,6 @@ def weight_rank_filter(shape, visweights, vuvwmap, vfrequencymap, vpolarisationm
     :param weighting: '' | 'uniform'
     :return: visweights, density, densitygrid
     """
-    densitygrid = numpy.zeros(shape)
     density = numpy.zeros_like(visweights)
 
     inchan, inpol, ny, nx = shape
@@ -372,15 +796,13 @@ def weight_rank_filter(shape, visweights, vuvwmap, vfrequencymap, vpolarisationm
     y, yf = frac_coord(ny, 1.0, vuvwmap[:, 1])
     x, xf = frac_coord(nx, 1.0, vuvwmap[:, 0])
     wts = visweights[...]
-    coords = list(vfrequencymap), x, y
-    for pol in range(inpol):
-        for vwt, chan, x, y in zip(wts, *coords):
-            densitygrid[chan, pol, y, x] += vwt[..., pol]
+    newvisweights = numpy.zeros_like(visweights)
+    densitygrid = density_grid(shape, wts, x, y, vfrequencymap)
     
     # Normalise each visibility weight to sum to one in a grid cell
-    newvisweights = numpy.zeros_like(visweights)
+    chans = numpy.array(vfrequencymap, dtype='int')
     for pol in range(inpol):
-        density[..., pol] += [densitygrid[chan, pol, x, y] for chan, x, y in zip(*coords)]
+        density[..., pol] += densitygrid[chans, pol, x, y]
     newvisweights[density > 0.0] = visweights[density > 0.0] / density[density > 0.0]
     return newvisweights, density, densitygrid
 
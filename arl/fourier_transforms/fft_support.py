@@ -1,40 +1,319 @@
 """ FFT support functions
 
+The transforms :py:func:`fft` and :py:func:`ifft` can be done by one of several backends:
+
+ * numpy: numpy.fft (single threaded)
+ * scipy: scipy.fft, multi-threaded via workers
+ * pyfftw: FFTW via pyFFTW, with the plans cached per shape and dtype and optionally saved as wisdom
+
+The backend and number of threads are set by :py:func:`set_fft_backend`, defaulting to the environment variables
+ARL_FFT_BACKEND and ARL_FFT_THREADS (else numpy and 1 thread). All backends transform the last two axes, in one
+call for all the leading (e.g. channel and polarisation) axes.
+
+For even sized axes the fftshift/ifftshift about the transform are replaced by multiplying the input and output by
+a checkerboard of +1/-1, which avoids two copies of the full array. With overwrite=True the transform is done in the
+array given (for numpy >= 2.0, scipy and pyfftw), so that e.g. a padded grid needs no further full-size temporaries.
+numpy.fft before 2.0 has no out argument, so for those versions the numpy backend returns a new array even with
+overwrite=True, and makes two full-size temporaries as before. Use the scipy or pyfftw backend to save the memory.
+
+Single precision (complex64) transforms stay in single precision for the scipy and pyfftw backends. numpy.fft before
+2.0 always computes in double precision, so for those versions the numpy backend does single precision transforms
+with scipy.fft (if available) instead. Otherwise there would be no saving of memory or time.
 """
 
+import logging
+import os
+import pickle
+import threading
+
 import numpy
 
+log = logging.getLogger(__name__)
+
+_fft_backends = ['numpy', 'scipy', 'pyfftw']
+
+
+def _check_fft_backend(backend):
+    """ Check that backend is the name of an FFT backend. If not an exception ValueError is raised.
+
+    """
+    if backend not in _fft_backends:
+        raise ValueError("Unknown FFT backend %s: valid backends are %s" % (backend, ", ".join(_fft_backends)))
+    return backend
+
+
+_fft_backend = {'backend': _check_fft_backend(os.environ.get('ARL_FFT_BACKEND', 'numpy')),
+                'nthreads': int(os.environ.get('ARL_FFT_THREADS', 1))}
+
+# pyFFTW plans and the checkerboards, keyed by shape and dtype
+_fftw_plans = {}
+_checkerboards = {}
+_lock = threading.Lock()
+
+# numpy.fft has an out argument (and so can transform in place) and keeps single precision from numpy 2.0
+_numpy_fft_out = numpy.lib.NumpyVersion(numpy.__version__) >= '2.0.0'
+
+
+def _import_scipy_fft():
+    """ Import scipy.fft. If it is not available (scipy < 1.4) an exception ModuleNotFoundError is raised.
+
+    """
+    try:
+        import scipy.fft
+    except ImportError:
+        raise ModuleNotFoundError("scipy.fft is not available (requires scipy >= 1.4)")
+    return scipy.fft
+
+
+def _import_pyfftw():
+    """ Import pyfftw. If it is not installed an exception ModuleNotFoundError is raised.
+
+    """
+    try:
+        import pyfftw
+    except ImportError:
+        raise ModuleNotFoundError("pyfftw is not installed")
+    return pyfftw
+
+
+def set_fft_backend(backend='numpy', nthreads=1):
+    """ Set the backend used by fft and ifft
+
+    :param backend: 'numpy' | 'scipy' | 'pyfftw'
+    :param nthreads: Number of threads used by the scipy and pyfftw backends
+    """
+    _check_fft_backend(backend)
+    if backend == 'scipy':
+        _import_scipy_fft()
+    elif backend == 'pyfftw':
+        _import_pyfftw()
+    _fft_backend['backend'] = backend
+    _fft_backend['nthreads'] = nthreads
+
+
+def get_fft_backend():
+    """ Get the backend used by fft and ifft
+
+    :return: backend name, number of threads
+    """
+    return _fft_backend['backend'], _fft_backend['nthreads']
+
+
+def export_fft_wisdom(filename):
+    """ Save the FFTW wisdom accumulated by the pyfftw backend
+
+    :param filename: Name of file to write
+    """
+    pyfftw = _import_pyfftw()
+    with open(filename, 'wb') as f:
+        pickle.dump(pyfftw.export_wisdom(), f)
+
+
+def import_fft_wisdom(filename):
+    """ Load FFTW wisdom for the pyfftw backend, as saved by :py:func:`export_fft_wisdom`
+
+    Plans for shapes covered by the wisdom are then made without measurement.
+
+    :param filename: Name of file to read
+    """
+    pyfftw = _import_pyfftw()
+    with open(filename, 'rb') as f:
+        pyfftw.import_wisdom(pickle.load(f))
+
+
+def clear_fft_plans():
+    """ Discard the cached pyFFTW plans and checkerboards
+
+    """
+    with _lock:
+        _fftw_plans.clear()
+        _checkerboards.clear()
+
+
+def _fft2_numpy(a, inverse, nthreads):
+    transform = numpy.fft.ifft2 if inverse else numpy.fft.fft2
+    if _numpy_fft_out:
+        return transform(a, axes=(-2, -1), out=a)
+    if a.dtype == numpy.complex64:
+        # numpy.fft would transform a copy in double precision
+        try:
+            return _fft2_scipy(a, inverse, 1)
+        except ModuleNotFoundError:
+            pass
+    return transform(a, axes=(-2, -1))
+
+
+def _fft2_scipy(a, inverse, nthreads):
+    scipy_fft = _import_scipy_fft()
+    transform = scipy_fft.ifft2 if inverse else scipy_fft.fft2
+    return transform(a, axes=(-2, -1), workers=nthreads, overwrite_x=True)
+
+
+def _fft2_pyfftw(a, inverse, nthreads):
+    key = (inverse, a.shape, a.dtype.str, nthreads)
+    with _lock:
+        if key not in _fftw_plans:
+            pyfftw = _import_pyfftw()
+            # Plan an in-place transform, usable on any array of this shape and dtype
+            buffer = pyfftw.empty_aligned(a.shape, dtype=a.dtype)
+            direction = 'FFTW_BACKWARD' if inverse else 'FFTW_FORWARD'
+            _fftw_plans[key] = (pyfftw.FFTW(buffer, buffer, axes=(-2, -1), direction=direction, threads=nthreads,
+                                            flags=('FFTW_MEASURE', 'FFTW_UNALIGNED')), threading.Lock())
+        plan, planlock = _fftw_plans[key]
+    with planlock:
+        plan(a, a)
+    return a
+
+
+_fft2 = {'numpy': _fft2_numpy, 'scipy': _fft2_scipy, 'pyfftw': _fft2_pyfftw}
 
-def fft(a):
+
+def _real_fft2_numpy(a, shape, inverse, nthreads):
+    if inverse:
+        return numpy.fft.irfft2(a, s=shape, axes=(-2, -1))
+    else:
+        return numpy.fft.rfft2(a, axes=(-2, -1))
+
+
+def _real_fft2_scipy(a, shape, inverse, nthreads):
+    scipy_fft = _import_scipy_fft()
+    if inverse:
+        return scipy_fft.irfft2(a, s=shape, axes=(-2, -1), workers=nthreads)
+    else:
+        return scipy_fft.rfft2(a, axes=(-2, -1), workers=nthreads)
+
+
+def _real_fft2_pyfftw(a, shape, inverse, nthreads):
+    key = ('real', inverse, a.shape, a.dtype.str, shape, nthreads)
+    with _lock:
+        if key not in _fftw_plans:
+            pyfftw = _import_pyfftw()
+            template = pyfftw.empty_aligned(a.shape, dtype=a.dtype)
+            if inverse:
+                plan = pyfftw.builders.irfft2(template, s=shape, axes=(-2, -1), threads=nthreads,
+                                              planner_effort='FFTW_MEASURE')
+            else:
+                plan = pyfftw.builders.rfft2(template, axes=(-2, -1), threads=nthreads, planner_effort='FFTW_MEASURE')
+            _fftw_plans[key] = (plan, threading.Lock())
+        plan, planlock = _fftw_plans[key]
+    # The plan writes into its own output array so this must be copied before the plan is used again
+    with planlock:
+        return plan(a).copy()
+
+
+_real_fft2 = {'numpy': _real_fft2_numpy, 'scipy': _real_fft2_scipy, 'pyfftw': _real_fft2_pyfftw}
+
+
+def rfft2(a):
+    """ Real to complex FFT of the last two axes, using the current backend
+
+    Unlike :py:func:`fft` this is not centred: there are no shifts.
+
+    :param a: Real array
+    :return: Complex array, with last axis of length nx // 2 + 1
+    """
+    backend, nthreads = get_fft_backend()
+    return _real_fft2[backend](a, None, False, nthreads)
+
+
+def irfft2(a, shape):
+    """ Complex to real FFT of the last two axes, using the current backend: the inverse of :py:func:`rfft2`
+
+    :param a: Complex array, as from rfft2
+    :param shape: Shape (ny, nx) of the last two axes of the result
+    :return: Real array
+    """
+    backend, nthreads = get_fft_backend()
+    return _real_fft2[backend](a, tuple(shape), True, nthreads)
+
+
+def _checkerboard(shape, dtype):
+    """ Checkerboards of +1/-1 to premultiply the input and postmultiply the output of a centred transform
+
+    For even ny, nx, fftshift(fft2(ifftshift(a))) = cout * fft2(cin * a), and the same for ifft2.
+
+    :param shape: Shape of the last two axes
+    :param dtype: Real dtype of the checkerboards
+    :return: cin, cout
+    """
+    key = (shape, dtype.str)
+    with _lock:
+        if key not in _checkerboards:
+            ny, nx = shape
+            cin = (1 - 2 * ((numpy.arange(ny)[:, numpy.newaxis] + numpy.arange(nx)[numpy.newaxis, :]) % 2)).astype(dtype)
+            sign = 1 - 2 * ((ny // 2 + nx // 2) % 2)
+            _checkerboards[key] = (cin, sign * cin)
+        return _checkerboards[key]
+
+
+def _centred_fft2(a, inverse, overwrite=False):
+    """ Centred FFT of the last two axes of a using the current backend
+
+    The backends transform in place where they can, so the array passed to them is always a workspace: either a
+    itself (if overwrite) or the one temporary made from it.
+    """
+    backend, nthreads = get_fft_backend()
+    dtype = fft_dtype(a)
+    ny, nx = a.shape[-2:]
+    if ny % 2 == 0 and nx % 2 == 0:
+        cin, cout = _checkerboard((ny, nx), numpy.finfo(dtype).dtype)
+        if overwrite and a.dtype == dtype:
+            a *= cin
+            work = a
+        else:
+            work = numpy.multiply(a, cin, dtype=dtype)
+        result = _fft2[backend](work, inverse, nthreads)
+        result *= cout
+    else:
+        work = numpy.fft.ifftshift(a, axes=(-2, -1)).astype(dtype, copy=False)
+        result = numpy.fft.fftshift(_fft2[backend](work, inverse, nthreads), axes=(-2, -1))
+    return result.astype(dtype, copy=False)
+
+
+def fft(a, overwrite=False):
     """ Fourier transformation from image to grid space
     
     .. note::
     
-        If there are four axes then the last outer axes are not transformed
+        If there are more than two axes then the outer axes are not transformed
+
+        Single precision input (complex64 or float32) gives a complex64 result
 
     :param a: image in `lm` coordinate space
+    :param overwrite: a may be overwritten, and the result returned in it (if a has the dtype of the result, and
+        not for the numpy backend with numpy < 2.0)
     :return: `uv` grid
     """
-    if (len(a.shape) == 4):
-        return numpy.fft.fftshift(numpy.fft.fft2(numpy.fft.ifftshift(a, axes=[2, 3])), axes=[2, 3])
-    else:
-        return numpy.fft.fftshift(numpy.fft.fft2(numpy.fft.ifftshift(a)))
+    return _centred_fft2(a, inverse=False, overwrite=overwrite)
 
 
-def ifft(a):
+def ifft(a, overwrite=False):
     """ Fourier transformation from grid to image space
 
     .. note::
     
-        If there are four axes then the last outer axes are not transformed
+        If there are more than two axes then the outer axes are not transformed
+
+        Single precision input (complex64 or float32) gives a complex64 result
 
     :param a: `uv` grid to transform
+    :param overwrite: a may be overwritten, and the result returned in it (if a has the dtype of the result, and
+        not for the numpy backend with numpy < 2.0)
     :return: an image in `lm` coordinate space
     """
-    if (len(a.shape) == 4):
-        return numpy.fft.fftshift(numpy.fft.ifft2(numpy.fft.ifftshift(a, axes=[2, 3])), axes=[2, 3])
+    return _centred_fft2(a, inverse=True, overwrite=overwrite)
+
+
+def fft_dtype(a):
+    """ Complex type of the transform of a: complex64 for single precision input, complex otherwise
+
+    :param a: array to be transformed
+    :return: numpy dtype
+    """
+    if a.dtype in [numpy.complex64, numpy.float32]:
+        return numpy.dtype('complex64')
     else:
-        return numpy.fft.fftshift(numpy.fft.ifft2(numpy.fft.ifftshift(a)))
+        return numpy.dtype('complex')
 
 
 def pad_mid(ff, npixel):
@@ -70,6 +349,36 @@ def pad_mid(ff, npixel):
                      constant_values=0.0)
 
 
+def insert_mid(a, ff, weight=None):
+    """
+    Insert a far field image into the middle of a larger array, optionally multiplying by a weight
+
+    This is the in-place equivalent of a[...] = pad_mid(ff, npixel) * weight: only the middle of a is
+    written, and no padded temporaries are made.
+
+    .. note::
+    
+        Only the two innermost axes are padded
+
+        The rest of a is not changed, so it should usually be zero
+
+    :param a: The array to insert into, of size npixel x npixel in the inner axes
+    :param ff: The far field image to insert
+    :param weight: Array of the shape of a (in the inner axes) by which to multiply ff (optional)
+    :return: a
+    """
+    ny, nx = ff.shape[-2:]
+    npixel = a.shape[-1]
+    sy = npixel // 2 - ny // 2
+    sx = npixel // 2 - nx // 2
+    mid = a[..., sy:sy + ny, sx:sx + nx]
+    if weight is None:
+        mid[...] = ff
+    else:
+        numpy.multiply(ff, weight[..., sy:sy + ny, sx:sx + nx], out=mid)
+    return a
+
+
 def extract_mid(a, npixel):
     """
     Extract a section from middle of a map
@@ -0,0 +1,267 @@
+""" Process-wide cache of gridding kernels
+
+Kernel generation (e.g. of the w projection kernels in :py:func:`arl.imaging.params.w_kernel_list`) is
+a deterministic function of a few parameters but is costly. In a major cycle loop the same kernels are
+requested again and again for the same geometry. The cache holds the kernels in memory, evicting the
+least recently used when the total size exceeds a limit in bytes.
+
+For example::
+
+    kernel = get_kernel_cache().get(key, lambda: expensive_kernel(...))
+    log.info(kernel_cache_statistics())
+
+The cached arrays are made read-only since they are shared between callers.
+
+Optionally the arrays are also stored on disk, in the directory given by the environment variable
+ARL_KERNEL_CACHE (or set by :py:func:`set_kernel_cache_directory`). Each array is held in a .npy file named by
+a hash of its key and is memory-mapped read-only when loaded. Processes (e.g. dask workers) sharing
+the directory then calculate each kernel only once and share the pages in memory. The file names are salted
+with KERNEL_CACHE_VERSION, which must be increased whenever the kernel generation changes, so that stale
+kernels are never loaded. The total size of the files is bounded by maxdiskbytes, the least recently used
+files being removed first.
+"""
+
+import collections
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+import numpy
+
+log = logging.getLogger(__name__)
+
+KERNEL_CACHE_VERSION = 1
+
+
+class KernelCache:
+    """ Least recently used cache of numpy arrays, bounded by the total number of bytes
+
+    """
+
+    def __init__(self, maxbytes=512 * 1024 * 1024, directory=None, maxdiskbytes=None):
+        """ Create an empty cache
+
+        :param maxbytes: Maximum total size of the cached arrays (bytes)
+        :param directory: Directory for the on-disk cache (None for memory only)
+        :param maxdiskbytes: Maximum total size of the files in directory (bytes, default maxbytes)
+        """
+        self.maxbytes = maxbytes
+        self.maxdiskbytes = maxdiskbytes
+        self.directory = None
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        self.disk_writes = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.set_directory(directory)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, generate):
+        """ Get the array for key, calling generate() to calculate it if it is not cached
+
+        :param key: Hashable key, which must capture all parameters of the generation
+        :param generate: Function with no arguments returning the numpy.ndarray for key
+        :return: numpy.ndarray (read-only)
+        """
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+
+        value = None
+        if self.directory is not None:
+            value = self._load(key)
+        if value is None:
+            value = numpy.asarray(generate())
+            if self.directory is not None and value.nbytes <= self._maxdiskbytes():
+                value = self._store(key, value)
+        value.flags.writeable = False
+        self.put(key, value)
+        return value
+
+    def set_directory(self, directory):
+        """ Set the directory of the on-disk cache, creating it if necessary
+
+        :param directory: Directory name (None for memory only)
+        """
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    def _path(self, key):
+        # Content addressed: the name is a hash of the version and the key
+        name = hashlib.sha256(repr((KERNEL_CACHE_VERSION, key)).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + '.npy')
+
+    def _load(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            value = numpy.load(path, mmap_mode='r')
+        except (OSError, ValueError) as err:
+            log.warning("KernelCache: cannot load %s: %s" % (path, err))
+            return None
+        try:
+            # Mark as recently used for the eviction of files
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.disk_hits += 1
+        return value
+
+    def _store(self, key, value):
+        # Write to a temporary file and rename so that other processes never see a partial file
+        path = self._path(key)
+        try:
+            fd, tmppath = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+            with os.fdopen(fd, 'wb') as f:
+                numpy.save(f, value)
+            os.replace(tmppath, path)
+            value = numpy.load(path, mmap_mode='r')
+        except OSError as err:
+            log.warning("KernelCache: cannot store %s: %s" % (path, err))
+            return value
+        with self._lock:
+            self.disk_writes += 1
+        self._evict_disk()
+        return value
+
+    def _maxdiskbytes(self):
+        return self.maxbytes if self.maxdiskbytes is None else self.maxdiskbytes
+
+    def _evict_disk(self):
+        # Remove the least recently used files until the directory is within maxdiskbytes. Other processes may
+        # be removing the same files, and memory-mapped arrays remain valid after their file is removed.
+        files = list()
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npy'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+        diskbytes = sum(f[1] for f in files)
+        for _, size, path in files:
+            if diskbytes <= self._maxdiskbytes():
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            diskbytes -= size
+
+    def put(self, key, value):
+        """ Add an array to the cache, evicting the least recently used arrays as needed
+
+        Arrays larger than maxbytes are not cached.
+
+        :param key: Hashable key
+        :param value: numpy.ndarray
+        """
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key).nbytes
+            if value.nbytes > self.maxbytes:
+                return
+            self._entries[key] = value
+            self.nbytes += value.nbytes
+            self._evict()
+
+    def resize(self, maxbytes):
+        """ Change the maximum size, evicting the least recently used arrays as needed
+
+        :param maxbytes: Maximum total size of the cached arrays (bytes)
+        """
+        with self._lock:
+            self.maxbytes = maxbytes
+            self._evict()
+
+    def _evict(self):
+        while self.nbytes > self.maxbytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        """ Remove all arrays and reset the statistics
+
+        """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.disk_hits = 0
+            self.disk_writes = 0
+
+    def statistics(self):
+        """ Statistics of use of the cache
+
+        :return: dict with hits, misses, evictions, disk_hits, disk_writes, entries, nbytes, maxbytes
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'disk_hits': self.disk_hits, 'disk_writes': self.disk_writes,
+                    'entries': len(self._entries), 'nbytes': self.nbytes, 'maxbytes': self.maxbytes}
+
+
+_kernel_cache = KernelCache(directory=os.environ.get('ARL_KERNEL_CACHE'))
+
+
+def get_kernel_cache() -> KernelCache:
+    """ Get the process-wide kernel cache
+
+    :return: KernelCache
+    """
+    return _kernel_cache
+
+
+def set_kernel_cache_size(maxbytes):
+    """ Set the maximum size of the process-wide kernel cache, evicting arrays if necessary
+
+    :param maxbytes: Maximum total size of the cached arrays (bytes)
+    """
+    _kernel_cache.resize(maxbytes)
+
+
+def set_kernel_cache_directory(directory):
+    """ Set the directory of the on-disk store of the process-wide kernel cache
+
+    The default is the value of the environment variable ARL_KERNEL_CACHE.
+
+    :param directory: Directory name (None for memory only)
+    """
+    _kernel_cache.set_directory(directory)
+
+
+def clear_kernel_cache():
+    """ Empty the process-wide kernel cache and reset its statistics
+
+    The on-disk store, if any, is not changed.
+
+    """
+    _kernel_cache.clear()
+
+
+def kernel_cache_statistics():
+    """ Statistics of the process-wide kernel cache
+
+    :return: dict with hits, misses, evictions, disk_hits, disk_writes, entries, nbytes, maxbytes
+    """
+    return _kernel_cache.statistics()
@@ -0,0 +1,77 @@
+""" Compiled gridding and degridding kernels using numba.
+
+These are drop-in replacements for the inner loops of
+:py:func:`arl.fourier_transforms.convolutional_gridding.convolutional_grid` and
+:py:func:`arl.fourier_transforms.convolutional_gridding.convolutional_degrid`. The results agree with the
+numpy versions to rounding error: the degridding sums are accumulated in a different order from numpy.sum.
+
+This module requires numba to be installed. It is only imported when gridder='numba' is requested.
+"""
+
+import numba
+
+
+@numba.jit(nopython=True, nogil=True)
+def numba_grid(uvgrid, sumwt, kernels, kernel_indices, viswt, wts, chans, x, y, xf, yf):
+    """ Grid weighted visibilities using a stack of oversampled kernels
+
+    :param uvgrid: Grid to add to [nchan, npol, ny, nx] (updated in place)
+    :param sumwt: Sum of weights [nchan, npol] (updated in place)
+    :param kernels: Kernels [nkernels, oversampling, oversampling, gh, gw]
+    :param kernel_indices: Kernel index per row
+    :param viswt: Weighted visibilities [nrows, npol]
+    :param wts: Weights [nrows, npol]
+    :param chans: Image channel per row
+    :param x: Lower left integer grid coordinate per row
+    :param y: Lower left integer grid coordinate per row
+    :param xf: Fractional (oversampled) coordinate per row
+    :param yf: Fractional (oversampled) coordinate per row
+    """
+    nrows, npol = viswt.shape
+    gh = kernels.shape[3]
+    gw = kernels.shape[4]
+    for pol in range(npol):
+        for row in range(nrows):
+            v = viswt[row, pol]
+            chan = chans[row]
+            kind = kernel_indices[row]
+            xx = x[row]
+            yy = y[row]
+            xxf = xf[row]
+            yyf = yf[row]
+            for iy in range(gh):
+                for ix in range(gw):
+                    uvgrid[chan, pol, yy + iy, xx + ix] += kernels[kind, yyf, xxf, iy, ix] * v
+            sumwt[chan, pol] += wts[row, pol]
+
+
+@numba.jit(nopython=True, nogil=True)
+def numba_degrid(vis, uvgrid, ckernels, kernel_indices, chans, x, y, xf, yf):
+    """ Degrid visibilities using a stack of conjugated oversampled kernels
+
+    :param vis: Visibilities [nrows, npol] (filled in place)
+    :param uvgrid: Grid to degrid from [nchan, npol, ny, nx]
+    :param ckernels: Conjugated kernels [nkernels, oversampling, oversampling, gh, gw]
+    :param kernel_indices: Kernel index per row
+    :param chans: Image channel per row
+    :param x: Lower left integer grid coordinate per row
+    :param y: Lower left integer grid coordinate per row
+    :param xf: Fractional (oversampled) coordinate per row
+    :param yf: Fractional (oversampled) coordinate per row
+    """
+    nrows, npol = vis.shape
+    gh = ckernels.shape[3]
+    gw = ckernels.shape[4]
+    for pol in range(npol):
+        for row in range(nrows):
+            chan = chans[row]
+            kind = kernel_indices[row]
+            xx = x[row]
+            yy = y[row]
+            xxf = xf[row]
+            yyf = yf[row]
+            v = 0.0j
+            for iy in range(gh):
+                for ix in range(gw):
+                    v += uvgrid[chan, pol, yy + iy, xx + ix] * ckernels[kind, yyf, xxf, iy, ix]
+            vis[row, pol] = v
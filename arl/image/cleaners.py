@@ -2,25 +2,55 @@
 
 """
 
-import numpy
+import hashlib
 import logging
 
+import numpy
+
+from arl.fourier_transforms.fft_support import rfft2, irfft2
+from arl.fourier_transforms.kernel_cache import KernelCache
+
 log = logging.getLogger(__name__)
 
+# The scale stacks of msclean and msmfsclean, and the arrays calculated from them and the PSF, are held in memory
+# only, in a cache of their own so that they do not evict the gridding kernels
+_scalestack_cache = KernelCache(maxbytes=256 * 1024 * 1024)
+
+
+def get_scalestack_cache() -> KernelCache:
+    """ Get the cache of the scale stacks and the PSF products of msclean and msmfsclean
 
-def hogbom(dirty, psf, window, gain, thresh, niter, fracthresh):
+    The cache is in memory only, and bounded to 256 MB by default (see KernelCache.resize).
+
+    :return: KernelCache
+    """
+    return _scalestack_cache
+
+
+def hogbom(dirty, psf, window, gain, thresh, niter, fracthresh, tilesize=64, loop='numpy'):
     """ Clean the point spread function from a dirty image
 
     See Hogbom CLEAN (1974A&AS...15..417H)
 
     This version operates on numpy arrays.
 
+    The absolute residual (multiplied by the window) is kept up to date in the region of each PSF subtraction,
+    If the PSF is small compared to the image (at most a quarter of its size on each axis, with the image at least
+    8 tiles across), the maximum of the absolute residual in each tile of tilesize x tilesize pixels is also kept.
+    Each peak search then scans only the tile maxima and the tiles holding the peak, rather than the whole image.
+    For larger PSFs each subtraction changes most of the tiles, so the whole image is searched. In both cases
+    the peak found is the same as that of a full search (the first maximum in raster order).
+
+    With loop='numba' the minor cycle is run in a compiled loop that keeps the maximum of each row instead.
+
     :param dirty: The dirty Image, i.e., the Image to be deconvolved
     :param psf: The point spread-function
     :param window: Regions where clean components are allowed. If True, entire dirty Image is allowed
     :param gain: The "loop gain", i.e., the fraction of the brightest pixel that is removed in each iteration
     :param thresh: Cleaning stops when the maximum of the absolute deviation of the residual is less than this value
     :param niter: Maximum number of components to make if the threshold `thresh` is not hit
+    :param tilesize: Size of the tiles over which the maxima are kept (64)
+    :param loop: Minor cycle loop 'numpy' | 'numba' ('numpy')
     :return: clean component Image, residual Image
     """
 
@@ -36,17 +66,46 @@ def hogbom(dirty, psf, window, gain, thresh, niter, fracthresh):
     pmax = psf.max()
     assert pmax > 0.0
     log.info("hogbom: Max abs in dirty Image = %.6f" % numpy.fabs(res).max())
+    
+    # The window is applied once, to the absolute residual that is searched
+    absres = numpy.fabs(res)
+    if window is not None:
+        absres *= window
+    
+    if loop == 'numba':
+        numba_cleaners = _import_numba_cleaners()
+        if window is None:
+            window = numpy.ones(dirty.shape)
+        i, mx, my = numba_cleaners.hogbom_loop(res, absres, comps, numpy.asarray(psf, dtype=res.dtype),
+                                               numpy.asarray(window, dtype=res.dtype), gain, pmax, absolutethresh,
+                                               niter)
+        log.info("hogbom: Stopped at iteration %d, peak %s at [%d, %d]" % (i, res[mx, my], mx, my))
+        log.info("hogbom: End of minor cycle")
+        return comps, res
+    
+    use_tiles = all(4 * p <= d and 8 * tilesize <= d for p, d in zip(psf.shape, dirty.shape))
+    if use_tiles:
+        tilemax = numpy.zeros([(dirty.shape[0] + tilesize - 1) // tilesize,
+                               (dirty.shape[1] + tilesize - 1) // tilesize])
+        update_tile_maxima(absres, tilemax, tilesize, (0, dirty.shape[0], 0, dirty.shape[1]))
+    
     for i in range(niter):
-        if window is not None:
-            mx, my = numpy.unravel_index((numpy.fabs(res * window)).argmax(), dirty.shape)
+        if use_tiles:
+            mx, my = find_tile_peak(absres, tilemax, tilesize)
         else:
-            mx, my = numpy.unravel_index((numpy.fabs(res)).argmax(), dirty.shape)
+            mx, my = argmax(absres)
         mval = res[mx, my] * gain / pmax
         comps[mx, my] += mval
         a1o, a2o = overlapIndices(dirty, psf, mx, my)
         if niter < 10 or i % (niter // 10) == 0:
             log.info("hogbom: Minor cycle %d, peak %s at [%d, %d]" % (i, res[mx, my], mx, my))
-        res[a1o[0]:a1o[1], a1o[2]:a1o[3]] -= psf[a2o[0]:a2o[1], a2o[2]:a2o[3]] * mval
+        region = (slice(a1o[0], a1o[1]), slice(a1o[2], a1o[3]))
+        res[region] -= psf[a2o[0]:a2o[1], a2o[2]:a2o[3]] * mval
+        numpy.fabs(res[region], out=absres[region])
+        if window is not None:
+            absres[region] *= window[region]
+        if use_tiles:
+            update_tile_maxima(absres, tilemax, tilesize, a1o)
         if numpy.abs(res[mx, my]) < absolutethresh:
             log.info("hogbom: Stopped at iteration %d, peak %s at [%d, %d]" % (i, res[mx, my], mx, my))
             break
@@ -55,6 +114,147 @@ def hogbom(dirty, psf, window, gain, thresh, niter, fracthresh):
     return comps, res
 
 
+def _import_numba_cleaners():
+    """ Import the compiled minor cycle loops. If numba is not installed an exception ModuleNotFoundError is raised.
+    
+    """
+    try:
+        from arl.image import numba_cleaners
+    except ModuleNotFoundError:
+        raise ModuleNotFoundError("numba is not installed")
+    return numba_cleaners
+
+
+def update_tile_maxima(absres, tilemax, tilesize, limits):
+    """ Recalculate the maxima of all tiles overlapping a region
+
+    :param absres: Absolute residual image
+    :param tilemax: Maxima of the tiles of absres, updated in place
+    :param tilesize: Size of the tiles (pixels)
+    :param limits: Region (lower0, upper0, lower1, upper1) that has changed
+    """
+    ty0, ty1 = limits[0] // tilesize, (limits[1] + tilesize - 1) // tilesize
+    tx0, tx1 = limits[2] // tilesize, (limits[3] + tilesize - 1) // tilesize
+    if ty1 <= ty0 or tx1 <= tx0:
+        return
+    block = absres[ty0 * tilesize:ty1 * tilesize, tx0 * tilesize:tx1 * tilesize]
+    starty = numpy.arange(0, block.shape[0], tilesize)
+    startx = numpy.arange(0, block.shape[1], tilesize)
+    tilemax[ty0:ty1, tx0:tx1] = numpy.maximum.reduceat(numpy.maximum.reduceat(block, starty, axis=0), startx, axis=1)
+
+
+def find_tile_peak(absres, tilemax, tilesize):
+    """ Find the location of the maximum of absres, given the maxima of its tiles
+
+    Ties are resolved as by argmax over the whole image, i.e. the first in raster order is returned.
+
+    :param absres: Absolute residual image
+    :param tilemax: Maxima of the tiles of absres
+    :param tilesize: Size of the tiles (pixels)
+    :return: x, y
+    """
+    peak = None
+    for tile in numpy.flatnonzero(tilemax == tilemax.max()):
+        ty, tx = divmod(tile, tilemax.shape[1])
+        y0, x0 = ty * tilesize, tx * tilesize
+        dy, dx = argmax(absres[y0:y0 + tilesize, x0:x0 + tilesize])
+        if peak is None or (y0 + dy, x0 + dx) < peak:
+            peak = (y0 + dy, x0 + dx)
+    return peak
+
+
+def clark(dirty, psf, window, gain, thresh, niter, fracthresh, psf_support=32):
+    """ Clean the point spread function from a dirty image using Clark's algorithm
+
+    See Clark CLEAN (1980A&A....89..377C)
+
+    This version operates on numpy arrays.
+
+    Each major cycle selects the pixels brighter than the largest PSF sidelobe outside a small patch of
+    half-width psf_support (times the peak residual). The minor cycle cleans only those pixels, subtracting the
+    PSF patch from the selected pixels. At the end of the minor cycle the components found are convolved with
+    the full PSF by FFT and subtracted from the residual image.
+
+    :param dirty: The dirty Image, i.e., the Image to be deconvolved
+    :param psf: The point spread-function
+    :param window: Regions where clean components are allowed. If True, entire dirty Image is allowed
+    :param gain: The "loop gain", i.e., the fraction of the brightest pixel that is removed in each iteration
+    :param thresh: Cleaning stops when the maximum of the absolute deviation of the residual is less than this value
+    :param niter: Maximum number of components to make if the threshold `thresh` is not hit
+    :param fracthresh: Fractional stopping threshold
+    :param psf_support: Half-width of the PSF patch used in the minor cycle (pixels)
+    :return: clean component Image, residual Image
+    """
+    assert 0.0 < gain < 2.0
+    assert niter > 0
+    log.info("clark: Max abs in dirty image = %.6f" % numpy.max(numpy.abs(dirty)))
+    absolutethresh = max(thresh, fracthresh * numpy.fabs(dirty).max())
+    log.info("clark: Start of minor cycle")
+    log.info("clark: This minor cycle will stop at %d iterations or peak < %s" % (niter, absolutethresh))
+    
+    comps = numpy.zeros(dirty.shape)
+    res = numpy.array(dirty)
+    pmax = psf.max()
+    assert pmax > 0.0
+    
+    # The PSF patch, centred on the peak at [support, support], and the largest sidelobe outside it
+    pcx, pcy = psf.shape[0] // 2, psf.shape[1] // 2
+    support = min(psf_support, pcx, pcy, psf.shape[0] - pcx - 1, psf.shape[1] - pcy - 1)
+    patch = psf[pcx - support:pcx + support + 1, pcy - support:pcy + support + 1]
+    outside = numpy.fabs(psf)
+    outside[pcx - support:pcx + support + 1, pcy - support:pcy + support + 1] = 0.0
+    sidelobe = outside.max() / pmax
+    log.info("clark: PSF patch half-width %d pixels, maximum sidelobe outside patch %.4f" % (support, sidelobe))
+    
+    # Transform of the PSF for the linear convolution of the components in each major cycle
+    nx, ny = dirty.shape
+    fshape = (nx + psf.shape[0], ny + psf.shape[1])
+    fpsf = numpy.fft.rfft2(psf, fshape)
+    
+    i = 0
+    cycle = 0
+    while i < niter:
+        absres = numpy.fabs(res)
+        if window is not None:
+            absres *= window
+        peak = absres.max()
+        if peak < absolutethresh:
+            break
+        minorthresh = max(absolutethresh, sidelobe * peak)
+        
+        # Minor cycle over the selected pixels only
+        cx, cy = numpy.nonzero(absres >= minorthresh)
+        cval = res[cx, cy]
+        cwin = numpy.ones_like(cval) if window is None else window[cx, cy]
+        delta = numpy.zeros(dirty.shape)
+        ncomps = 0
+        while i < niter:
+            k = numpy.fabs(cval * cwin).argmax()
+            if numpy.fabs(cval[k] * cwin[k]) < minorthresh:
+                break
+            mval = cval[k] * gain / pmax
+            delta[cx[k], cy[k]] += mval
+            dx = cx - cx[k]
+            dy = cy - cy[k]
+            near = (numpy.abs(dx) <= support) & (numpy.abs(dy) <= support)
+            cval[near] -= patch[support + dx[near], support + dy[near]] * mval
+            i += 1
+            ncomps += 1
+        if ncomps == 0:
+            break
+        
+        # Subtract the components convolved with the full PSF
+        conv = numpy.fft.irfft2(numpy.fft.rfft2(delta, fshape) * fpsf, fshape)
+        res -= conv[pcx:pcx + nx, pcy:pcy + ny]
+        comps += delta
+        log.info("clark: Major cycle %d, %d pixels above %.6f, %d components, total %d" %
+                 (cycle, len(cval), minorthresh, ncomps, i))
+        cycle += 1
+    
+    log.info("clark: End of minor cycle")
+    return comps, res
+
+
 def overlapIndices(res, psf, peakx, peaky):
     """ Find the indices where two arrays overlap
 
@@ -127,20 +327,22 @@ def msclean(dirty, psf, window, gain, thresh, niter, scales, fracthresh):
     # cube holding the different scale images. convolvestack will take a 2D Image
     # and add a third dimension holding the scale-convolved versions.
 
+    # The scale stacks, the PSF convolved with them, and the coupling matrix are the same for every
+    # major cycle, so they are kept in the scale stack cache (keyed by the PSF contents and the scales)
     scaleshape = [len(scales), ldirty.shape[0], ldirty.shape[1]]
-    scalestack = create_scalestack(scaleshape, scales, norm=True)
+    scalestack = cached_scalestack(scaleshape, scales, norm=True)
 
     pscaleshape = [len(scales), lpsf.shape[0], lpsf.shape[1]]
-    pscalestack = create_scalestack(pscaleshape, scales, norm=True)
+    pscalestack = cached_scalestack(pscaleshape, scales, norm=True)
 
     res_scalestack = convolve_scalestack(scalestack, numpy.array(ldirty))
-    psf_scalescalestack = convolve_convolve_scalestack(pscalestack, numpy.array(lpsf))
+    psfkey = cache_key('msclean_psf_scalescalestack', lpsf, tuple(float(scale) for scale in scales))
+    psf_scalescalestack = _scalestack_cache.get(psfkey,
+                                                lambda: convolve_convolve_scalestack(pscalestack, numpy.array(lpsf)))
 
     # Evaluate the coupling matrix between the various scale sizes.
-    coupling_matrix = numpy.zeros([len(scales), len(scales)])
-    for iscale in numpy.arange(len(scales)):
-        for iscale1 in numpy.arange(len(scales)):
-            coupling_matrix[iscale, iscale1] = numpy.max(psf_scalescalestack[iscale, iscale1, :, :])
+    coupling_matrix = _scalestack_cache.get(('msclean_coupling_matrix',) + psfkey[1:],
+                                            lambda: numpy.max(psf_scalescalestack, axis=(2, 3)))
     log.info("msclean: Coupling matrix =\n %s" % coupling_matrix)
 
     # The window is scale dependent - we form it by smoothing and thresholding
@@ -208,16 +410,11 @@ def create_scalestack(scaleshape, scales, norm=True):
         halfscale = int(numpy.ceil(scales[iscale] / 2.0))
         if scales[iscale] > 0.0:
             rscale2 = 1.0 / (float(scales[iscale]) / 2.0) ** 2
-            x = range(xcen - halfscale - 1, xcen + halfscale + 1)
-            fx = numpy.array(x, 'float') - float(xcen)
-            # Unroll this since spheroidal_function needs a scalar
-            for y in range(ycen - halfscale - 1, ycen + halfscale + 1):
-                for x in range(xcen - halfscale - 1, xcen + halfscale + 1):
-                    fx = float(x - xcen)
-                    fy = float(y - ycen)
-                    r2 = rscale2 * (fx * fx + fy * fy)
-                    r = numpy.sqrt(r2)
-                    basis[iscale, x, y] = spheroidal_function(r) * (1.0 - r ** 2)
+            fx = numpy.arange(-halfscale - 1, halfscale + 1, dtype='float')[:, numpy.newaxis]
+            fy = numpy.arange(-halfscale - 1, halfscale + 1, dtype='float')[numpy.newaxis, :]
+            r = numpy.sqrt(rscale2 * (fx * fx + fy * fy))
+            basis[iscale, xcen - halfscale - 1:xcen + halfscale + 1, ycen - halfscale - 1:ycen + halfscale + 1] = \
+                spheroidal_function(r) * (1.0 - r ** 2)
             basis[basis < 0.0] = 0.0
             if norm:
                 basis[iscale, :, :] /= numpy.sum(basis[iscale, :, :])
@@ -226,28 +423,74 @@ def create_scalestack(scaleshape, scales, norm=True):
     return basis
 
 
+def cache_key(name, a, *args):
+    """ Key for the scale stack cache of an array calculated from a and args
+
+    The key holds a hash of the contents of a, so e.g. the same PSF gives the same key in every major cycle.
+
+    :param name: Name of the calculation
+    :param a: numpy.ndarray
+    :param args: Further hashable parameters
+    :return: tuple
+    """
+    digest = hashlib.sha1(numpy.ascontiguousarray(a)).hexdigest()
+    return (name, a.shape, a.dtype.str, digest) + args
+
+
+def cached_scalestack(scaleshape, scales, norm=True):
+    """ Create a cube consisting of the scales, cached in the scale stack cache
+
+    See :py:func:`create_scalestack`. The stack is read-only.
+    """
+    scales = tuple(float(scale) for scale in scales)
+    return _scalestack_cache.get(('scalestack', tuple(scaleshape), scales, norm),
+                                 lambda: create_scalestack(scaleshape, scales, norm=norm))
+
+
+def scalestack_transform(scalestack):
+    """ Real FFT of each plane of the (shifted) scalestack, cached in the scale stack cache
+
+    :param scalestack: stack containing the scales
+    :return: complex stack [nscales, nx, ny // 2 + 1] (read-only)
+    """
+    return _scalestack_cache.get(cache_key('scalestack_rfft', scalestack),
+                                 lambda: rfft2(numpy.fft.fftshift(scalestack, axes=(1, 2))))
+
+
+def scalestack_symmetric(scalestack):
+    """ Are all the scales symmetric under reflection through the centre of the transform?
+
+    If so their transforms are real, and the twice convolved stack is symmetric in the two scale axes.
+
+    :param scalestack: stack containing the scales
+    :return: bool
+    """
+    shifted = numpy.fft.fftshift(scalestack, axes=(1, 2))
+    return numpy.array_equal(shifted, numpy.roll(shifted[:, ::-1, ::-1], 1, axis=(1, 2)))
+
+
 def convolve_scalestack(scalestack, img):
     """Convolve img by the specified scalestack, returning the resulting stack
 
+    The convolutions for all scales are done by one batch of real FFTs.
+
     :param scalestack: stack containing the scales
     :param img: Image to be convolved
     :return: stack
     """
 
-    convolved = numpy.zeros(scalestack.shape)
-    ximg = numpy.fft.fftshift(numpy.fft.fft2(numpy.fft.fftshift(img)))
-
-    nscales = scalestack.shape[0]
-    for iscale in range(nscales):
-        xscale = numpy.fft.fftshift(numpy.fft.fft2(numpy.fft.fftshift(scalestack[iscale, :, :])))
-        xmult = ximg * numpy.conjugate(xscale)
-        convolved[iscale, :, :] = numpy.real(numpy.fft.ifftshift(numpy.fft.ifft2(numpy.fft.ifftshift(xmult))))
-    return convolved
+    ximg = rfft2(numpy.fft.fftshift(img))
+    xscale = scalestack_transform(scalestack)
+    convolved = irfft2(ximg[numpy.newaxis, ...] * numpy.conjugate(xscale), img.shape)
+    return numpy.fft.ifftshift(convolved, axes=(1, 2))
 
 
 def convolve_convolve_scalestack(scalestack, img):
     """Convolve img by the specified scalestack, returning the resulting stack
 
+    The convolutions are done by real FFTs, batched over the second scale axis. For symmetric scales (the usual
+    case) only the pairs p >= s are calculated, since the result is then symmetric in s and p.
+
     :param scalestack: stack containing the scales
     :param img: Image to be convolved
     :return: Twice convolved image [nscales, nscales, nx, ny]
@@ -256,17 +499,16 @@ def convolve_convolve_scalestack(scalestack, img):
     nscales, nx, ny = scalestack.shape
     convolved_shape = [nscales, nscales, nx, ny]
     convolved = numpy.zeros(convolved_shape)
-    ximg = numpy.fft.fftshift(numpy.fft.fft2(numpy.fft.fftshift(img)))
+    ximg = rfft2(numpy.fft.fftshift(img))
+    xscale = scalestack_transform(scalestack)
+    symmetric = scalestack_symmetric(scalestack)
 
-    xscaleshape = [nscales, nx, ny]
-    xscale = numpy.zeros(xscaleshape, dtype='complex')
     for s in range(nscales):
-        xscale[s] = numpy.fft.fftshift(numpy.fft.fft2(numpy.fft.fftshift(scalestack[s, ...])))
-
-    for s in range(nscales):
-        for p in range(nscales):
-            xmult = ximg * xscale[p] * numpy.conjugate(xscale[s])
-            convolved[s, p, ...] = numpy.real(numpy.fft.ifftshift(numpy.fft.ifft2(numpy.fft.ifftshift(xmult))))
+        pstart = s if symmetric else 0
+        xmult = ximg * xscale[pstart:] * numpy.conjugate(xscale[s])
+        convolved[s, pstart:, ...] = numpy.fft.ifftshift(irfft2(xmult, img.shape), axes=(1, 2))
+        if symmetric:
+            convolved[s + 1:, s, ...] = convolved[s, s + 1:, ...]
     return convolved
 
 
@@ -310,6 +552,9 @@ def spheroidal_function(vnu):
 
     m=6, alpha = 1 from Schwab, Indirect Imaging (1984).
     This is one factor in the basis function.
+
+    :param vnu: Scalar or array of arguments
+    :return: Value(s), zero outside [0, 1]
     """
 
     # Code adapted Anna's f90 PROFILE (gridder.f90) code
@@ -318,63 +563,32 @@ def spheroidal_function(vnu):
     # out of the currect ASKAPsoft code... not sure why**
     #
     # Stole this back from Anna!
-    n_p = 4
-    n_q = 2
-
-    p = numpy.zeros((2, 5))
-    q = numpy.zeros((2, 3))
-
-    p[0, 0] = 8.203343e-2
-    p[0, 1] = -3.644705e-1
-    p[0, 2] = 6.278660e-1
-    p[0, 3] = -5.335581e-1
-    p[0, 4] = 2.312756e-1
-    p[1, 0] = 4.028559e-3
-    p[1, 1] = -3.697768e-2
-    p[1, 2] = 1.021332e-1
-    p[1, 3] = -1.201436e-1
-    p[1, 4] = 6.412774e-2
-
-    q[0, 0] = 1.0000000
-    q[0, 1] = 8.212018e-1
-    q[0, 2] = 2.078043e-1
-    q[1, 0] = 1.0000000
-    q[1, 1] = 9.599102e-1
-    q[1, 2] = 2.918724e-1
-
-    value = 0.
-
-    if (vnu >= 0.) and (vnu < 0.75):
-        part = 0
-        nuend = 0.75
-    elif (vnu >= 0.75) and (vnu <= 1.):
-        part = 1
-        nuend = 1.0
-    else:
-        value = 0.
-        # nasty fortran-esque exit statement:
-        return value
-
-    top = p[part, 0]
-    bot = q[part, 0]
+    p = numpy.array([[8.203343e-2, -3.644705e-1, 6.278660e-1, -5.335581e-1, 2.312756e-1],
+                     [4.028559e-3, -3.697768e-2, 1.021332e-1, -1.201436e-1, 6.412774e-2]])
+    q = numpy.array([[1.0000000, 8.212018e-1, 2.078043e-1],
+                     [1.0000000, 9.599102e-1, 2.918724e-1]])
+
+    vnu = numpy.asarray(vnu, dtype='float')
+    
+    # Part 0 for 0 <= vnu < 0.75, part 1 for 0.75 <= vnu <= 1
+    part = numpy.where(vnu < 0.75, 0, 1)
+    nuend = numpy.where(vnu < 0.75, 0.75, 1.0)
     delnusq = vnu ** 2 - nuend ** 2
 
-    for k in range(1, n_p + 1):
-        factor = delnusq ** k
-        top += p[part, k] * factor
-
-    for k in range(1, n_q + 1):
-        factor = delnusq ** k
-        bot += q[part, k] * factor
+    top = p[part, 0]
+    for k in range(1, p.shape[1]):
+        top = top + p[part, k] * delnusq ** k
 
-    if bot != 0.:
-        value = top / bot
-    else:
-        value = 0.
+    bot = q[part, 0]
+    for k in range(1, q.shape[1]):
+        bot = bot + q[part, k] * delnusq ** k
 
-    if value < 0.:
-        value = 0.
+    value = numpy.zeros_like(vnu)
+    numpy.divide(top, bot, out=value, where=(bot != 0.0))
+    value[(vnu < 0.0) | (vnu > 1.0) | (value < 0.0)] = 0.0
 
+    if value.ndim == 0:
+        return float(value)
     return value
 
 
@@ -426,10 +640,10 @@ def msmfsclean(dirty, psf, window, gain, thresh, niter, scales, fracthresh, find
 
     # Create the "scale basis functions" in Algorithm 1
     scaleshape = [nscales, ldirty.shape[1], ldirty.shape[2]]
-    scalestack = create_scalestack(scaleshape, scales, norm=True)
+    scalestack = cached_scalestack(scaleshape, scales, norm=True)
 
     pscaleshape = [nscales, lpsf.shape[1], lpsf.shape[2]]
-    pscalestack = create_scalestack(pscaleshape, scales, norm=True)
+    pscalestack = cached_scalestack(pscaleshape, scales, norm=True)
 
     # Calculate scale convolutions of moment residuals
     smresidual = calculate_scale_moment_residual(ldirty, scalestack)
@@ -438,7 +652,8 @@ def msmfsclean(dirty, psf, window, gain, thresh, niter, scales, fracthresh, find
     # scale scale moment moment psf is needed for update of scale-moment residuals
     # Hessian is needed in calculation of optimum for any iteration
     # Inverse Hessian is needed to calculate principal solution in moment-space
-    ssmmpsf = calculate_scale_scale_moment_moment_psf(lpsf, pscalestack)
+    ssmmpsf = _scalestack_cache.get(cache_key('msmfsclean_ssmmpsf', lpsf, tuple(float(scale) for scale in scales)),
+                                    lambda: calculate_scale_scale_moment_moment_psf(lpsf, pscalestack))
     hsmmpsf, ihsmmpsf = calculate_scale_inverse_moment_moment_hessian(ssmmpsf)
 
     for scale in range(nscales):
@@ -4,6 +4,8 @@ The standard deconvolution algorithms are provided:
 
     hogbom: Hogbom CLEAN See: Hogbom CLEAN A&A Suppl, 15, 417, (1974)
     
+    clark: Clark CLEAN See: Clark, B.G., An efficient implementation of the algorithm 'CLEAN', A&A 89, 377 (1980)
+    
     msclean: MultiScale CLEAN See: Cornwell, T.J., Multiscale CLEAN (IEEE Journal of Selected Topics in Sig Proc,
     2008 vol. 2 pp. 793-801)
 
@@ -23,8 +25,12 @@ For example to make dirty image and PSF, deconvolve, and then restore::
 
 """
 
-import numpy
+import functools
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy
 
 from astropy.convolution import Gaussian2DKernel, convolve
 from photutils import fit_2dgaussian
@@ -34,7 +40,7 @@ from arl.data.parameters import get_parameter
 from arl.image.operations import create_image_from_array, copy_image, \
     calculate_image_frequency_moments, calculate_image_from_frequency_moments
 
-from arl.image.cleaners import hogbom, msclean, msmfsclean
+from arl.image.cleaners import hogbom, clark, msclean, msmfsclean
 
 log = logging.getLogger(__name__)
 
@@ -46,6 +52,8 @@ def deconvolve_cube(dirty: Image, psf: Image, **kwargs) -> (Image, Image):
     
     hogbom: Hogbom CLEAN See: Hogbom CLEAN A&A Suppl, 15, 417, (1974)
     
+    clark: Clark CLEAN See: Clark, B.G., An efficient implementation of the algorithm 'CLEAN', A&A 89, 377 (1980)
+    
     msclean: MultiScale CLEAN See: Cornwell, T.J., Multiscale CLEAN (IEEE Journal of Selected Topics in Sig Proc,
     2008 vol. 2 pp. 793-801)
 
@@ -63,13 +71,18 @@ def deconvolve_cube(dirty: Image, psf: Image, **kwargs) -> (Image, Image):
     :param dirty: Image dirty image
     :param psf: Image Point Spread Function
     :param window: Window image (Bool) - clean where True
-    :param algorithm: Cleaning algorithm: 'msclean'|'hogbom'|'mfsmsclean'
+    :param algorithm: Cleaning algorithm: 'msclean'|'hogbom'|'clark'|'mfsmsclean'
     :param gain: loop gain (float) 0.7
     :param threshold: Clean threshold (0.0)
     :param fractional_threshold: Fractional threshold (0.01)
     :param scales: Scales (in pixels) for multiscale ([0, 3, 10, 30])
     :param nmoments: Number of frequency moments (default 3)
     :param findpeak: Method of finding peak in mfsclean: 'Algorithm1'|'ASKAPSoft'|'CASA'|'ARL', Default is ARL.
+    :param hogbom_tilesize: Size of the tiles over which hogbom tracks the residual maxima (64)
+    :param hogbom_loop: Minor cycle loop for hogbom 'numpy'|'numba' (default 'numpy')
+    :param psf_support: Half-width of the PSF (pixels). For clark, that of the PSF patch in the minor cycle (32)
+    :param nworkers: Number of channel/polarisation planes to deconvolve concurrently (hogbom, clark, msclean) (1)
+    :param deconvolve_pool: Pool for nworkers > 1: 'thread'|'process' (default 'thread')
     :return: componentimage, residual
     
     """
@@ -86,16 +99,18 @@ def deconvolve_cube(dirty: Image, psf: Image, **kwargs) -> (Image, Image):
     else:
         window = None
     
+    algorithm = get_parameter(kwargs, 'algorithm', 'msclean')
+    nworkers = get_parameter(kwargs, 'nworkers', 1)
+    pool = get_parameter(kwargs, 'deconvolve_pool', 'thread')
+    
     psf_support = get_parameter(kwargs, 'psf_support', None)
-    if isinstance(psf_support, int):
+    if isinstance(psf_support, int) and algorithm != 'clark':
         if (psf_support < psf.shape[2] // 2) and ((psf_support < psf.shape[3] // 2)):
             centre = [psf.shape[2] // 2, psf.shape[3] // 2]
             psf.data = psf.data[..., (centre[0] - psf_support):(centre[0] + psf_support),
                                 (centre[1] - psf_support):(centre[1] + psf_support)]
             log.info('deconvolve_cube: PSF support = +/- %d pixels' % (psf_support))
     
-    algorithm = get_parameter(kwargs, 'algorithm', 'msclean')
-    
     if algorithm == 'msclean':
         log.info("deconvolve_cube: Multi-scale clean of each polarisation and channel separately")
         gain = get_parameter(kwargs, 'gain', 0.7)
@@ -108,23 +123,11 @@ def deconvolve_cube(dirty: Image, psf: Image, **kwargs) -> (Image, Image):
         fracthresh = get_parameter(kwargs, 'fractional_threshold', 0.01)
         assert 0.0 < fracthresh < 1.0
     
-        comp_array = numpy.zeros_like(dirty.data)
-        residual_array = numpy.zeros_like(dirty.data)
-        for channel in range(dirty.data.shape[0]):
-            for pol in range(dirty.data.shape[1]):
-                if psf.data[channel, pol, :, :].max():
-                    log.info("deconvolve_cube: Processing pol %d, channel %d" % (pol, channel))
-                    if window is None:
-                        comp_array[channel, pol, :, :], residual_array[channel, pol, :, :] = \
-                            msclean(dirty.data[channel, pol, :, :], psf.data[channel, pol, :, :],
-                                    None, gain, thresh, niter, scales, fracthresh)
-                    else:
-                        comp_array[channel, pol, :, :], residual_array[channel, pol, :, :] = \
-                            msclean(dirty.data[channel, pol, :, :], psf.data[channel, pol, :, :],
-                                    window[channel, pol, :, :], gain, thresh, niter, scales, fracthresh)
-                else:
-                    log.info("deconvolve_cube: Skipping pol %d, channel %d" % (pol, channel))
-                    
+        clean = functools.partial(msclean, gain=gain, thresh=thresh, niter=niter, scales=scales,
+                                  fracthresh=fracthresh)
+        comp_array, residual_array = deconvolve_planes(clean, dirty.data, psf.data, window, nworkers=nworkers,
+                                                       pool=pool)
+        
         comp_image = create_image_from_array(comp_array, dirty.wcs, dirty.polarisation_frame)
         residual_image = create_image_from_array(residual_array, dirty.wcs, dirty.polarisation_frame)
 
@@ -193,23 +196,33 @@ def deconvolve_cube(dirty: Image, psf: Image, **kwargs) -> (Image, Image):
         assert niter > 0
         fracthresh = get_parameter(kwargs, 'fractional_threshold', 0.1)
         assert 0.0 <= fracthresh < 1.0
+        tilesize = get_parameter(kwargs, 'hogbom_tilesize', 64)
+        loop = get_parameter(kwargs, 'hogbom_loop', 'numpy')
         
-        comp_array = numpy.zeros(dirty.data.shape)
-        residual_array = numpy.zeros(dirty.data.shape)
-        for channel in range(dirty.data.shape[0]):
-            for pol in range(dirty.data.shape[1]):
-                if psf.data[channel, pol, :, :].max():
-                    log.info("deconvolve_cube: Processing pol %d, channel %d" % (pol, channel))
-                    if window is None:
-                        comp_array[channel, pol, :, :], residual_array[channel, pol, :, :] = \
-                            hogbom(dirty.data[channel, pol, :, :], psf.data[channel, pol, :, :],
-                                   None, gain, thresh, niter, fracthresh)
-                    else:
-                        comp_array[channel, pol, :, :], residual_array[channel, pol, :, :] = \
-                            hogbom(dirty.data[channel, pol, :, :], psf.data[channel, pol, :, :],
-                                   window[channel, pol, :, :], gain, thresh, niter, fracthresh)
-                else:
-                    log.info("deconvolve_cube: Skipping pol %d, channel %d" % (pol, channel))
+        clean = functools.partial(hogbom, gain=gain, thresh=thresh, niter=niter, fracthresh=fracthresh,
+                                  tilesize=tilesize, loop=loop)
+        comp_array, residual_array = deconvolve_planes(clean, dirty.data, psf.data, window, nworkers=nworkers,
+                                                       pool=pool)
+        
+        comp_image = create_image_from_array(comp_array, dirty.wcs, dirty.polarisation_frame)
+        residual_image = create_image_from_array(residual_array, dirty.wcs, dirty.polarisation_frame)
+    elif algorithm == 'clark':
+        log.info("deconvolve_cube: Clark clean of each polarisation and channel separately")
+        gain = get_parameter(kwargs, 'gain', 0.7)
+        assert 0.0 < gain < 2.0, "Loop gain must be between 0 and 2"
+        thresh = get_parameter(kwargs, 'threshold', 0.0)
+        assert thresh >= 0.0
+        niter = get_parameter(kwargs, 'niter', 100)
+        assert niter > 0
+        fracthresh = get_parameter(kwargs, 'fractional_threshold', 0.1)
+        assert 0.0 <= fracthresh < 1.0
+        if psf_support is None:
+            psf_support = 32
+        
+        clean = functools.partial(clark, gain=gain, thresh=thresh, niter=niter, fracthresh=fracthresh,
+                                  psf_support=psf_support)
+        comp_array, residual_array = deconvolve_planes(clean, dirty.data, psf.data, window, nworkers=nworkers,
+                                                       pool=pool)
         
         comp_image = create_image_from_array(comp_array, dirty.wcs, dirty.polarisation_frame)
         residual_image = create_image_from_array(residual_array, dirty.wcs, dirty.polarisation_frame)
@@ -219,6 +232,112 @@ def deconvolve_cube(dirty: Image, psf: Image, **kwargs) -> (Image, Image):
     return comp_image, residual_image
 
 
+def deconvolve_planes(clean, dirty, psf, window=None, nworkers=1, pool='thread'):
+    """ Deconvolve each channel and polarisation plane separately, optionally several at once
+
+    The planes are independent so they may be deconvolved concurrently by a pool of nworkers threads or
+    processes. For processes, the input and output cubes are held in shared memory so that only the plane indices
+    are sent to the workers. This needs multiprocessing.shared_memory (python >= 3.8): without it threads are used
+    instead. The results are always placed by plane, so they do not depend on the order of
+    completion. Planes with a zero PSF are skipped.
+
+    :param clean: Function clean(dirty, psf, window) -> (comp, residual) of 2D numpy arrays (picklable for processes)
+    :param dirty: numpy array [nchan, npol, ny, nx]
+    :param psf: numpy array [nchan, npol, ny', nx']
+    :param window: numpy array [nchan, npol, ny, nx] or None
+    :param nworkers: Number of planes to deconvolve at once
+    :param pool: 'thread' | 'process' ('thread')
+    :return: comp_array, residual_array
+    """
+    comp_array = numpy.zeros(dirty.shape)
+    residual_array = numpy.zeros(dirty.shape)
+    
+    planes = []
+    for channel in range(dirty.shape[0]):
+        for pol in range(dirty.shape[1]):
+            if psf[channel, pol, :, :].max():
+                planes.append((channel, pol))
+            else:
+                log.info("deconvolve_cube: Skipping pol %d, channel %d" % (pol, channel))
+    
+    if pool == 'process' and nworkers > 1 and len(planes) > 1:
+        try:
+            from multiprocessing import shared_memory
+        except ImportError:
+            log.warning("deconvolve_planes: multiprocessing.shared_memory is not available, using threads")
+            pool = 'thread'
+    
+    if nworkers <= 1 or len(planes) <= 1:
+        for channel, pol in planes:
+            elapsed = _deconvolve_plane(clean, dirty, psf, window, comp_array, residual_array, channel, pol)
+            log.info("deconvolve_cube: Processed pol %d, channel %d in %.3f s" % (pol, channel, elapsed))
+    elif pool == 'thread':
+        with ThreadPoolExecutor(nworkers) as executor:
+            times = executor.map(lambda plane: _deconvolve_plane(clean, dirty, psf, window, comp_array,
+                                                                 residual_array, *plane), planes)
+            for (channel, pol), elapsed in zip(planes, times):
+                log.info("deconvolve_cube: Processed pol %d, channel %d in %.3f s" % (pol, channel, elapsed))
+    elif pool == 'process':
+        arrays = {'dirty': dirty, 'psf': psf, 'comp': comp_array, 'residual': residual_array}
+        if window is not None:
+            arrays['window'] = window
+        shms = {}
+        specs = {}
+        try:
+            for name, a in arrays.items():
+                shms[name] = shared_memory.SharedMemory(create=True, size=max(1, a.nbytes))
+                numpy.ndarray(a.shape, dtype=a.dtype, buffer=shms[name].buf)[...] = a
+                specs[name] = (shms[name].name, a.shape, a.dtype.str)
+            with ProcessPoolExecutor(nworkers) as executor:
+                futures = [executor.submit(_deconvolve_plane_shared, clean, specs, channel, pol)
+                           for channel, pol in planes]
+                for (channel, pol), future in zip(planes, futures):
+                    log.info("deconvolve_cube: Processed pol %d, channel %d in %.3f s" %
+                             (pol, channel, future.result()))
+            for name in ['comp', 'residual']:
+                arrays[name][...] = numpy.ndarray(specs[name][1], dtype=specs[name][2], buffer=shms[name].buf)
+        finally:
+            for shm in shms.values():
+                shm.close()
+                shm.unlink()
+    else:
+        raise ValueError("deconvolve_planes: Unknown pool %s" % pool)
+    
+    return comp_array, residual_array
+
+
+def _deconvolve_plane(clean, dirty, psf, window, comp_array, residual_array, channel, pol):
+    """ Deconvolve one plane, writing into comp_array and residual_array
+
+    :return: Elapsed time (s)
+    """
+    start = time.time()
+    comp_array[channel, pol, :, :], residual_array[channel, pol, :, :] = \
+        clean(dirty[channel, pol, :, :], psf[channel, pol, :, :],
+              None if window is None else window[channel, pol, :, :])
+    return time.time() - start
+
+
+def _deconvolve_plane_shared(clean, specs, channel, pol):
+    """ Deconvolve one plane of cubes held in shared memory (in a worker process)
+
+    :param specs: dict of name: (shared memory name, shape, dtype) for dirty, psf, comp, residual and window
+    :return: Elapsed time (s)
+    """
+    from multiprocessing import shared_memory
+    shms = {name: shared_memory.SharedMemory(name=spec[0]) for name, spec in specs.items()}
+    views = None
+    try:
+        views = {name: numpy.ndarray(spec[1], dtype=spec[2], buffer=shms[name].buf) for name, spec in specs.items()}
+        return _deconvolve_plane(clean, views['dirty'], views['psf'], views.get('window', None), views['comp'],
+                                 views['residual'], channel, pol)
+    finally:
+        # The views must be released before the shared memory is closed, also if clean raised
+        views = None
+        for shm in shms.values():
+            shm.close()
+
+
 def restore_cube(model: Image, psf: Image, residual=None, **kwargs) -> Image:
     """ Restore the model image to the residuals
 
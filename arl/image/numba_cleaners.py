@@ -0,0 +1,50 @@
+""" Compiled minor cycle loops using numba.
+
+These are drop-in replacements for the inner loops of the cleaners in :py:mod:`arl.image.cleaners`. The peak found
+in each iteration is the same as that of the numpy versions (the first maximum in raster order).
+
+This module requires numba to be installed. It is only imported when loop='numba' is requested.
+"""
+
+import numba
+import numpy
+
+
+@numba.jit(nopython=True, nogil=True)
+def _row_maxima(absres, rowmax, y0, y1):
+    for y in range(y0, y1):
+        rowmax[y] = absres[y, :].max()
+
+
+@numba.jit(nopython=True, nogil=True)
+def hogbom_loop(res, absres, comps, psf, window, gain, pmax, absolutethresh, niter):
+    """ Hogbom minor cycle, keeping the maximum of each row of absres
+
+    res, absres and comps are updated in place. absres must hold abs(res) * window on entry.
+
+    :return: number of the last iteration, location of the last peak
+    """
+    nx, ny = res.shape
+    psfwidthx, psfwidthy = psf.shape[0] // 2, psf.shape[1] // 2
+    rowmax = numpy.zeros(nx)
+    _row_maxima(absres, rowmax, 0, nx)
+    mx, my = 0, 0
+    i = 0
+    for i in range(niter):
+        mx = rowmax.argmax()
+        my = absres[mx, :].argmax()
+        mval = res[mx, my] * gain / pmax
+        comps[mx, my] += mval
+        # As overlapIndices
+        x0, x1 = max(0, mx - psfwidthx), min(nx, mx + psfwidthx)
+        y0, y1 = max(0, my - psfwidthy), min(ny, my + psfwidthy)
+        px0 = psfwidthx + x0 - mx
+        py0 = psfwidthy + y0 - my
+        for x in range(x0, x1):
+            for y in range(y0, y1):
+                res[x, y] -= psf[px0 + x - x0, py0 + y - y0] * mval
+                absres[x, y] = abs(res[x, y]) * window[x, y]
+        _row_maxima(absres, rowmax, x0, x1)
+        if abs(res[mx, my]) < absolutethresh:
+            break
+    return i, mx, my
@@ -15,7 +15,7 @@ The principal transitions between the data models are:
 
 """
 from arl.imaging.params import get_polarisation_map, get_rowmap, get_uvw_map, standard_kernel_list, \
-    w_kernel_list, get_kernel_list, advise_wide_field
+    w_kernel_list, w_kernel, get_kernel_list, advise_wide_field, ImagingPlan, get_imaging_plan
 from arl.imaging.base import predict_2d_base, predict_skycomponent_visibility, \
     predict_skycomponent_visibility, invert_2d_base, normalize_sumwt, shift_vis_to_image, \
     create_image_from_visibility, residual_image
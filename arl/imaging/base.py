@@ -21,12 +21,14 @@ extra phase term in the Fourier transform cannot be ignored.
 
 import collections
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Union
 
 import numpy
 from astropy import constants as constants
 from astropy import units as units
 from astropy import wcs
+from astropy.coordinates import SkyCoord
 from astropy.wcs.utils import pixel_to_skycoord
 
 from arl.data.data_models import Visibility, BlockVisibility, Image, Skycomponent, assert_same_chan_pol
@@ -34,9 +36,9 @@ from arl.data.parameters import get_parameter
 from arl.data.polarisation import convert_pol_frame, PolarisationFrame
 from arl.fourier_transforms.convolutional_gridding import convolutional_grid, \
     convolutional_degrid
-from arl.fourier_transforms.fft_support import fft, ifft, pad_mid, extract_mid
+from arl.fourier_transforms.fft_support import fft, ifft, insert_mid, extract_mid
 from arl.image.operations import create_image_from_array
-from arl.imaging.params import get_frequency_map, get_polarisation_map, get_uvw_map, get_kernel_list
+from arl.imaging.params import get_frequency_map, get_imaging_plan, get_tile_sort, get_grid_dtype
 from arl.util.coordinate_support import simulate_point, skycoord_to_lmn
 from arl.visibility.base import copy_visibility, phaserotate_visibility
 from arl.visibility.coalesce import coalesce_visibility, decoalesce_visibility
@@ -107,6 +109,10 @@ def predict_2d_base(vis: Union[BlockVisibility, Visibility], model: Image,
 
     :param vis: Visibility to be predicted
     :param model: model image
+    :param gridder: Degridding engine 'numpy' | 'numba' | 'batch' (default 'numpy')
+    :param gridder_chunksize: Number of rows per chunk for gridder='batch' (default: as many as fit in 64 MB)
+    :param precision: Precision of the uv grid, kernels and FFT 'double' | 'single' (default 'double')
+    :param imaging_plan: ImagingPlan to reuse for the maps and kernels (see arl.imaging.params.get_imaging_plan)
     :return: resulting visibility (in place works)
     """
     if isinstance(vis, BlockVisibility):
@@ -117,20 +123,22 @@ def predict_2d_base(vis: Union[BlockVisibility, Visibility], model: Image,
     
     assert isinstance(avis, Visibility), avis
     
-    _, _, ny, nx = model.data.shape
+    nchan, npol, ny, nx = model.data.shape
     
-    padding = {}
-    if get_parameter(kwargs, "padding", False):
-        padding = {'padding': get_parameter(kwargs, "padding", False)}
-    spectral_mode, vfrequencymap = get_frequency_map(avis, model)
-    polarisation_mode, vpolarisationmap = get_polarisation_map(avis, model)
-    uvw_mode, shape, padding, vuvwmap = get_uvw_map(avis, model, **padding)
-    kernel_name, gcf, vkernellist = get_kernel_list(avis, model, **kwargs)
+    plan = get_imaging_plan(avis, model, **kwargs)
     
-    uvgrid = fft((pad_mid(model.data, int(round(padding * nx))) * gcf).astype(dtype=complex))
+    # Allocate the padded grid once, insert the model multiplied by the gridding correction function,
+    # and transform in place (see arl.fourier_transforms.fft_support for when this is possible)
+    npixel = int(round(plan.padding * nx))
+    uvgrid = numpy.zeros([nchan, npol, npixel, npixel], dtype=get_grid_dtype(**kwargs))
+    uvgrid = fft(insert_mid(uvgrid, model.data, plan.gcf), overwrite=True)
     
-    avis.data['vis'] = convolutional_degrid(vkernellist, avis.data['vis'].shape, uvgrid,
-                                            vuvwmap, vfrequencymap, vpolarisationmap)
+    gridder = get_parameter(kwargs, "gridder", "numpy")
+    chunksize = get_parameter(kwargs, "gridder_chunksize", None)
+    avis.data['vis'] = convolutional_degrid(plan.kernel_list, avis.data['vis'].shape, uvgrid,
+                                            plan.vuvwmap, plan.vfrequencymap, plan.vpolarisationmap,
+                                            gridder=gridder, chunksize=chunksize,
+                                            coords=plan.grid_coordinates(uvgrid.shape))
     
     # Now we can shift the visibility from the image frame to the original visibility frame
     svis = shift_vis_to_image(avis, model, tangent=True, inverse=True)
@@ -166,6 +174,14 @@ def invert_2d_base(vis: Visibility, im: Image, dopsf: bool = False, normalize: b
     :param im: image template (not changed)
     :param dopsf: Make the psf instead of the dirty image
     :param normalize: Normalize by the sum of weights (True)
+    :param gridder: Gridding engine 'numpy' | 'numba' | 'tiled' (default 'numpy')
+    :param gridder_tilesize: Size of uv tiles for gridder='tiled' (default 64)
+    :param nthreads: Number of threads used for gridding (default 1)
+    :param gridder_shard: Division of gridding between threads 'rows' | 'tiles' (default 'rows'). Use 'tiles'
+        for large images since 'rows' needs a copy of the grid per thread
+    :param precision: Precision of the uv grid, kernels and FFT 'double' | 'single' (default 'double'). The
+        sum of weights is always double precision
+    :param imaging_plan: ImagingPlan to reuse for the maps and kernels (see arl.imaging.params.get_imaging_plan)
     :return: resulting image
 
     """
@@ -181,20 +197,32 @@ def invert_2d_base(vis: Visibility, im: Image, dopsf: bool = False, normalize: b
     
     nchan, npol, ny, nx = im.data.shape
     
-    padding = {}
-    if get_parameter(kwargs, "padding", False):
-        padding = {'padding': get_parameter(kwargs, "padding", False)}
-    spectral_mode, vfrequencymap = get_frequency_map(svis, im)
-    polarisation_mode, vpolarisationmap = get_polarisation_map(svis, im)
-    uvw_mode, shape, padding, vuvwmap = get_uvw_map(svis, im, **padding)
-    kernel_name, gcf, vkernellist = get_kernel_list(svis, im, **kwargs)
+    plan = get_imaging_plan(svis, im, **kwargs)
+    padding = plan.padding
+    gcf = plan.gcf
     
     # Optionally pad to control aliasing
-    imgridpad = numpy.zeros([nchan, npol, int(round(padding * ny)), int(round(padding * nx))], dtype='complex')
-    imgridpad, sumwt = convolutional_grid(vkernellist, imgridpad, svis.data['vis'],
+    imgridpad = numpy.zeros([nchan, npol, int(round(padding * ny)), int(round(padding * nx))],
+                            dtype=get_grid_dtype(**kwargs))
+    gridder = get_parameter(kwargs, "gridder", "numpy")
+    tilesize = get_parameter(kwargs, "gridder_tilesize", 64)
+    nthreads = get_parameter(kwargs, "nthreads", 1)
+    shard = get_parameter(kwargs, "gridder_shard", "rows")
+    sort = None
+    if gridder == 'tiled' or (nthreads > 1 and shard == 'tiles'):
+        if get_parameter(kwargs, "imaging_plan", None) is not None:
+            sort = get_tile_sort(plan, im, imgridpad.shape, plan.vuvwmap, plan.vfrequencymap, tilesize)
+        elif isinstance(vis, Visibility):
+            # The sort is cached on the original visibility since svis is a copy
+            sort = get_tile_sort(vis, im, imgridpad.shape, plan.vuvwmap, plan.vfrequencymap, tilesize)
+    imgridpad, sumwt = convolutional_grid(plan.kernel_list, imgridpad, svis.data['vis'],
                                           svis.data['imaging_weight'],
-                                          vuvwmap,
-                                          vfrequencymap, vpolarisationmap)
+                                          plan.vuvwmap,
+                                          plan.vfrequencymap, plan.vpolarisationmap, gridder=gridder, sort=sort,
+                                          tilesize=tilesize,
+                                          chunksize=get_parameter(kwargs, "gridder_chunksize", 10000),
+                                          nthreads=nthreads, shard=shard,
+                                          coords=plan.grid_coordinates(imgridpad.shape))
     
     # Fourier transform the padded grid to image, multiply by the gridding correction
     # function, and extract the unpadded inner part.
@@ -202,10 +230,14 @@ def invert_2d_base(vis: Visibility, im: Image, dopsf: bool = False, normalize: b
     # Normalise weights for consistency with transform
     sumwt /= float(padding * int(round(padding * nx)) * ny)
     
+    # Transform in place where possible and apply the gridding correction function only to the unpadded inner part
+    imgridpad = ifft(imgridpad, overwrite=True)
+    gcf = extract_mid(gcf, npixel=nx)
+    
     imaginary = get_parameter(kwargs, "imaginary", False)
     if imaginary:
         log.debug("invert_2d_base: retaining imaginary part of dirty image")
-        result = extract_mid(ifft(imgridpad) * gcf, npixel=nx)
+        result = extract_mid(imgridpad, npixel=nx) * gcf
         resultreal = create_image_from_array(result.real, im.wcs, im.polarisation_frame)
         resultimag = create_image_from_array(result.imag, im.wcs, im.polarisation_frame)
         if normalize:
@@ -213,7 +245,7 @@ def invert_2d_base(vis: Visibility, im: Image, dopsf: bool = False, normalize: b
             resultimag = normalize_sumwt(resultimag, sumwt)
         return resultreal, sumwt, resultimag
     else:
-        result = extract_mid(numpy.real(ifft(imgridpad)) * gcf, npixel=nx)
+        result = extract_mid(imgridpad, npixel=nx).real * gcf
         resultimage = create_image_from_array(result, im.wcs, im.polarisation_frame)
         if normalize:
             resultimage = normalize_sumwt(resultimage, sumwt)
@@ -240,51 +272,89 @@ def invert_2d(vis: Visibility, im: Image, dopsf=False, normalize=True, **kwargs)
 
 
 def predict_skycomponent_visibility(vis: Union[Visibility, BlockVisibility],
-                                    sc: Union[Skycomponent, List[Skycomponent]]) -> Visibility:
+                                    sc: Union[Skycomponent, List[Skycomponent]], **kwargs) -> Visibility:
     """Predict the visibility from a Skycomponent, add to existing visibility, for Visibility or BlockVisibility
 
+    All the components are predicted together by a direct Fourier transform. For each chunk of rows (or of times
+    for BlockVisibility) and of components, the phases are calculated as a (nrows, ncomp) matrix product of the uvw
+    and the direction cosines, and the phasors are then multiplied by the (ncomp, npol) fluxes for each channel.
+    The chunks hold at most dft_chunksize phases (or those of one time and one component for BlockVisibility),
+    so the memory used does not grow with the number of components. The chunks of rows can be shared between
+    threads.
+
     :param vis: Visibility or BlockVisibility
     :param sc: Skycomponent or list of SkyComponents
+    :param dft_chunksize: Maximum number of (row, component) phases in each chunk (1000000)
+    :param nthreads: Number of threads to use (1)
     :return: Visibility or BlockVisibility
     """
     if not isinstance(sc, collections.Iterable):
         sc = [sc]
-
-    if isinstance(vis, Visibility):
+    if len(sc) == 0:
+        return vis
+    
+    chunksize = get_parameter(kwargs, "dft_chunksize", 1000000)
+    nthreads = get_parameter(kwargs, "nthreads", 1)
     
+    # Direction cosines (ncomp, 3) and fluxes (ncomp, nchan, npol) of all components
+    for comp in sc:
+        assert_same_chan_pol(vis, comp)
+    l, m, _ = skycoord_to_lmn(SkyCoord([comp.direction for comp in sc]), vis.phasecentre)
+    lmn = numpy.stack([l, m, numpy.sqrt(1.0 - l ** 2 - m ** 2) - 1.0], axis=1)
+    flux = numpy.array([convert_pol_frame(comp.flux, comp.polarisation_frame, vis.polarisation_frame)
+                        if comp.polarisation_frame != vis.polarisation_frame else comp.flux
+                        for comp in sc]).astype('complex')
+    ncomp = len(sc)
+    
+    def chunks(nrows, rowsize):
+        """ Starts of the chunks of rows and the slices of components, for rows of rowsize phases each """
+        cchunk = max(1, min(ncomp, chunksize // rowsize))
+        rchunk = max(1, chunksize // (rowsize * cchunk))
+        return range(0, nrows, rchunk), rchunk, [slice(c, c + cchunk) for c in range(0, ncomp, cchunk)]
+    
+    if isinstance(vis, Visibility):
+        
         _, im_nchan = list(get_frequency_map(vis, None))
-        npol = vis.polarisation_frame.npol
+        im_nchan = numpy.array(im_nchan)
+        starts, rchunk, comps = chunks(vis.nvis, 1)
         
-        for comp in sc:
-            
-            assert_same_chan_pol(vis, comp)
-            
-            l, m, n = skycoord_to_lmn(comp.direction, vis.phasecentre)
-            phasor = simulate_point(vis.uvw, l, m)
-            for ivis in range(vis.nvis):
-                for pol in range(npol):
-                    vis.data['vis'][ivis, pol] += comp.flux[im_nchan[ivis], pol] * phasor[ivis]
-                
+        def predict_chunk(start):
+            rows = slice(start, min(start + rchunk, vis.nvis))
+            chans = im_nchan[rows]
+            for comp in comps:
+                # The uvw of a Visibility are in wavelengths
+                phasor = numpy.exp(-2j * numpy.pi * numpy.dot(vis.uvw[rows], lmn[comp].T))
+                for chan in numpy.unique(chans):
+                    selected = chans == chan
+                    vis.data['vis'][start + numpy.nonzero(selected)[0]] += numpy.dot(phasor[selected],
+                                                                                     flux[comp, chan, :])
+    
     elif isinstance(vis, BlockVisibility):
         
-        nchan = vis.nchan
-        npol = vis.npol
-    
         k = numpy.array(vis.frequency) / constants.c.to('m/s').value
+        ntimes = vis.vis.shape[0]
+        starts, tchunk, comps = chunks(ntimes, vis.nants * vis.nants)
+        
+        def predict_chunk(start):
+            times = slice(start, min(start + tchunk, ntimes))
+            for comp in comps:
+                # The uvw of a BlockVisibility are in metres
+                phase = -2.0 * numpy.pi * numpy.dot(vis.uvw[times], lmn[comp].T)
+                for chan in range(vis.nchan):
+                    phasor = numpy.exp(1j * k[chan] * phase)
+                    vis.data['vis'][times, ..., chan, :] += numpy.dot(phasor, flux[comp, chan, :])
     
-        for comp in sc:
-            assert_same_chan_pol(vis, comp)
+    else:
+        raise ValueError("vis is not a Visibility or a BlockVisibility: %r" % vis)
+    
+    if nthreads > 1:
+        # The chunks update disjoint rows so they may be done concurrently
+        with ThreadPoolExecutor(nthreads) as executor:
+            list(executor.map(predict_chunk, starts))
+    else:
+        for start in starts:
+            predict_chunk(start)
     
-            flux = comp.flux
-            if comp.polarisation_frame != vis.polarisation_frame:
-                flux = convert_pol_frame(flux, comp.polarisation_frame, vis.polarisation_frame)
-        
-            l, m, n = skycoord_to_lmn(comp.direction, vis.phasecentre)
-            for chan in range(nchan):
-                phasor = simulate_point(vis.uvw * k[chan], l, m)
-                for pol in range(npol):
-                    vis.data['vis'][..., chan, pol] += flux[chan, pol] * phasor[...]
-
     return vis
 
 
@@ -298,7 +368,7 @@ def predict_skycomponent_blockvisibility(vis: BlockVisibility,
     :return: BlockVisibility
     """
     log.warning("predict_skycomponent_blockvisibility: now deprecated, use predict_skycomponent_visibility")
-    return predict_skycomponent_visibility()
+    return predict_skycomponent_visibility(vis, sc)
 
 
 def predict_skycomponent_visibility_old(vis: Visibility, sc: Union[Skycomponent, List[Skycomponent]]) -> Visibility:
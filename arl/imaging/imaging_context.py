@@ -15,9 +15,10 @@ from arl.image.iterators import image_raster_iter, image_null_iter
 from arl.image.operations import create_empty_image_like
 from arl.imaging import normalize_sumwt
 from arl.imaging import predict_2d_base, invert_2d_base
+from arl.imaging.params import ImagingPlan
 from arl.imaging.timeslice import predict_timeslice_single, invert_timeslice_single
 from arl.imaging.wstack import predict_wstack_single, invert_wstack_single
-from arl.visibility.base import copy_visibility, create_visibility_from_rows
+from arl.visibility.base import copy_visibility, create_visibility_from_rows, create_visibility_view
 from arl.visibility.coalesce import coalesce_visibility
 from arl.visibility.iterators import vis_slice_iter, vis_timeslice_iter, vis_null_iter, \
     vis_wstack_iter
@@ -99,6 +100,8 @@ def invert_function(vis, im: Image, dopsf=False, normalize=True, context='2d', i
      * facets_wstack: facets AND wstacking
      * wprojection_wstack: wprojection and wstacking
 
+    The slices are passed to invert as views (see :py:func:`arl.visibility.base.create_visibility_view`)
+    so they are only copied by inverts that change the visibility.
 
     :param vis:
     :param im:
@@ -106,6 +109,7 @@ def invert_function(vis, im: Image, dopsf=False, normalize=True, context='2d', i
     :param normalize: Normalize by the sum of weights (True)
     :param context: Imaging context e.g. '2d', 'timeslice', etc.
     :param inner: Inner loop 'vis'|'image'
+    :param imaging_plans: dict of ImagingPlan by (slice, patch), filled and reused if given
     :param kwargs:
     :return: Image, sum of weights
     """
@@ -125,13 +129,14 @@ def invert_function(vis, im: Image, dopsf=False, normalize=True, context='2d', i
 
     if inner == 'image':
         totalwt = None
-        for rows in vis_iter(svis, **kwargs):
+        for ivis, rows in enumerate(vis_iter(svis, **kwargs)):
             if numpy.sum(rows):
-                visslice = create_visibility_from_rows(svis, rows)
+                visslice = create_visibility_view(svis, rows)
                 sumwt = 0.0
                 workimage = create_empty_image_like(im)
-                for dpatch in image_iter(workimage, **kwargs):
-                    result, sumwt = invert(visslice, dpatch, dopsf, normalize=False, **kwargs)
+                for ipatch, dpatch in enumerate(image_iter(workimage, **kwargs)):
+                    result, sumwt = invert(visslice, dpatch, dopsf, normalize=False,
+                                           **_plan_kwargs(kwargs, ivis, ipatch))
                     # Ensure that we fill in the elements of dpatch instead of creating a new numpy arrray
                     dpatch.data[...] = result.data[...]
                 # Assume that sumwt is the same for all patches
@@ -144,12 +149,13 @@ def invert_function(vis, im: Image, dopsf=False, normalize=True, context='2d', i
         # We assume that the weight is the same for all image iterations
         totalwt = None
         workimage = create_empty_image_like(im)
-        for dpatch in image_iter(workimage, **kwargs):
+        for ipatch, dpatch in enumerate(image_iter(workimage, **kwargs)):
             totalwt = None
-            for rows in vis_iter(svis, **kwargs):
+            for ivis, rows in enumerate(vis_iter(svis, **kwargs)):
                 if numpy.sum(rows):
-                    visslice = create_visibility_from_rows(svis, rows)
-                    result, sumwt = invert(visslice, dpatch, dopsf, normalize=False, **kwargs)
+                    visslice = create_visibility_view(svis, rows)
+                    result, sumwt = invert(visslice, dpatch, dopsf, normalize=False,
+                                           **_plan_kwargs(kwargs, ivis, ipatch))
                     # Ensure that we fill in the elements of dpatch instead of creating a new numpy arrray
                     dpatch.data[...] += result.data[...]
                     if totalwt is None:
@@ -166,6 +172,18 @@ def invert_function(vis, im: Image, dopsf=False, normalize=True, context='2d', i
     return resultimage, totalwt
 
 
+def _plan_kwargs(kwargs, ivis, ipatch):
+    """ Add the ImagingPlan for this visibility slice and image patch to kwargs
+
+    The plans are held in the dictionary imaging_plans, keyed by (slice, patch), so that a caller can
+    keep them from one call to the next.
+    """
+    plans = kwargs.get('imaging_plans', None)
+    if plans is None:
+        return kwargs
+    return dict(kwargs, imaging_plan=plans.setdefault((ivis, ipatch), ImagingPlan()))
+
+
 def predict_function(vis, model: Image, context='2d', inner=None, **kwargs) -> Visibility:
     """Predict visibilities using algorithm specified by context
     
@@ -183,6 +201,7 @@ def predict_function(vis, model: Image, context='2d', inner=None, **kwargs) -> V
     :param model: Model image, used to determine image characteristics
     :param context: Imaing context e.g. '2d', 'timeslice', etc.
     :param inner: Inner loop 'vis'|'image'
+    :param imaging_plans: dict of ImagingPlan by (slice, patch), filled and reused if given
     :param kwargs:
     :return:
 
@@ -203,23 +222,23 @@ def predict_function(vis, model: Image, context='2d', inner=None, **kwargs) -> V
     result = copy_visibility(vis, zero=True)
     
     if inner == 'image':
-        for rows in vis_iter(svis, **kwargs):
+        for ivis, rows in enumerate(vis_iter(svis, **kwargs)):
             if numpy.sum(rows):
                 visslice = create_visibility_from_rows(svis, rows)
                 visslice.data['vis'][...] = 0.0
                 # Iterate over images
-                for dpatch in image_iter(model, **kwargs):
+                for ipatch, dpatch in enumerate(image_iter(model, **kwargs)):
                     result.data['vis'][...] = 0.0
-                    result = predict(visslice, dpatch, **kwargs)
+                    result = predict(visslice, dpatch, **_plan_kwargs(kwargs, ivis, ipatch))
                     svis.data['vis'][rows] += result.data['vis']
     else:
         # Iterate over images
-        for dpatch in image_iter(model, **kwargs):
-            for rows in vis_iter(svis, **kwargs):
+        for ipatch, dpatch in enumerate(image_iter(model, **kwargs)):
+            for ivis, rows in enumerate(vis_iter(svis, **kwargs)):
                 if numpy.sum(rows):
                     visslice = create_visibility_from_rows(svis, rows)
                     result.data['vis'][...] = 0.0
-                    result = predict(visslice, dpatch, **kwargs)
+                    result = predict(visslice, dpatch, **_plan_kwargs(kwargs, ivis, ipatch))
                     svis.data['vis'][rows] += result.data['vis']
     
     return svis
@@ -2,6 +2,7 @@
 Functions that aid definition of fourier transform processing.
 """
 
+import hashlib
 import logging
 import warnings
 
@@ -13,8 +14,10 @@ import numpy
 from arl.data.data_models import Visibility, BlockVisibility, Image
 from arl.data.parameters import get_parameter
 from arl.data.polarisation import PolarisationFrame
-from arl.fourier_transforms.convolutional_gridding import anti_aliasing_calculate
-from arl.image.operations import create_w_term_like, copy_image, pad_image, fft_image, convert_image_to_kernel
+from arl.fourier_transforms.convolutional_gridding import anti_aliasing_calculate, tile_sort, w_beam, \
+    oversampled_kernel, grid_coordinates
+from arl.fourier_transforms.kernel_cache import get_kernel_cache
+from arl.image.operations import create_w_term_like, pad_image, fft_image, convert_image_to_kernel
 from arl.visibility.coalesce import convert_visibility_to_blockvisibility, convert_blockvisibility_to_visibility
 
 log = logging.getLogger(__name__)
@@ -114,19 +117,167 @@ def get_uvw_map(vis: Visibility, im: Image, padding=2):
     return uvw_mode, shape, padding, vuvwmap
 
 
-def standard_kernel_list(vis: Visibility, shape, oversampling=8, support=3):
+def get_tile_sort(vis: Visibility, im: Image, shape, vuvwmap, vfrequencymap, tilesize=64):
+    """ Get the sorting of the rows by uv tile, calculating it only if it is not cached in the Visibility
+
+    The cache key includes a hash of the uv and frequency maps, so a different image geometry or shifted
+    uvw give a new sort.
+    
+    :param vis: Visibility (holds the cache)
+    :param im: Image defining the uvw and frequency mappings
+    :param shape: Shape of grid [nchan, npol, ny, nx]
+    :param vuvwmap: map uvw to grid fractions
+    :param vfrequencymap: map frequency to image channels
+    :param tilesize: Size of tile in cells
+    :return: Tile sorting (see arl.fourier_transforms.convolutional_gridding.tile_sort)
+    """
+    maphash = hashlib.sha1(numpy.ascontiguousarray(vuvwmap[:, 0:2], dtype='float').tobytes())
+    maphash.update(numpy.ascontiguousarray(vfrequencymap, dtype='int').tobytes())
+    key = (tuple(shape), tilesize, vis.nvis, tuple(im.wcs.wcs.cdelt), tuple(im.wcs.wcs.crpix),
+           tuple(im.wcs.wcs.crval), maphash.hexdigest())
+    if key not in vis.tile_sort_cache:
+        log.debug("get_tile_sort: sorting %d rows into tiles of %d cells" % (vis.nvis, tilesize))
+        vis.tile_sort_cache[key] = tile_sort(shape, vuvwmap, vfrequencymap, tilesize)
+    return vis.tile_sort_cache[key]
+
+
+class ImagingPlan:
+    """ Mappings from a visibility slice to an image, calculated once and reused by invert and predict
+
+    The plan holds the frequency, polarisation and uvw maps, the gridding kernels and correction function,
+    the grid coordinates for each grid shape, and the tile sorts. It is (re)calculated by
+    :py:func:`get_imaging_plan` whenever the visibility, image or imaging parameters do not match those
+    it was calculated for. The visibility is identified by hashes of its uvw and frequency, so a plan is
+    recalculated if these are changed in any way, including in place.
+
+    For example, to reuse the plans for all slices and facets in a major cycle loop::
+
+        plans = dict()
+        for cycle in range(nmajor):
+            dirty, sumwt = invert_function(vis, model, context='wstack', imaging_plans=plans, **kwargs)
+
+    """
+
+    def __init__(self):
+        """ Create an empty plan, calculated on first use
+        
+        """
+        self.signature = None
+        self.nvis = 0
+        self.spectral_mode = None
+        self.vfrequencymap = None
+        self.polarisation_mode = None
+        self.vpolarisationmap = None
+        self.uvw_mode = None
+        self.shape = None
+        self.padding = None
+        self.vuvwmap = None
+        self.kernel_name = None
+        self.gcf = None
+        self.kernel_list = None
+        self.coords_cache = dict()
+        self.tile_sort_cache = dict()
+
+    def grid_coordinates(self, shape):
+        """ Get the grid coordinates of all rows for a grid of the given shape, calculating if not cached
+
+        :param shape: Shape of grid [nchan, npol, ny, nx]
+        :return: x, y, xf, yf (see arl.fourier_transforms.convolutional_gridding.grid_coordinates)
+        """
+        key = tuple(shape[-2:])
+        if key not in self.coords_cache:
+            self.coords_cache[key] = grid_coordinates(shape, self.kernel_list[1], self.vuvwmap)
+        return self.coords_cache[key]
+
+
+# Parameters that change the maps, kernels or gridding correction function
+_imaging_plan_parameters = ['padding', 'kernel', 'oversampling', 'precision', 'wloss', 'wstep', 'kernelwidth',
+                            'remove_shift', 'kernel_cache', 'w_kernel_method']
+
+
+def imaging_plan_signature(vis: Visibility, im: Image, **kwargs):
+    """ Summary of everything that an imaging plan depends upon
+
+    The visibility is summarised by the number of rows and the hashes of the uvw and frequency arrays.
+
+    :param vis: Visibility
+    :param im: Image template
+    :return: tuple
+    """
+    return (vis.nvis, hashlib.sha1(numpy.ascontiguousarray(vis.uvw)).hexdigest(),
+            hashlib.sha1(numpy.ascontiguousarray(vis.frequency)).hexdigest(), tuple(im.shape),
+            tuple(im.wcs.wcs.cdelt), tuple(im.wcs.wcs.crpix), tuple(im.wcs.wcs.crval), str(im.polarisation_frame),
+            str(vis.polarisation_frame),
+            tuple(str(get_parameter(kwargs, name, None)) for name in _imaging_plan_parameters))
+
+
+def get_imaging_plan(vis: Visibility, im: Image, **kwargs) -> ImagingPlan:
+    """ Get the imaging plan for vis and im
+
+    If kwargs contains imaging_plan (an ImagingPlan) it is used, being calculated only if it does not match vis,
+    im and kwargs. Otherwise a new plan is calculated.
+
+    :param vis: Visibility
+    :param im: Image template
+    :param imaging_plan: ImagingPlan to be reused
+    :return: ImagingPlan
+    """
+    plan = get_parameter(kwargs, 'imaging_plan', None)
+    if plan is None:
+        plan = ImagingPlan()
+    
+    signature = imaging_plan_signature(vis, im, **kwargs)
+    if plan.signature == signature:
+        return plan
+    
+    log.debug("get_imaging_plan: calculating plan for %d rows" % vis.nvis)
+    padding = {}
+    if get_parameter(kwargs, "padding", False):
+        padding = {'padding': get_parameter(kwargs, "padding", False)}
+    plan.coords_cache = dict()
+    plan.tile_sort_cache = dict()
+    plan.nvis = vis.nvis
+    plan.spectral_mode, plan.vfrequencymap = get_frequency_map(vis, im)
+    plan.vfrequencymap = numpy.array(plan.vfrequencymap, dtype='int')
+    plan.polarisation_mode, plan.vpolarisationmap = get_polarisation_map(vis, im)
+    plan.uvw_mode, plan.shape, plan.padding, plan.vuvwmap = get_uvw_map(vis, im, **padding)
+    plan.kernel_name, plan.gcf, plan.kernel_list = get_kernel_list(vis, im, **kwargs)
+    plan.signature = signature
+    return plan
+
+
+def get_grid_dtype(**kwargs):
+    """ Get the complex type of the uv grid, kernels and FFTs
+
+    The sum of weights is always accumulated in double precision.
+
+    :param precision: 'double' (default) | 'single'
+    :return: numpy dtype
+    """
+    precision = get_parameter(kwargs, "precision", "double")
+    if precision == 'single':
+        return numpy.dtype('complex64')
+    elif precision == 'double':
+        return numpy.dtype('complex')
+    else:
+        raise ValueError("Unknown precision %s" % precision)
+
+
+def standard_kernel_list(vis: Visibility, shape, oversampling=8, support=3, dtype='complex'):
     """Return a generator to calculate the standard visibility kernel
 
     :param vis: visibility
     :param shape: tuple with 2D shape of grid
     :param oversampling: Oversampling factor
     :param support: Support of kernel
+    :param dtype: Type of the kernel
     :return: Function to look up gridding kernel
     """
-    return numpy.zeros_like(vis.w, dtype='int'), [anti_aliasing_calculate(shape, oversampling, support)[1]]
+    return numpy.zeros_like(vis.w, dtype='int'), [anti_aliasing_calculate(shape, oversampling, support, dtype)[1]]
 
 
-def w_kernel_list(vis: Visibility, im: Image, oversampling=1, wstep=50.0, kernelwidth=16, **kwargs):
+def w_kernel_list(vis: Visibility, im: Image, oversampling=1, wstep=50.0, kernelwidth=16, use_cache=True,
+                  wquantum=None, method='dft', **kwargs):
     """ Calculate w convolution kernels
     
     Uses create_w_term_like to calculate the w screen. This is exactly as wstacking does.
@@ -136,16 +287,28 @@ def w_kernel_list(vis: Visibility, im: Image, oversampling=1, wstep=50.0, kernel
     Each kernel has axes [centre_v, centre_u, offset_v, offset_u]. We currently use the same
     convolution function for all channels and polarisations. Changing that behaviour would
     require modest changes here and to the gridding/degridding routines.
+    
+    If use_cache is True, the kernels are looked up in the process-wide kernel cache (see
+    arl.fourier_transforms.kernel_cache, which may also be on disk), keyed on the image geometry, phasecentre,
+    oversampling, kernelwidth, remove_shift and the w value. The cached kernels are read-only and are the same as
+    those calculated without the cache. Optionally, the w value may be quantised to wquantum * wstep so that
+    kernels are shared between visibilities with slightly different w ranges. The kernel is then calculated at
+    the quantised w, which changes the gridding slightly.
+    
+    By default (method='dft') only the kernel samples are calculated, by a partial DFT of the w screen. The
+    original method='fft' pads the w screen by oversampling and FFTs the whole padded screen.
 
     :param vis: visibility
     :param image: Template image (padding, if any, occurs before this)
     :param oversampling: Oversampling factor
     :param wstep: Step in w between cached functions
+    :param use_cache: Use the process-wide kernel cache (True)
+    :param wquantum: Quantum of w for cache lookup, as a fraction of wstep e.g. 0.01 (None: no quantisation)
+    :param method: 'dft' (default) or 'fft'
     :return: (indices to the w kernel for each row, kernels)
     """
 
     nchan, npol, ny, nx = im.shape
-    gcf, _ = anti_aliasing_calculate((ny, nx))
 
     assert oversampling % 2 == 0 or oversampling == 1, "oversampling must be unity or even"
     assert kernelwidth % 2 == 0, "kernelwidth must be even"
@@ -160,28 +323,35 @@ def w_kernel_list(vis: Visibility, im: Image, oversampling=1, wstep=50.0, kernel
     nwsteps = digitise(wmaxabs, wstep) + 1
     w_list = numpy.linspace(-wmaxabs, +wmaxabs, nwsteps)
     
-    wtemplate = copy_image(im)
-    
-    wtemplate.data = numpy.zeros(wtemplate.shape, dtype=im.data.dtype)
-    
-    padded_shape = list(wtemplate.shape)
-    padded_shape[3] *= oversampling
-    padded_shape[2] *= oversampling
-
-    # For all the unique indices, calculate the corresponding w kernel
-    kernels = list()
-    for w in w_list:
-        # Make a w screen
-        wscreen = create_w_term_like(wtemplate, w, vis.phasecentre, **kwargs)
-        wscreen.data /= gcf
-        assert numpy.max(numpy.abs(wscreen.data)) > 0.0, 'w screen is empty'
-        wscreen_padded = pad_image(wscreen, padded_shape)
-
-        wconv = fft_image(wscreen_padded)
-        wconv.data *= float(oversampling)**2
-        # For the moment, ignore the polarisation and channel axes
-        kernels.append(convert_image_to_kernel(wconv, oversampling,
-                                               kernelwidth).data[0, 0, ...])
+    # The gridding correction function is only needed if a kernel must be calculated
+    gcf = None
+    
+    def generate(w):
+        nonlocal gcf
+        if gcf is None:
+            gcf, _ = anti_aliasing_calculate((ny, nx))
+        return w_kernel(im, w, gcf, vis.phasecentre, oversampling, kernelwidth, method=method, **kwargs)
+    
+    # For all the unique indices, calculate (or look up) the corresponding w kernel
+    if use_cache:
+        cache = get_kernel_cache()
+        # Only the scalar parameters that change the kernel are in the key
+        geometry = ('w_kernel', ny, nx, tuple(float(c) for c in im.wcs.wcs.cdelt[0:2]),
+                    tuple(float(c) for c in im.wcs.wcs.crpix[0:2]), tuple(float(c) for c in im.wcs.wcs.crval[0:2]),
+                    float(vis.phasecentre.ra.deg), float(vis.phasecentre.dec.deg), oversampling, kernelwidth, method,
+                    bool(get_parameter(kwargs, "remove_shift", False)))
+        kernels = list()
+        if wquantum is None:
+            for w in w_list:
+                kernels.append(cache.get(geometry + (float(w),), lambda: generate(w)))
+        else:
+            quantum = float(wquantum * wstep)
+            for w in w_list:
+                iw = int(numpy.round(w / quantum))
+                kernels.append(cache.get(geometry + (iw, quantum), lambda: generate(iw * quantum)))
+        log.debug("w_kernel_list: kernel cache %s" % str(cache.statistics()))
+    else:
+        kernels = [generate(w) for w in w_list]
     
     # Now make a lookup table from row number of vis to the kernel
     kernel_indices = digitise(vis.w, wstep)
@@ -190,9 +360,55 @@ def w_kernel_list(vis: Visibility, im: Image, oversampling=1, wstep=50.0, kernel
     return kernel_indices, kernels
 
 
+def w_kernel(wtemplate: Image, w, gcf, phasecentre, oversampling, kernelwidth, method='dft', **kwargs):
+    """ Calculate the w convolution kernel for one value of w
+    
+    For method='dft' the kernel samples are calculated directly from the w screen (see
+    :py:func:`arl.fourier_transforms.convolutional_gridding.oversampled_kernel`). For method='fft' the w
+    screen is padded by oversampling and transformed with an FFT.
+    
+    :param wtemplate: Template image (padding, if any, occurs before this). Only the shape and wcs are used.
+    :param w: w value (wavelengths)
+    :param gcf: Gridding correction function for the template image
+    :param phasecentre: Phasecentre of the visibility
+    :param oversampling: Oversampling factor
+    :param kernelwidth: Width of kernel
+    :param method: 'dft' (default) or 'fft'
+    :return: kernel [oversampling, oversampling, kernelwidth, kernelwidth]
+    """
+    if method == 'dft':
+        # This is the w screen as made by create_w_term_like for a single plane
+        ny, nx = wtemplate.shape[2:]
+        cellsize = abs(wtemplate.wcs.wcs.cdelt[0]) * numpy.pi / 180.0
+        wscreen = w_beam(nx, nx * cellsize, w=w, cx=wtemplate.wcs.wcs.crpix[0] - 1.0,
+                         cy=wtemplate.wcs.wcs.crpix[1] - 1.0, remove_shift=get_parameter(kwargs, "remove_shift", False))
+        wscreen /= gcf
+        assert numpy.max(numpy.abs(wscreen)) > 0.0, 'w screen is empty'
+        return oversampled_kernel(wscreen, oversampling, kernelwidth)
+    
+    assert method == 'fft', "Unknown w kernel method %s" % method
+    padded_shape = list(wtemplate.shape)
+    padded_shape[3] *= oversampling
+    padded_shape[2] *= oversampling
+    
+    # Make a w screen
+    wscreen = create_w_term_like(wtemplate, w, phasecentre, **kwargs)
+    wscreen.data /= gcf
+    assert numpy.max(numpy.abs(wscreen.data)) > 0.0, 'w screen is empty'
+    wscreen_padded = pad_image(wscreen, padded_shape)
+    
+    wconv = fft_image(wscreen_padded)
+    wconv.data *= float(oversampling) ** 2
+    # For the moment, ignore the polarisation and channel axes
+    return convert_image_to_kernel(wconv, oversampling, kernelwidth).data[0, 0, ...]
+
+
 def get_kernel_list(vis: Visibility, im: Image, **kwargs):
     """Get the list of kernels, one per visibility
     
+    If precision='single' the kernels are complex64 and the gridding correction function is float32.
+    
+    The w projection kernels are held in the process-wide kernel cache unless kernel_cache=False.
     """
     
     shape = im.data.shape
@@ -202,8 +418,11 @@ def get_kernel_list(vis: Visibility, im: Image, **kwargs):
     kernelname = get_parameter(kwargs, "kernel", "2d")
     oversampling = get_parameter(kwargs, "oversampling", 8)
     padding = get_parameter(kwargs, "padding", 2)
+    dtype = get_grid_dtype(**kwargs)
     
     gcf, _ = anti_aliasing_calculate((padding * npixel, padding * npixel), oversampling)
+    if dtype == numpy.complex64:
+        gcf = gcf.astype('float32')
     
     wabsmax = numpy.max(numpy.abs(vis.w))
     if kernelname == 'wprojection' and wabsmax > 0.0:
@@ -232,12 +451,16 @@ def get_kernel_list(vis: Visibility, im: Image, **kwargs):
 
         remove_shift = get_parameter(kwargs, "remove_shift", True)
         padded_image = pad_image(im, padded_shape)
-        kernel_list = w_kernel_list(vis, padded_image, oversampling=oversampling, wstep=wstep,
-                                    kernelwidth=kernelwidth, remove_shift=remove_shift)
+        use_cache = get_parameter(kwargs, "kernel_cache", True)
+        method = get_parameter(kwargs, "w_kernel_method", 'dft')
+        kernel_indices, kernels = w_kernel_list(vis, padded_image, oversampling=oversampling, wstep=wstep,
+                                                kernelwidth=kernelwidth, use_cache=use_cache, method=method,
+                                                remove_shift=remove_shift)
+        kernel_list = kernel_indices, [kernel.astype(dtype, copy=False) for kernel in kernels]
     else:
         kernelname = '2d'
         kernel_list = standard_kernel_list(vis, (padding * npixel, padding * npixel),
-                                           oversampling=oversampling)
+                                           oversampling=oversampling, dtype=dtype)
     
     return kernelname, gcf, kernel_list
 
@@ -25,7 +25,7 @@ Ignoring changes in the normalisation term, we have:
 """
 import numpy
 
-from arl.data.data_models import Visibility, Image
+from arl.data.data_models import Visibility, Image, VisibilityView
 
 from arl.image.operations import copy_image
 
@@ -169,6 +169,8 @@ def invert_timeslice_single(vis: Visibility, im: Image, dopsf, normalize=True,
         avis = coalesce_visibility(vis, **kwargs)
     else:
         avis = vis
+    if isinstance(avis, VisibilityView):
+        avis.materialise()
 
     log.debug("invert_timeslice: inverting using time slices")
 
@@ -11,7 +11,7 @@ If images constructed from slices in w are added after applying a w-dependent im
 
 import numpy
 
-from arl.data.data_models import Visibility, Image, BlockVisibility
+from arl.data.data_models import Visibility, Image, BlockVisibility, VisibilityView
 
 from arl.image.operations import copy_image
 from arl.visibility.base import copy_visibility
@@ -85,6 +85,8 @@ def invert_wstack_single(vis: Visibility, im: Image, dopsf, normalize=True, remo
     kwargs['imaginary'] = True
     
     assert isinstance(vis, Visibility), vis
+    if isinstance(vis, VisibilityView):
+        vis.materialise()
     
     kwargs['vis_slices'] = 1
     kwargs['wstack'] = numpy.max(numpy.abs(vis.w))
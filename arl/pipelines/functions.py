@@ -36,6 +36,9 @@ def ical(block_vis: BlockVisibility, model: Image, components=None, context='2d'
     if controls is None:
         controls = create_calibration_controls(**kwargs)
     
+    # Keep the imaging plans (maps, kernels, grid coordinates) for each slice through the major cycles
+    kwargs['imaging_plans'] = get_parameter(kwargs, 'imaging_plans', dict())
+    
     # The model is added to each major cycle and then the visibilities are
     # calculated from the full model
     vis = convert_blockvisibility_to_visibility(block_vis)
@@ -11,7 +11,8 @@ from astropy import units as u
 from astropy.coordinates import SkyCoord
 
 from arl.util.coordinate_support import xyz_to_uvw, uvw_to_xyz, skycoord_to_lmn, simulate_point
-from arl.data.data_models import Visibility, BlockVisibility, Configuration
+from arl.data.data_models import Visibility, BlockVisibility, Configuration, VisibilityView, \
+    BlockVisibilityView
 from arl.data.polarisation import PolarisationFrame, ReceptorFrame, correlate_polarisation
 
 import logging
@@ -37,6 +38,7 @@ def copy_visibility(vis: Union[Visibility, BlockVisibility], zero=False) -> Unio
     if isinstance(vis, Visibility):
         newvis.cindex = vis.cindex
         newvis.blockvis = vis.blockvis
+        newvis.tile_sort_cache = dict()
     if zero:
         newvis.data['vis'][...] = 0.0
     return newvis
@@ -45,7 +47,7 @@ def copy_visibility(vis: Union[Visibility, BlockVisibility], zero=False) -> Unio
 def create_visibility(config: Configuration, times: numpy.array, frequency: numpy.array,
                       channel_bandwidth, phasecentre: SkyCoord,
                       weight: float, polarisation_frame=PolarisationFrame('stokesI'),
-                      integration_time=1.0) -> Visibility:
+                      integration_time=1.0, columnar=False) -> Visibility:
     """ Create a Visibility from Configuration, hour angles, and direction of source
 
     Note that we keep track of the integration time for BDA purposes
@@ -58,6 +60,7 @@ def create_visibility(config: Configuration, times: numpy.array, frequency: nump
     :param channel_bandwidth: channel bandwidths: (Hz] [nchan]
     :param integration_time: Integration time ('auto' or value in s)
     :param polarisation_frame: PolarisationFrame('stokesI')
+    :param columnar: Hold the columns as separate contiguous arrays (False)
     :return: Visibility
     """
     assert phasecentre is not None, "Must specify phase centre"
@@ -66,53 +69,35 @@ def create_visibility(config: Configuration, times: numpy.array, frequency: nump
         polarisation_frame = correlate_polarisation(config.receptor_frame)
 
     nch = len(frequency)
-    ants_xyz = config.data['xyz']
-    nants = len(config.data['names'])
-    nbaselines = int(nants * (nants - 1) / 2)
+    frequency = numpy.array(frequency)
     ntimes = len(times)
+    nants = len(config.data['names'])
     npol = polarisation_frame.npol
+
+    # The rows are ordered by time, then baseline (a1 < a2), then channel
+    ant_uvw = simulate_antenna_uvw(config, times, phasecentre)
+    a1, a2 = numpy.triu_indices(nants, 1)
+    nbaselines = len(a1)
     nrows = nbaselines * ntimes * nch
-    nrowsperintegration = nbaselines * nch
-    row = 0
+    baseline_uvw = ant_uvw[:, a2, :] - ant_uvw[:, a1, :]
+    # noinspection PyUnresolvedReferences
+    k = frequency / constants.c.value
+    ruvw = (baseline_uvw[:, :, numpy.newaxis, :] * k[numpy.newaxis, numpy.newaxis, :, numpy.newaxis]).reshape(
+        [nrows, 3])
+    rtimes = numpy.repeat(numpy.array(times) * 43200.0 / numpy.pi, nbaselines * nch)
+    rfrequency = numpy.tile(frequency, ntimes * nbaselines)
+    rchannel_bandwidth = numpy.tile(numpy.array(channel_bandwidth), ntimes * nbaselines)
+    rantenna1 = numpy.tile(numpy.repeat(a1, nch), ntimes)
+    rantenna2 = numpy.tile(numpy.repeat(a2, nch), ntimes)
     rvis = numpy.zeros([nrows, npol], dtype='complex')
     rweight = weight * numpy.ones([nrows, npol])
-    rtimes = numpy.zeros([nrows])
-    rfrequency = numpy.zeros([nrows])
-    rchannel_bandwidth = numpy.zeros([nrows])
-    rantenna1 = numpy.zeros([nrows], dtype='int')
-    rantenna2 = numpy.zeros([nrows], dtype='int')
-    ruvw = numpy.zeros([nrows, 3])
-
-    # Do each hour angle in turn
-    for iha, ha in enumerate(times):
-
-        # Calculate the positions of the antennas as seen for this hour angle
-        # and declination
-        ant_pos = xyz_to_uvw(ants_xyz, ha, phasecentre.dec.rad)
-        rtimes[row:row + nrowsperintegration] = ha * 43200.0 / numpy.pi
-
-        # Loop over all pairs of antennas. Note that a2>a1
-        for a1 in range(nants):
-            for a2 in range(a1 + 1, nants):
-                rantenna1[row:row + nch] = a1
-                rantenna2[row:row + nch] = a2
-
-                # Loop over all frequencies and polarisations
-                for ch in range(nch):
-                    # noinspection PyUnresolvedReferences
-                    k = frequency[ch] / constants.c.value
-                    ruvw[row, :] = (ant_pos[a2, :] - ant_pos[a1, :]) * k
-                    rfrequency[row] = frequency[ch]
-                    rchannel_bandwidth[row] = channel_bandwidth[ch]
-                    row += 1
-
-    assert row == nrows
+
     rintegration_time = numpy.full_like(rtimes, integration_time)
     vis = Visibility(uvw=ruvw, time=rtimes, antenna1=rantenna1, antenna2=rantenna2,
                      frequency=rfrequency, vis=rvis,
                      weight=rweight, imaging_weight=rweight,
                      integration_time=rintegration_time, channel_bandwidth=rchannel_bandwidth,
-                     polarisation_frame=polarisation_frame)
+                     polarisation_frame=polarisation_frame, columnar=columnar)
     vis.phasecentre = phasecentre
     vis.configuration = config
     log.info("create_visibility: %s" % (vis_summary(vis)))
@@ -129,7 +114,7 @@ def create_blockvisibility(config: Configuration,
                            polarisation_frame: PolarisationFrame = None,
                            integration_time=1.0,
                            channel_bandwidth=1e6,
-                           zerow=False, **kwargs) -> BlockVisibility:
+                           zerow=False, columnar=False, **kwargs) -> BlockVisibility:
     """ Create a BlockVisibility from Configuration, hour angles, and direction of source
 
     Note that we keep track of the integration time for BDA purposes
@@ -142,6 +127,7 @@ def create_blockvisibility(config: Configuration,
     :param channel_bandwidth: channel bandwidths: (Hz] [nchan]
     :param integration_time: Integration time ('auto' or value in s)
     :param polarisation_frame:
+    :param columnar: Hold the columns as separate contiguous arrays (False)
     :return: BlockVisibility
     """
     assert phasecentre is not None, "Must specify phase centre"
@@ -150,29 +136,17 @@ def create_blockvisibility(config: Configuration,
         polarisation_frame = correlate_polarisation(config.receptor_frame)
 
     nch = len(frequency)
-    ants_xyz = config.data['xyz']
     nants = len(config.data['names'])
     ntimes = len(times)
     npol = polarisation_frame.npol
     visshape = [ntimes, nants, nants, nch, npol]
     rvis = numpy.zeros(visshape, dtype='complex')
     rweight = weight * numpy.ones(visshape)
-    rtimes = numpy.zeros([ntimes])
-    ruvw = numpy.zeros([ntimes, nants, nants, 3])
+    rtimes = numpy.array(times) * 43200.0 / numpy.pi
 
-    # Do each hour angle in turn
-    for iha, ha in enumerate(times):
-
-        # Calculate the positions of the antennas as seen for this hour angle
-        # and declination
-        ant_pos = xyz_to_uvw(ants_xyz, ha, phasecentre.dec.rad)
-        rtimes[iha] = ha * 43200.0 / numpy.pi
-
-        # Loop over all pairs of antennas. Note that a2>a1
-        for a1 in range(nants):
-            for a2 in range(a1 + 1, nants):
-                ruvw[iha, a2, a1, :] = (ant_pos[a2, :] - ant_pos[a1, :])
-                ruvw[iha, a1, a2, :] = (ant_pos[a1, :] - ant_pos[a2, :])
+    # ruvw[time, a2, a1] is the position of a2 relative to a1
+    ant_uvw = simulate_antenna_uvw(config, times, phasecentre)
+    ruvw = ant_uvw[:, :, numpy.newaxis, :] - ant_uvw[:, numpy.newaxis, :, :]
 
     rintegration_time = numpy.full_like(rtimes, integration_time)
     rchannel_bandwidth = numpy.full_like(frequency, channel_bandwidth)
@@ -180,7 +154,7 @@ def create_blockvisibility(config: Configuration,
         ruvw[..., 2] = 0.0
     vis = BlockVisibility(uvw=ruvw, time=rtimes, frequency=frequency, vis=rvis, weight=rweight,
                           integration_time=rintegration_time, channel_bandwidth=rchannel_bandwidth,
-                          polarisation_frame=polarisation_frame)
+                          polarisation_frame=polarisation_frame, columnar=columnar)
     vis.phasecentre = phasecentre
     vis.configuration = config
     log.info("create_blockvisibility: %s" % (vis_summary(vis)))
@@ -189,6 +163,51 @@ def create_blockvisibility(config: Configuration,
     return vis
 
 
+def simulate_antenna_uvw(config: Configuration, times: numpy.array, phasecentre: SkyCoord) -> numpy.array:
+    """ Calculate the positions of the antennas as seen for all hour angles
+
+    :param config: Configuration of antennas
+    :param times: hour angles in radians
+    :param phasecentre: phasecentre of observation
+    :return: uvw in meters [ntimes, nants, 3]
+    """
+    ants_xyz = config.data['xyz']
+    nants = len(ants_xyz)
+    ntimes = len(times)
+    ha = numpy.repeat(numpy.array(times), nants)[:, numpy.newaxis]
+    return xyz_to_uvw(numpy.tile(ants_xyz, (ntimes, 1)), ha, phasecentre.dec.rad).reshape([ntimes, nants, 3])
+
+
+def create_visibility_iter(config: Configuration, times: numpy.array, frequency: numpy.array,
+                           phasecentre: SkyCoord, times_per_chunk=1, fmt='blockvis', **kwargs):
+    """ Generate the visibility for successive chunks of times
+
+    This allows simulations that do not fit in memory to be processed chunk by chunk::
+
+        for bvis in create_visibility_iter(config, times, frequency, phasecentre, times_per_chunk=16,
+                                           channel_bandwidth=channel_bandwidth):
+            bvis = predict_skycomponent_visibility(bvis, comps)
+
+    :param config: Configuration of antennas
+    :param times: hour angles in radians
+    :param frequency: frequencies (Hz] [nchan]
+    :param phasecentre: phasecentre of observation
+    :param times_per_chunk: Number of times in each chunk
+    :param fmt: 'blockvis' or 'vis': def 'blockvis'
+    :param kwargs: Passed to create_blockvisibility or create_visibility
+    :return: Generator of BlockVisibility or Visibility
+    """
+    if fmt == 'vis':
+        create_vis = create_visibility
+    else:
+        create_vis = create_blockvisibility
+    
+    assert times_per_chunk > 0
+    times = numpy.array(times)
+    for start in range(0, len(times), times_per_chunk):
+        yield create_vis(config, times[start:start + times_per_chunk], frequency, phasecentre=phasecentre, **kwargs)
+
+
 def create_visibility_from_rows(vis: Union[Visibility, BlockVisibility], rows: numpy.ndarray, makecopy=True) \
         -> Union[Visibility, BlockVisibility]:
     """ Create a Visibility from selected rows
@@ -218,6 +237,7 @@ def create_visibility_from_rows(vis: Union[Visibility, BlockVisibility], rows: n
             return newvis
         else:
             vis.data = copy.deepcopy(vis.data[rows])
+            vis.tile_sort_cache = dict()
             if vis.cindex is not None:
                 vis.cindex = vis.cindex[rows]
             return vis
@@ -233,6 +253,34 @@ def create_visibility_from_rows(vis: Union[Visibility, BlockVisibility], rows: n
             return vis
 
 
+def create_visibility_view(vis: Union[Visibility, BlockVisibility], rows: numpy.ndarray) \
+        -> Union[VisibilityView, BlockVisibilityView]:
+    """ Create a view of selected rows that shares the data of vis
+
+    If the selected rows are contiguous (for example time slices of time ordered data) the view holds a
+    slice and nothing is copied. Otherwise the rows are copied on first use. The data of the view are
+    read-only: call materialise() on the view before changing them in place.
+
+    :param vis: Visibility or BlockVisibility
+    :param rows: Boolean array of row selection
+    :return: VisibilityView or BlockVisibilityView
+    """
+    
+    if rows is None or numpy.sum(rows) == 0:
+        return None
+    
+    assert len(rows) == vis.nvis, "Length of rows does not agree with length of visibility"
+    
+    selected = numpy.flatnonzero(rows)
+    if selected[-1] - selected[0] + 1 == len(selected):
+        selected = slice(selected[0], selected[-1] + 1)
+    
+    if isinstance(vis, Visibility):
+        return VisibilityView(vis, selected)
+    else:
+        return BlockVisibilityView(vis, selected)
+
+
 def phaserotate_visibility(vis: Visibility, newphasecentre: SkyCoord, tangent=True, inverse=False) -> Visibility:
     """
     Phase rotate from the current phase centre to a new phase centre
@@ -25,7 +25,6 @@ from astropy import constants
 from arl.visibility.base import vis_summary, copy_visibility
 from arl.data.data_models import Visibility, BlockVisibility
 from arl.data.parameters import get_parameter
-from arl.util.array_functions import average_chunks, average_chunks2
 
 import logging
 
@@ -68,7 +67,7 @@ def coalesce_visibility(vis: BlockVisibility, **kwargs) -> Visibility:
                                weight=cwts, imaging_weight=cimwt,
                                configuration=vis.configuration, integration_time=cintegration_time,
                                polarisation_frame=vis.polarisation_frame, cindex=cindex,
-                               blockvis=vis)
+                               blockvis=vis, columnar=vis.columnar)
 
     log.debug('coalesce_visibility: Created new Visibility for coalesced data, coalescence factors (t,f) = (%.3f,%.3f)'
               % (time_coal, frequency_coal))
@@ -98,7 +97,7 @@ def convert_blockvisibility_to_visibility(vis: BlockVisibility) -> Visibility:
                                weight=cwts, imaging_weight=cimwt,
                                configuration=vis.configuration, integration_time=cintegration_time,
                                polarisation_frame=vis.polarisation_frame, cindex=cindex,
-                               blockvis=vis)
+                               blockvis=vis, columnar=vis.columnar)
 
     log.debug('convert_visibility: Original %s, converted %s' % (vis_summary(vis),
                                                                  vis_summary(converted_vis)))
@@ -128,12 +127,9 @@ def decoalesce_visibility(vis: Visibility, overwrite=False, **kwargs) -> BlockVi
 
     vshape = decomp_vis.data['vis'].shape
 
-    npol = vshape[-1]
-    dvis = numpy.zeros(vshape, dtype='complex')
-    assert numpy.max(vis.cindex) < dvis.size
+    assert len(vis.cindex) * vshape[-1] == numpy.prod(vshape), "Incorrect template used in decoalescing"
     assert numpy.max(vis.cindex) < vis.vis.shape[0], "Incorrect template used in decoalescing"
-    for i in range(dvis.size // npol):
-        decomp_vis.data['vis'].flat[i:i + npol] = vis.data['vis'][vis.cindex[i]]
+    decomp_vis.data['vis'][...] = vis.data['vis'][vis.cindex].reshape(vshape)
 
     log.debug('decoalesce_visibility: Coalesced %s, decoalesced %s' % (vis_summary(vis),
                                                                        vis_summary(
@@ -144,130 +140,131 @@ def decoalesce_visibility(vis: Visibility, overwrite=False, **kwargs) -> BlockVi
 
 def average_in_blocks(vis, uvw, wts, times, integration_time, frequency, channel_bandwidth, time_coal=1.0,
                       max_time_coal=100, frequency_coal=1.0, max_frequency_coal=100):
-    # Calculate the averaging factors for time and frequency making them the same for all times
-    # for this baseline
-    # Find the maximum possible baseline and then scale to this.
-
-    # The input visibility is a block of shape [ntimes, nant, nant, nchan, npol]. We will map this
-    # into rows like vis[npol] and with additional columns antenna1, antenna2, frequency
-
+    """ Baseline dependent averaging of a block of visibilities
+
+    The averaging factors in time and frequency are inversely proportional to the baseline length, and the
+    same for all times and channels of a baseline. Baselines with the same factors are averaged together
+    using numpy.add.reduceat. Baselines with no weight are dropped.
+
+    The rows are ordered by baseline (a2, then a1), then time chunk, then frequency chunk.
+
+    :param vis: Visibility block [ntimes, nant, nant, nchan, npol]
+    :param uvw: uvw block [ntimes, nant, nant, 3] (meters)
+    :param wts: Weight block [ntimes, nant, nant, nchan, npol]
+    :param times: Times [ntimes]
+    :param integration_time: Integration times [ntimes]
+    :param frequency: Frequencies [nchan]
+    :param channel_bandwidth: Channel bandwidths [nchan]
+    :param time_coal: Time coalescence factor
+    :param max_time_coal: Maximum number of integrations averaged
+    :param frequency_coal: Frequency coalescence factor
+    :param max_frequency_coal: Maximum number of channels averaged
+    :return: cvis, cuvw, cwts, ctime, cfrequency, cchannel_bandwidth, ca1, ca2, cintegration_time, cindex
+    """
     ntimes, nant, _, nchan, npol = vis.shape
+    frequency = numpy.array(frequency)
 
     # Pol independent weighting
     allpwtsgrid = numpy.sum(wts, axis=4)
-    # Pol and frequency independent weighting
-    allcpwtsgrid = numpy.sum(allpwtsgrid, axis=3)
-    # Pol and time independent weighting
-    alltpwtsgrid = numpy.sum(allpwtsgrid, axis=0)
-
-    # Now calculate on a baseline basis the time and frequency averaging. We do this by looking at
-    # the maximum uv distance for all data and for a given baseline. The integration time and
-    # channel bandwidth are scale appropriately.
+    weighted = numpy.any(allpwtsgrid, axis=(0, 3))
+
+    # Calculate on a baseline basis the time and frequency averaging from the maximum uv distance for all data
+    # and for a given baseline.
     uvmax = numpy.sqrt(numpy.max(uvw[:, 0] ** 2 + uvw[:, 1] ** 2 + uvw[:, 2] ** 2))
-    time_average = numpy.ones([nant, nant], dtype='int')
-    frequency_average = numpy.ones([nant, nant], dtype='int')
-    ua = numpy.arange(nant)
-    for a2 in ua:
-        for a1 in ua:
-            if allpwtsgrid[:, a2, a1, :].any() > 0.0:
-                uvdist = numpy.max(numpy.sqrt(uvw[:, a2, a1, 0] ** 2 + uvw[:, a2, a1, 1] ** 2), axis=0)
-                if uvdist > 0.0:
-                    time_average[a2, a1] = min(max_time_coal,
-                                               max(1, int(round((time_coal * uvmax / uvdist)))))
-                    frequency_average[a2, a1] = min(max_frequency_coal,
-                                                    max(1, int(round(frequency_coal * uvmax / uvdist))))
-                else:
-                    time_average[a2, a1] = max_time_coal
-                    frequency_average[a2, a1] = max_frequency_coal
-
-    # See how many time chunks and frequency we need for each baseline. To do this we use the same averaging that
-    # we will use later for the actual data. This tells us the number of chunks required for each baseline.
-    frequency_grid, time_grid = numpy.meshgrid(frequency, times)
-    channel_bandwidth_grid, integration_time_grid = numpy.meshgrid(channel_bandwidth, integration_time)
-    cnvis = 0
-    time_chunk_len = numpy.ones([nant, nant], dtype='int')
-    frequency_chunk_len = numpy.ones([nant, nant], dtype='int')
-    for a2 in ua:
-        for a1 in ua:
-            if (time_average[a2, a1] > 0) & (frequency_average[a2, a1] > 0 & (allpwtsgrid[:, a2, a1, ...].any() > 0.0)):
-                time_chunks, _ = average_chunks(times, allcpwtsgrid[:, a2, a1], time_average[a2, a1])
-                time_chunk_len[a2, a1] = time_chunks.shape[0]
-                frequency_chunks, _ = average_chunks(frequency, alltpwtsgrid[a2, a1, :], frequency_average[a2, a1])
-                frequency_chunk_len[a2, a1] = frequency_chunks.shape[0]
-                nrows = time_chunk_len[a2, a1] * frequency_chunk_len[a2, a1]
-                cnvis += nrows
-
-    # Now we know enough to define the output coalesced arrays. The shape will be
-    # succesive a1, a2: [len_time_chunks[a2,a1], a2, a1, len_frequency_chunks[a2,a1]]
+    uvdist = numpy.max(numpy.sqrt(uvw[..., 0] ** 2 + uvw[..., 1] ** 2), axis=0)
+    ratio = uvmax / numpy.where(uvdist > 0.0, uvdist, 1.0)
+    time_average = numpy.minimum(max_time_coal, numpy.maximum(1, numpy.round(time_coal * ratio).astype('int')))
+    frequency_average = numpy.minimum(max_frequency_coal,
+                                      numpy.maximum(1, numpy.round(frequency_coal * ratio).astype('int')))
+    time_average[uvdist <= 0.0] = max_time_coal
+    frequency_average[uvdist <= 0.0] = max_frequency_coal
+
+    # The weighted baselines in output order, and the number of time and frequency chunks for each
+    a2, a1 = numpy.nonzero(weighted)
+    bta = time_average[a2, a1]
+    bfa = frequency_average[a2, a1]
+    time_chunk_len = numpy.where(bta > 1, (ntimes + bta - 1) // bta, ntimes)
+    frequency_chunk_len = numpy.where(bfa > 1, (nchan + bfa - 1) // bfa, nchan)
+    nrows = time_chunk_len * frequency_chunk_len
+    visstart = numpy.concatenate(([0], numpy.cumsum(nrows)[:-1]))
+    cnvis = numpy.sum(nrows)
+
     ctime = numpy.zeros([cnvis])
     cfrequency = numpy.zeros([cnvis])
     cchannel_bandwidth = numpy.zeros([cnvis])
     cvis = numpy.zeros([cnvis, npol], dtype='complex')
     cwts = numpy.zeros([cnvis, npol])
     cuvw = numpy.zeros([cnvis, 3])
-    ca1 = numpy.zeros([cnvis], dtype='int')
-    ca2 = numpy.zeros([cnvis], dtype='int')
+    ca1 = numpy.repeat(a1, nrows)
+    ca2 = numpy.repeat(a2, nrows)
     cintegration_time = numpy.zeros([cnvis])
 
-    # For decoalescence we keep an index to map back to the original BlockVisibility
-    rowgrid = numpy.zeros([ntimes, nant, nant, nchan], dtype='int')
-    rowgrid.flat = range(rowgrid.size)
+    # For decoalescence we keep, for every element [time, a2, a1, chan] of the block, the row it was
+    # averaged into
+    cindex = numpy.zeros([ntimes, nant, nant, nchan], dtype='int')
 
-    cindex = numpy.zeros([rowgrid.size], dtype='int')
+    frequency_grid, time_grid = numpy.meshgrid(frequency, times)
+    channel_bandwidth_grid, integration_time_grid = numpy.meshgrid(channel_bandwidth, integration_time)
 
-    # Now go through, chunking up the various arrays. Everything is converted into an array with
-    # axes [time, channel] and then it is averaged over time and frequency chunks for
-    # this baseline.
-    # To aid decoalescence we will need an index of which output elements a given input element
-    # contributes to. This is a many to one. The decoalescence will then just consist of using
-    # this index to extract the coalesced value that a given input element contributes towards.
+    for ta, fa in set(zip(bta, bfa)):
+        group = numpy.nonzero((bta == ta) & (bfa == fa))[0]
+        ga1, ga2 = a1[group], a2[group]
+        l0, l1 = time_chunk_len[group[0]], frequency_chunk_len[group[0]]
+        rows = (visstart[group][:, numpy.newaxis] + numpy.arange(l0 * l1)[numpy.newaxis, :]).flatten()
 
-    visstart = 0
-    for a2 in ua:
-        for a1 in ua:
-            if (time_chunk_len[a2, a1] > 0) & (frequency_chunk_len[a2, a1] > 0) & \
-                    (allpwtsgrid[:, a2, a1, :].any() > 0.0):
+        # Everything is put onto axes [baseline, time, channel, ...]
+        gwts = numpy.transpose(allpwtsgrid[:, ga2, ga1, :], (1, 0, 2))
 
-                nrows = time_chunk_len[a2, a1] * frequency_chunk_len[a2, a1]
-                rows = slice(visstart, visstart + nrows)
+        def average_from_grid(arr):
+            return _average_blocks(numpy.broadcast_to(arr, gwts.shape), gwts, ta, fa)[0].flatten()
 
-                cindex.flat[rowgrid[:, a2, a1, :]] = numpy.array(range(visstart, visstart + nrows))
+        ctime[rows] = average_from_grid(time_grid)
+        cfrequency[rows] = average_from_grid(frequency_grid)
+        for axis in range(3):
+            uvwgrid = numpy.transpose(uvw[:, ga2, ga1, axis])[..., numpy.newaxis] * frequency / constants.c.value
+            cuvw[rows, axis] = average_from_grid(uvwgrid)
 
-                ca1[rows] = a1
-                ca2[rows] = a2
+        # For some variables, we need the sum not the average
+        cintegration_time[rows] = average_from_grid(integration_time_grid) * l0 * l1
+        cchannel_bandwidth[rows] = average_from_grid(channel_bandwidth_grid) * l0 * l1
 
-                # Average over time and frequency for case where polarisation isn't an issue
-                def average_from_grid(arr):
-                    return average_chunks2(arr, allpwtsgrid[:, a2, a1, :],
-                                           (time_average[a2, a1], frequency_average[a2, a1]))[0]
+        # The polarisations are averaged with their own weights
+        result = _average_blocks(numpy.transpose(vis[:, ga2, ga1, ...], (1, 0, 2, 3)),
+                                 numpy.transpose(wts[:, ga2, ga1, ...], (1, 0, 2, 3)), ta, fa)
+        cvis[rows], cwts[rows] = result[0].reshape([-1, npol]), result[1].reshape([-1, npol])
 
-                ctime[rows] = average_from_grid(time_grid).flatten()
-                cfrequency[rows] = average_from_grid(frequency_grid).flatten()
+        localrow = (numpy.arange(ntimes) // ta)[:, numpy.newaxis] * l1 + (numpy.arange(nchan) // fa)[numpy.newaxis, :]
+        cindex[:, ga2, ga1, :] = localrow[:, numpy.newaxis, :] + visstart[group][numpy.newaxis, :, numpy.newaxis]
 
-                for axis in range(3):
-                    uvwgrid = numpy.outer(uvw[:, a2, a1, axis], frequency / constants.c.value)
-                    cuvw[rows, axis] = average_from_grid(uvwgrid).flatten()
+    return cvis, cuvw, cwts, ctime, cfrequency, cchannel_bandwidth, ca1, ca2, cintegration_time, cindex.flatten()
 
-                # For some variables, we need the sum not the average
-                def sum_from_grid(arr):
-                    result = average_chunks2(arr, allpwtsgrid[:, a2, a1, :],
-                                             (time_average[a2, a1], frequency_average[a2, a1]))
-                    return result[0] * result[0].size
 
-                cintegration_time[rows] = sum_from_grid(integration_time_grid).flatten()
-                cchannel_bandwidth[rows] = sum_from_grid(channel_bandwidth_grid).flatten()
+def _average_blocks(arr, wts, time_average, frequency_average):
+    """ Weighted average over blocks of time_average by frequency_average samples
 
-                # For the polarisations we have to perform the time-frequency average separately for each polarisation
-                for pol in range(npol):
-                    result = average_chunks2(vis[:, a2, a1, :, pol], wts[:, a2, a1, :, pol],
-                                             (time_average[a2, a1], frequency_average[a2, a1]))
-                    cvis[rows, pol], cwts[rows, pol] = result[0].flatten(), result[1].flatten()
+    This is average_chunks2 for many baselines at once.
 
-                visstart += nrows
+    :param arr: Values [nbaselines, ntimes, nchan, ...]
+    :param wts: Weights with the same shape as arr
+    :param time_average: Averaging factor along the time axis
+    :param frequency_average: Averaging factor along the channel axis
+    :return: averaged values [nbaselines, ntimechunks, nchanchunks, ...], summed weights
+    """
+    if time_average <= 1 and frequency_average <= 1:
+        return arr, wts
 
-    assert cnvis == visstart, "Mismatch between number of rows in coalesced visibility and index"
+    def sum_blocks(a):
+        if time_average > 1:
+            a = numpy.add.reduceat(a, numpy.arange(0, a.shape[1], time_average), axis=1)
+        if frequency_average > 1:
+            a = numpy.add.reduceat(a, numpy.arange(0, a.shape[2], frequency_average), axis=2)
+        return a
 
-    return cvis, cuvw, cwts, ctime, cfrequency, cchannel_bandwidth, ca1, ca2, cintegration_time, cindex
+    chunks = sum_blocks(wts * arr)
+    weights = sum_blocks(wts)
+    mask = weights > 0.0
+    chunks[mask] = chunks[mask] / weights[mask]
+    return chunks, weights
 
 
 def convert_blocks(vis, uvw, wts, times, integration_time, frequency, channel_bandwidth):
@@ -275,55 +272,33 @@ def convert_blocks(vis, uvw, wts, times, integration_time, frequency, channel_ba
     # into rows like vis[npol] and with additional columns antenna1, antenna2, frequency
 
     ntimes, nant, _, nchan, npol = vis.shape
+    frequency = numpy.array(frequency)
     assert nchan == len(frequency)
 
-    cnvis = ntimes * nant * (nant - 1) * nchan // 2
+    # The rows are ordered by time, then baseline (a1 < a2), then channel
+    a1, a2 = numpy.triu_indices(nant, 1)
+    nbaselines = len(a1)
+    cnvis = ntimes * nbaselines * nchan
 
-    # Now we know enough to define the output coalesced arrays. The shape will be
-    # succesive a1, a2: [len_time_chunks[a2,a1], a2, a1, len_frequency_chunks[a2,a1]]
-    ctime = numpy.zeros([cnvis])
-    cfrequency = numpy.zeros([cnvis])
-    cchannel_bandwidth = numpy.zeros([cnvis])
-    cvis = numpy.zeros([cnvis, npol], dtype='complex')
-    cwts = numpy.zeros([cnvis, npol])
-    cuvw = numpy.zeros([cnvis, 3])
-    ca1 = numpy.zeros([cnvis], dtype='int')
-    ca2 = numpy.zeros([cnvis], dtype='int')
-    cintegration_time = numpy.zeros([cnvis])
-
-    # For decoalescence we keep an index to map back to the original BlockVisibility
-    rowgrid = numpy.zeros([ntimes, nant, nant, nchan], dtype='int')
-    rowgrid.flat = range(rowgrid.size)
-
-    cindex = numpy.zeros([rowgrid.size], dtype='int')
+    ca1 = numpy.tile(numpy.repeat(a1, nchan), ntimes)
+    ca2 = numpy.tile(numpy.repeat(a2, nchan), ntimes)
+    cfrequency = numpy.tile(frequency, ntimes * nbaselines)
+    cchannel_bandwidth = numpy.tile(numpy.array(channel_bandwidth), ntimes * nbaselines)
+    ctime = numpy.repeat(numpy.array(times), nbaselines * nchan)
+    cintegration_time = numpy.repeat(numpy.array(integration_time), nbaselines * nchan)
 
-    # Now go through, chunking up the various arrays. Everything is converted into an array with
-    # axes [time, channel] and then it is averaged over time and frequency chunks for
-    # this baseline.
-    # To aid decoalescence we will need an index of which output elements a given input element
-    # contributes to. This is a many to one. The decoalescence will then just consist of using
-    # this index to extract the coalesced value that a given input element contributes towards.
+    # The advanced indices are adjacent so the baseline axis stays in place: [ntimes, nbaselines, ...]
+    cuvw = (uvw[:, a2, a1, :][:, :, numpy.newaxis, :] *
+            (frequency / constants.c.value)[numpy.newaxis, numpy.newaxis, :, numpy.newaxis]).reshape([cnvis, 3])
+    cvis = vis[:, a2, a1, ...].reshape([cnvis, npol])
+    cwts = wts[:, a2, a1, ...].reshape([cnvis, npol])
 
-    row = 0
-    for itime in range(ntimes):
-        for a1 in range(nant):
-            for a2 in range(a1 + 1, nant):
-                for chan in range(nchan):
-                    ca1[row] = a1
-                    ca2[row] = a2
-                    cfrequency[row] = frequency[chan]
-                    ctime[row] = times[itime]
+    # For decoalescence we keep an index to map back to the original BlockVisibility: for every
+    # element [time, a2, a1, chan] the row it was converted into
+    cindex = numpy.zeros([ntimes, nant, nant, nchan], dtype='int')
+    cindex[:, a2, a1, :] = numpy.arange(cnvis).reshape([ntimes, nbaselines, nchan])
 
-                    cuvw[row, :] = uvw[itime, a2, a1, :] * frequency[chan] / constants.c.value
-
-                    cindex.flat[rowgrid[itime, a2, a1, chan]] = row
-                    cintegration_time[row] = integration_time[itime]
-                    cchannel_bandwidth[row] = channel_bandwidth[chan]
-                    cvis[row, :] = vis[itime, a2, a1, chan, :]
-                    cwts[row, :] = wts[itime, a2, a1, chan, :]
-                    row += 1
-
-    return cvis, cuvw, cwts, ctime, cfrequency, cchannel_bandwidth, ca1, ca2, cintegration_time, cindex
+    return cvis, cuvw, cwts, ctime, cfrequency, cchannel_bandwidth, ca1, ca2, cintegration_time, cindex.flatten()
 
 
 def decoalesce_vis(vshape, cvis, cindex):
@@ -337,13 +312,9 @@ def decoalesce_vis(vshape, cvis, cindex):
     :param cindex: Index array from coalescence
     :return: uncoalesced vis
     """
-    npol = vshape[-1]
-    dvis = numpy.zeros(vshape, dtype='complex')
-    assert numpy.max(cindex) < dvis.size
-    for i in range(dvis.size // npol):
-        dvis.flat[i:i + npol] = cvis[cindex[i]]
-
-    return dvis
+    assert len(cindex) * vshape[-1] == numpy.prod(vshape)
+    assert numpy.max(cindex) < cvis.shape[0]
+    return numpy.array(cvis[cindex].reshape(vshape), dtype='complex')
 
 
 def convert_visibility_to_blockvisibility(vis: Visibility) -> BlockVisibility:
@@ -114,7 +114,7 @@ def visibility_scatter_channel(vis: BlockVisibility, **kwargs) -> List[Visibilit
                               vis=v.vis[..., chan, :][..., numpy.newaxis, :],
                               weight=v.weight[..., chan, :][..., numpy.newaxis, :],
                               integration_time=v.integration_time,
-                              polarisation_frame=v.polarisation_frame)
+                              polarisation_frame=v.polarisation_frame, columnar=v.columnar)
         return vis
     
     return [extract_channel(vis, channel) for channel, _ in enumerate(vis.frequency)]
@@ -148,7 +148,7 @@ def visibility_gather_channel(vis_list: List[Visibility], vis: Visibility = None
                               vis=numpy.zeros(vis_shape, dtype=vis_list[0].vis.dtype),
                               weight=numpy.ones(vis_shape, dtype=vis_list[0].weight.dtype),
                               integration_time=vis_list[0].integration_time,
-                              polarisation_frame=vis_list[0].polarisation_frame)
+                              polarisation_frame=vis_list[0].polarisation_frame, columnar=vis_list[0].columnar)
     
     assert len(vis.frequency) == len(vis_list)
     
@@ -8,7 +8,7 @@ from typing import Union
 import numpy
 from astropy.coordinates import SkyCoord
 
-from arl.data.data_models import BlockVisibility, Visibility, QA
+from arl.data.data_models import BlockVisibility, Visibility, QA, ColumnTable
 from arl.imaging.params import get_frequency_map
 from arl.util.coordinate_support import skycoord_to_lmn, simulate_point
 from arl.visibility.base import copy_visibility
@@ -16,6 +16,14 @@ from arl.visibility.base import copy_visibility
 log = logging.getLogger(__name__)
 
 
+def _hstack_data(data, otherdata):
+    """ Append the rows of otherdata to data, for structured arrays or ColumnTables
+    """
+    if isinstance(data, ColumnTable):
+        return data.hstack(otherdata)
+    return numpy.hstack((data, otherdata))
+
+
 def append_visibility(vis: Union[Visibility, BlockVisibility], othervis: Union[Visibility, BlockVisibility]) \
         -> Union[Visibility, BlockVisibility]:
     """Append othervis to vis
@@ -33,7 +41,7 @@ def append_visibility(vis: Union[Visibility, BlockVisibility], othervis: Union[V
     assert abs(vis.phasecentre.ra.value - othervis.phasecentre.ra.value) < 1e-15
     assert abs(vis.phasecentre.dec.value - othervis.phasecentre.dec.value) < 1e-15
     assert vis.phasecentre.separation(othervis.phasecentre).value < 1e-15
-    vis.data = numpy.hstack((vis.data, othervis.data))
+    vis.data = _hstack_data(vis.data, othervis.data)
     return vis
 
 
@@ -44,7 +52,10 @@ def sort_visibility(vis, order=['index']):
     :param order: Array of string of column to be used for sortin
     :return:
     """
-    vis.data = numpy.sort(vis.data, order=order)
+    if isinstance(vis.data, ColumnTable):
+        vis.data = vis.data.sort(order)
+    else:
+        vis.data = numpy.sort(vis.data, order=order)
     return vis
 
 
@@ -66,7 +77,7 @@ def concatenate_visibility(vis_list, sort=True):
         else:
             assert v.polarisation_frame == vis.polarisation_frame
             assert v.phasecentre.separation(vis.phasecentre).value < 1e-15
-            vis.data = numpy.hstack((vis.data, v.data))
+            vis.data = _hstack_data(vis.data, v.data)
     
     assert vis is not None
     
@@ -236,7 +247,7 @@ def divide_visibility(vis: BlockVisibility, modelvis: BlockVisibility):
     pointsource_vis = BlockVisibility(data=None, frequency=vis.frequency, channel_bandwidth=vis.channel_bandwidth,
                                       phasecentre=vis.phasecentre, configuration=vis.configuration,
                                       uvw=vis.uvw, time=vis.time, integration_time=vis.integration_time, vis=x,
-                                      weight=xwt)
+                                      weight=xwt, columnar=vis.columnar)
     return pointsource_vis
 
 
@@ -262,7 +273,7 @@ def integrate_visibility_by_channel(vis: BlockVisibility) -> BlockVisibility:
                              vis=numpy.zeros(vis_shape, dtype='complex'),
                              weight=numpy.ones(vis_shape, dtype='float'),
                              integration_time=vis.integration_time,
-                             polarisation_frame=vis.polarisation_frame)
+                             polarisation_frame=vis.polarisation_frame, columnar=vis.columnar)
     
     newvis.data['vis'][..., 0, :] = numpy.sum(vis.data['vis'] * vis.data['weight'], axis=-2)
     newvis.data['weight'][..., 0, :] = numpy.sum(vis.data['weight'], axis=-2)
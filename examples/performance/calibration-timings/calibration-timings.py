@@ -0,0 +1,79 @@
+"""
+Compare the convergence and times of the iterative substitution and StefCal gain solvers.
+
+    - Simulates a LOW observation of a point source for stations up to a range of radii
+    - Corrupts the visibility with random phase errors
+    - Solves with solve_antenna_gains_itsubs_scalar for each interval and with both batch solvers
+
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.join('..', '..', '..'))
+
+import numpy
+
+from astropy.coordinates import SkyCoord
+from astropy import units as u
+from arl.calibration.operations import apply_gaintable, create_gaintable_from_blockvisibility
+from arl.calibration.solvers import point_source_equivalents, solve_antenna_gains_itsubs_scalar, \
+    solve_antenna_gains_itsubs_batch, solve_antenna_gains_stefcal_batch
+from arl.data.polarisation import PolarisationFrame
+from arl.util.testing_support import create_named_configuration, simulate_gaintable
+from arl.visibility.base import create_blockvisibility
+
+import logging
+
+log = logging.getLogger()
+log.setLevel(logging.INFO)
+log.addHandler(logging.StreamHandler(sys.stdout))
+
+if __name__ == '__main__':
+    
+    rmax_range = [300.0, 750.0, 1.5e3]
+    niter_range = [4, 8, 16, 32]
+    
+    nfreqwin = 8
+    ntimes = 16
+    frequency = numpy.linspace(0.8e8, 1.2e8, nfreqwin)
+    channel_bandwidth = numpy.array(nfreqwin * [frequency[1] - frequency[0]])
+    times = numpy.linspace(-numpy.pi / 3.0, numpy.pi / 3.0, ntimes)
+    phasecentre = SkyCoord(ra=+30.0 * u.deg, dec=-60.0 * u.deg, frame='icrs', equinox='J2000')
+    
+    print("%10s %10s %6s %14s %10s %14s %10s %14s %10s" % ('rmax', 'nants', 'niter', 'itsubs resid', 'time (s)',
+                                                         'batch resid', 'time (s)', 'stefcal resid', 'time (s)'))
+    for rmax in rmax_range:
+        config = create_named_configuration('LOWBD2', rmax=rmax)
+        vis = create_blockvisibility(config, times, frequency, phasecentre=phasecentre, weight=1.0,
+                                     polarisation_frame=PolarisationFrame('stokesI'),
+                                     channel_bandwidth=channel_bandwidth)
+        vis.data['vis'][...] = 1.0
+        gt = create_gaintable_from_blockvisibility(vis)
+        gt = simulate_gaintable(gt, phase_error=1.0, amplitude_error=0.1)
+        vis = apply_gaintable(vis, gt)
+        x, xwt, rows = point_source_equivalents(vis, None, gt)
+        gainshape = gt.gain.shape
+        
+        for niter in niter_range:
+            start = time.time()
+            residual = 0.0
+            for row in rows:
+                _, _, rresidual = solve_antenna_gains_itsubs_scalar(gainshape[1:], x[row].copy(), xwt[row].copy(),
+                                                                    phase_only=False, niter=niter, tol=0.0)
+                residual = max(residual, numpy.max(rresidual))
+            itsubs_time = time.time() - start
+            
+            start = time.time()
+            _, _, batch_residual = solve_antenna_gains_itsubs_batch(gainshape, x, xwt, phase_only=False,
+                                                                    niter=niter, tol=0.0)
+            batch_time = time.time() - start
+            
+            start = time.time()
+            _, _, stefcal_residual = solve_antenna_gains_stefcal_batch(gainshape, x, xwt, phase_only=False,
+                                                                       niter=niter, tol=0.0)
+            stefcal_time = time.time() - start
+            
+            print("%10.1f %10d %6d %14.3g %10.3f %14.3g %10.3f %14.3g %10.3f" %
+                  (rmax, vis.nants, niter, residual, itsubs_time, numpy.max(batch_residual), batch_time,
+                   numpy.max(stefcal_residual), stefcal_time))
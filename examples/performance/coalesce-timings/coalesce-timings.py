@@ -0,0 +1,64 @@
+"""
+Compare the times of the vectorised and the per-baseline versions of average_in_blocks.
+
+    - The per-baseline version is the reference in tests/test_visibility_coalesce.py
+
+    - Simulates a LOW observation for stations up to a range of radii
+    - Coalesces the BlockVisibility with both versions and checks that the rows agree
+
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.join('..', '..', '..'))
+
+import numpy
+
+from astropy.coordinates import SkyCoord
+from astropy import units as u
+from arl.data.polarisation import PolarisationFrame
+from arl.util.testing_support import create_named_configuration
+from arl.visibility.base import create_blockvisibility
+from arl.visibility.coalesce import average_in_blocks
+from tests.test_visibility_coalesce import average_in_blocks_reference
+
+import logging
+
+log = logging.getLogger()
+log.setLevel(logging.INFO)
+log.addHandler(logging.StreamHandler(sys.stdout))
+
+if __name__ == '__main__':
+    
+    rmax_range = [300.0, 750.0, 1.5e3]
+    
+    nfreqwin = 8
+    ntimes = 32
+    frequency = numpy.linspace(0.8e8, 1.2e8, nfreqwin)
+    channel_bandwidth = numpy.array(nfreqwin * [frequency[1] - frequency[0]])
+    times = numpy.linspace(-numpy.pi / 3.0, numpy.pi / 3.0, ntimes)
+    phasecentre = SkyCoord(ra=+30.0 * u.deg, dec=-60.0 * u.deg, frame='icrs', equinox='J2000')
+    
+    print("%10s %10s %12s %12s %10s %8s" % ('rmax', 'nants', 'rows', 'loop (s)', 'vector (s)', 'speedup'))
+    for rmax in rmax_range:
+        config = create_named_configuration('LOWBD2', rmax=rmax)
+        vis = create_blockvisibility(config, times, frequency, phasecentre=phasecentre, weight=1.0,
+                                     polarisation_frame=PolarisationFrame('stokesI'),
+                                     channel_bandwidth=channel_bandwidth)
+        args = (vis.vis, vis.uvw, vis.weight, vis.time, vis.integration_time, vis.frequency,
+                vis.channel_bandwidth, 1.0, 100, 1.0, 100)
+        
+        start = time.time()
+        expected = average_in_blocks_reference(*args)
+        loop_time = time.time() - start
+        
+        start = time.time()
+        result = average_in_blocks(*args)
+        vector_time = time.time() - start
+        
+        for col, ecol in zip(result[:-1], expected[:-1]):
+            numpy.testing.assert_allclose(col, ecol, rtol=1e-12, atol=1e-12)
+        
+        print("%10.1f %10d %12d %12.3f %10.3f %8.1f" % (rmax, vis.nants, result[0].shape[0], loop_time,
+                                                        vector_time, loop_time / vector_time))
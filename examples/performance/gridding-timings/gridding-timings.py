@@ -0,0 +1,71 @@
+"""
+Measure the time and peak memory of threaded gridding.
+
+    - Grids random visibilities with each gridder, in one thread and with nthreads threads sharding by rows
+      (threaded_grid, one private grid per thread) or by uv tiles (tiled_grid)
+    - Peak memory is measured with tracemalloc, which traces the numpy allocations, and is given in units of
+      the grid size
+
+"""
+import os
+import sys
+import time
+import tracemalloc
+import importlib.util
+
+sys.path.append(os.path.join('..', '..', '..'))
+
+import numpy
+
+from arl.fourier_transforms.convolutional_gridding import anti_aliasing_calculate, convolutional_grid, \
+    threaded_grid
+
+
+def measure(f, *args, **kwargs):
+    """ Peak memory and time of f(*args, **kwargs)
+
+    """
+    tracemalloc.start()
+    start = time.time()
+    f(*args, **kwargs)
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+if __name__ == '__main__':
+
+    npixel = 2048
+    nvis = 200000
+    npol = 1
+    nthreads = 4
+    numpy.random.seed(180555)
+    uvcoords = numpy.random.uniform(-0.25, 0.25, [nvis, 2])
+    vis = numpy.random.uniform(size=[nvis, npol]) + 1j * numpy.random.uniform(size=[nvis, npol])
+    visweights = numpy.random.uniform(size=[nvis, npol])
+    frequencymap = numpy.zeros([nvis], dtype='int')
+    _, kernel = anti_aliasing_calculate((npixel, npixel), 8)
+    kernels = (numpy.zeros([nvis], dtype='int'), [kernel])
+    gridbytes = npol * npixel * npixel * numpy.dtype('complex').itemsize
+
+    gridders = ['numpy', 'tiled']
+    if importlib.util.find_spec('numba') is not None:
+        gridders.append('numba')
+        # Compile the gridding loops before timing
+        convolutional_grid(kernels, numpy.zeros([1, npol, 64, 64], dtype='complex'), vis[:10],
+                           visweights[:10], uvcoords[:10] / 32, frequencymap[:10], gridder='numba')
+
+    print("%8s %8s %8s %10s %10s" % ('gridder', 'shard', 'nthreads', 'time (s)', 'peak'))
+    for gridder in gridders:
+        peak, elapsed = measure(convolutional_grid, kernels, numpy.zeros([1, npol, npixel, npixel], dtype='complex'),
+                                vis, visweights, uvcoords, frequencymap, gridder=gridder)
+        print("%8s %8s %8d %10.3f %10.2f" % (gridder, '-', 1, elapsed, peak / gridbytes))
+        # Call threaded_grid directly since convolutional_grid only shards by rows for gridder='numba'
+        peak, elapsed = measure(threaded_grid, kernels, numpy.zeros([1, npol, npixel, npixel], dtype='complex'),
+                                vis, visweights, uvcoords, frequencymap, nthreads=nthreads, gridder=gridder)
+        print("%8s %8s %8d %10.3f %10.2f" % (gridder, 'rows', nthreads, elapsed, peak / gridbytes))
+        peak, elapsed = measure(convolutional_grid, kernels, numpy.zeros([1, npol, npixel, npixel], dtype='complex'),
+                                vis, visweights, uvcoords, frequencymap, gridder=gridder, nthreads=nthreads,
+                                shard='tiles')
+        print("%8s %8s %8d %10.3f %10.2f" % (gridder, 'tiles', nthreads, elapsed, peak / gridbytes))
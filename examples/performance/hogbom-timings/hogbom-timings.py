@@ -0,0 +1,37 @@
+"""
+Measure the time of the Hogbom minor cycle with and without the tile maxima.
+
+    - Cleans a noise image with a Gaussian PSF for a range of image and PSF sizes
+    - hogbom keeps the tile maxima only if the PSF is at most a quarter of the image on each axis. A tilesize as
+      large as the image switches them off, so both searches can be timed for every size
+
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.join('..', '..', '..'))
+
+import numpy
+
+from arl.image.cleaners import hogbom
+
+if __name__ == '__main__':
+    
+    niter = 500
+    tilesize = 64
+    numpy.random.seed(180555)
+    
+    print("%8s %8s %12s %12s" % ('npixel', 'psf', 'tiles (s)', 'full (s)'))
+    for npixel in [256, 512, 1024]:
+        dirty = numpy.random.normal(size=[npixel, npixel])
+        for npsf in [npixel, npixel // 2, npixel // 4, npixel // 8]:
+            y, x = numpy.mgrid[-npsf // 2:npsf // 2, -npsf // 2:npsf // 2]
+            psf = numpy.exp(-(x ** 2 + y ** 2) / 8.0) + 0.01 * numpy.cos(x / 3.0)
+            start = time.time()
+            hogbom(dirty, psf, None, 0.1, 0.0, niter, 0.0, tilesize=tilesize)
+            tiles = time.time() - start
+            start = time.time()
+            hogbom(dirty, psf, None, 0.1, 0.0, niter, 0.0, tilesize=npixel)
+            full = time.time() - start
+            print("%8d %8d %12.3f %12.3f" % (npixel, npsf, tiles, full))
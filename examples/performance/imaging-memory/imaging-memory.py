@@ -0,0 +1,82 @@
+"""
+Measure the peak memory of the transforms in predict_2d_base and invert_2d_base.
+
+    - For a range of image sizes, compares the previous expressions (pad, multiply, cast, shift and transform,
+      each making a full size temporary) with the in-place pipeline (insert_mid and fft/ifft with overwrite=True)
+    - Peak memory is measured with tracemalloc, which traces the numpy allocations. Each function is called once
+      before measuring so that the cached checkerboards (and pyfftw plans) are not counted
+    - The FFT backend is set by the environment variable ARL_FFT_BACKEND. For numpy < 2.0 the numpy backend cannot
+      transform in place, so the new pipeline saves less
+
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join('..', '..', '..'))
+
+import numpy
+
+from arl.fourier_transforms.fft_support import fft, ifft, pad_mid, extract_mid, insert_mid, get_fft_backend
+
+
+def old_predict(model, gcf, npixel):
+    return numpy.fft.fftshift(numpy.fft.fft2(numpy.fft.ifftshift((pad_mid(model, npixel) * gcf).astype('complex'),
+                                                                 axes=[2, 3])), axes=[2, 3])
+
+
+def new_predict(model, gcf, npixel):
+    nchan, npol, _, _ = model.shape
+    uvgrid = numpy.zeros([nchan, npol, npixel, npixel], dtype='complex')
+    return fft(insert_mid(uvgrid, model, gcf), overwrite=True)
+
+
+def old_invert(imgridpad, gcf, nx):
+    return extract_mid(numpy.real(numpy.fft.fftshift(numpy.fft.ifft2(numpy.fft.ifftshift(imgridpad, axes=[2, 3])),
+                                                     axes=[2, 3])) * gcf, npixel=nx)
+
+
+def new_invert(imgridpad, gcf, nx):
+    return extract_mid(ifft(imgridpad, overwrite=True), npixel=nx).real * extract_mid(gcf, npixel=nx)
+
+
+def measure(f, *args):
+    """ Peak memory (in units of the padded grid size) and time of f(*args)
+
+    """
+    f(*args)
+    tracemalloc.start()
+    start = time.time()
+    f(*args)
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+if __name__ == '__main__':
+    
+    npixel_range = [512, 1024, 2048]
+    padding = 2
+    nchan, npol = 1, 1
+    
+    print("numpy %s, FFT backend %s" % (numpy.__version__, get_fft_backend()[0]))
+    print("%8s %12s %12s %10s %12s %10s" % ('npixel', 'grid (MB)', 'old peak', 'time (s)', 'new peak', 'time (s)'))
+    for npixel in npixel_range:
+        npad = padding * npixel
+        gridbytes = nchan * npol * npad * npad * numpy.dtype('complex').itemsize
+        model = numpy.random.random_sample([nchan, npol, npixel, npixel])
+        gcf = numpy.random.random_sample([npad, npad])
+        
+        old_peak, old_time = measure(old_predict, model, gcf, npad)
+        new_peak, new_time = measure(new_predict, model, gcf, npad)
+        print("%8d %12.1f %12.2f %10.3f %12.2f %10.3f   %s" % (npixel, gridbytes / 1024 ** 2, old_peak / gridbytes,
+                                                             old_time, new_peak / gridbytes, new_time, 'predict'))
+        
+        imgridpad = numpy.random.random_sample([nchan, npol, npad, npad]).astype('complex')
+        old_peak, old_time = measure(old_invert, imgridpad, gcf, npixel)
+        # The new invert transforms in place so the grid allocation is not counted
+        new_peak, new_time = measure(new_invert, imgridpad, gcf, npixel)
+        print("%8d %12.1f %12.2f %10.3f %12.2f %10.3f   %s" % (npixel, gridbytes / 1024 ** 2, old_peak / gridbytes,
+                                                             old_time, new_peak / gridbytes, new_time, 'invert'))
@@ -10,7 +10,7 @@ import unittest
 from astropy.coordinates import SkyCoord
 import astropy.units as u
 from arl.calibration.operations import gaintable_summary, apply_gaintable, create_gaintable_from_blockvisibility, \
-    create_gaintable_from_rows
+    create_gaintable_from_rows, invert_jones
 
 from arl.data.data_models import Skycomponent
 from arl.data.polarisation import PolarisationFrame
@@ -111,6 +111,14 @@ class TestCalibrationOperations(unittest.TestCase):
             error = numpy.max(numpy.abs(vis.vis - original.vis))
             assert error < 1e-12, "Error = %s" % (error)
 
+    def test_invert_jones(self):
+        jones = numpy.random.normal(size=[5, 3, 2, 2]) + 1j * numpy.random.normal(size=[5, 3, 2, 2])
+        jones[0, 0] = numpy.array([[1.0, 2.0], [2.0, 4.0]])
+        inverse, valid = invert_jones(jones)
+        assert not valid[0, 0]
+        assert numpy.sum(valid) == 14
+        numpy.testing.assert_allclose(inverse[valid], numpy.linalg.inv(jones[valid]), atol=1e-12)
+
     def test_apply_gaintable_null(self):
         for spf, dpf in[('stokesI', 'stokesI'), ('stokesIQUV', 'linear'), ('stokesIQUV', 'circular')]:
             self.actualSetup(spf, dpf)
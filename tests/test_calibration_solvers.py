@@ -14,7 +14,8 @@ from arl.data.polarisation import PolarisationFrame
 
 from arl.calibration.operations import apply_gaintable, create_gaintable_from_blockvisibility, gaintable_summary, \
     qa_gaintable
-from arl.calibration.solvers import solve_gaintable
+from arl.calibration.solvers import solve_gaintable, point_source_equivalents, \
+    solve_antenna_gains_itsubs_batch, solve_antenna_gains_itsubs_vector, solve_antenna_gains_stefcal_batch
 from arl.util.testing_support import create_named_configuration, simulate_gaintable
 from arl.visibility.operations import divide_visibility
 from arl.visibility.base import copy_visibility, create_blockvisibility
@@ -92,7 +93,8 @@ class TestCalibrationSolvers(unittest.TestCase):
         assert numpy.max(numpy.abs(gtsol.gain - 1.0)) > 0.1
 
     def core_solve(self, spf, dpf, phase_error=0.1, amplitude_error=0.0, leakage=0.0,
-                   phase_only=True, niter=200, crosspol=False, residual_tol=1e-6, f=None, vnchan=3):
+                   phase_only=True, niter=200, crosspol=False, residual_tol=1e-6, f=None, vnchan=3,
+                   solver='itsubs'):
         if f is None:
             f = [100.0, 50.0, -10.0, 40.0]
         self.actualSetup(spf, dpf, f=f, vnchan=vnchan)
@@ -101,7 +103,8 @@ class TestCalibrationSolvers(unittest.TestCase):
         gt = simulate_gaintable(gt, phase_error=phase_error, amplitude_error=amplitude_error, leakage=leakage)
         original = copy_visibility(self.vis)
         vis = apply_gaintable(self.vis, gt)
-        gtsol = solve_gaintable(self.vis, original, phase_only=phase_only, niter=niter, crosspol=crosspol, tol=1e-6)
+        gtsol = solve_gaintable(self.vis, original, phase_only=phase_only, niter=niter, crosspol=crosspol, tol=1e-6,
+                                solver=solver)
         vis = apply_gaintable(vis, gtsol, inverse=True)
         residual = numpy.max(gtsol.residual)
         assert residual < residual_tol, "%s %s Max residual = %s" % (spf, dpf, residual)
@@ -147,7 +150,79 @@ class TestCalibrationSolvers(unittest.TestCase):
                         leakage=0.01, residual_tol=1e-3, crosspol=True, vnchan=16,
                         phase_only=False, f=[100.0, 0.0, 0.0, 50.0])
 
+    def test_solve_gaintable_stefcal_scalar(self):
+        self.actualSetup('stokesI', 'stokesI', f=[100.0])
+        gt = create_gaintable_from_blockvisibility(self.vis)
+        gt = simulate_gaintable(gt, phase_error=10.0, amplitude_error=0.01)
+        original = copy_visibility(self.vis)
+        self.vis = apply_gaintable(self.vis, gt)
+        gtsol = solve_gaintable(self.vis, original, phase_only=False, niter=200, solver='stefcal')
+        residual = numpy.max(gtsol.residual)
+        assert residual < 3e-8, "Max residual = %s" % (residual)
+        gtitsubs = solve_gaintable(self.vis, original, phase_only=False, niter=200)
+        numpy.testing.assert_array_almost_equal(gtsol.gain, gtitsubs.gain, 6)
+        numpy.testing.assert_array_almost_equal(gtsol.weight, gtitsubs.weight, 6)
+
+    def test_solve_gaintable_stefcal_vector_both_linear(self):
+        self.core_solve('stokesIQUV', 'linear', phase_error=0.1, amplitude_error=0.01,
+                        phase_only=False, f=[100.0, 50.0, 0.0, 0.0], solver='stefcal')
 
+    def test_solve_gaintable_stefcal_matrix_both_circular(self):
+        # For an unpolarised source the point source equivalents are exactly J_a J_b^H
+        self.core_solve('stokesIQUV', 'circular', phase_error=0.1, amplitude_error=0.01,
+                        leakage=0.01, residual_tol=1e-3, crosspol=True,
+                        phase_only=False, f=[100.0, 0.0, 0.0, 0.0], solver='stefcal')
+
+    def test_solve_antenna_gains_stefcal_leakage(self):
+        # Point source equivalents X_ba = J_a J_b^H for known Jones matrices with leakage
+        numpy.random.seed(180555)
+        ntimes, nants, nchan = 2, 12, 3
+        jones = numpy.zeros([ntimes, nants, nchan, 2, 2], dtype='complex')
+        jones[..., 0, 0] = (1.0 + 0.1 * numpy.random.randn(ntimes, nants, nchan)) * \
+                           numpy.exp(1j * numpy.random.uniform(-1.0, 1.0, [ntimes, nants, nchan]))
+        jones[..., 1, 1] = (1.0 + 0.1 * numpy.random.randn(ntimes, nants, nchan)) * \
+                           numpy.exp(1j * numpy.random.uniform(-1.0, 1.0, [ntimes, nants, nchan]))
+        jones[..., 0, 1] = 0.05 * (numpy.random.randn(ntimes, nants, nchan) +
+                                   1j * numpy.random.randn(ntimes, nants, nchan))
+        jones[..., 1, 0] = 0.05 * (numpy.random.randn(ntimes, nants, nchan) +
+                                   1j * numpy.random.randn(ntimes, nants, nchan))
+        model = numpy.einsum('tacij,tbckj->tbacik', jones, numpy.conjugate(jones))
+        # Only the baselines antenna2 > antenna1 are present, as in a BlockVisibility
+        ant1, ant2 = numpy.triu_indices(nants, 1)
+        x = numpy.zeros([ntimes, nants, nants, nchan, 4], dtype='complex')
+        xwt = numpy.zeros([ntimes, nants, nants, nchan, 4])
+        x[:, ant2, ant1] = model[:, ant2, ant1].reshape([ntimes, len(ant1), nchan, 4])
+        xwt[:, ant2, ant1] = 1.0
+        gain, gwt, residual = solve_antenna_gains_stefcal_batch(jones.shape, x, xwt, phase_only=False, niter=500,
+                                                                tol=1e-12, crosspol=True)
+        assert numpy.max(residual) < 1e-8, numpy.max(residual)
+        # The solution is unique up to J_a U for a unitary U, so compare J_a J_0^-1
+        inverse = numpy.linalg.inv(jones[:, 0:1])
+        solinverse = numpy.linalg.inv(gain[:, 0:1])
+        numpy.testing.assert_allclose(numpy.matmul(gain, solinverse), numpy.matmul(jones, inverse), atol=1e-8)
+        # A wrong solution gives a large residual
+        _, _, residual = solve_antenna_gains_stefcal_batch(jones.shape, x, xwt, phase_only=False, niter=1,
+                                                           crosspol=True)
+        assert numpy.max(residual) > 1e-3, numpy.max(residual)
+
+    def test_solve_gaintable_batch_matches_interval(self):
+        self.actualSetup('stokesIQUV', 'linear', f=[100.0, 50.0, 0.0, 0.0])
+        gt = create_gaintable_from_blockvisibility(self.vis)
+        gt = simulate_gaintable(gt, phase_error=0.1, amplitude_error=0.01)
+        original = copy_visibility(self.vis)
+        self.vis = apply_gaintable(self.vis, gt)
+        x, xwt, rows = point_source_equivalents(self.vis, original, gt)
+        assert len(rows) == gt.ntimes
+        gainshape = gt.gain.shape
+        gain, gwt, residual = solve_antenna_gains_itsubs_batch(gainshape, x.copy(), xwt.copy(), phase_only=False,
+                                                               niter=200, tol=1e-12)
+        for row in rows:
+            rgain, rgwt, rresidual = solve_antenna_gains_itsubs_vector(gainshape[1:], x[row].copy(),
+                                                                       xwt[row].copy(), phase_only=False,
+                                                                       niter=200, tol=1e-12)
+            numpy.testing.assert_array_almost_equal(gain[row], rgain, 7)
+            numpy.testing.assert_array_almost_equal(gwt[row], rgwt, 7)
+        assert numpy.max(residual) < 1e-6, numpy.max(residual)
 
 
 if __name__ == '__main__':
@@ -2,6 +2,7 @@
 
 
 """
+import importlib.util
 import random
 import unittest
 
@@ -10,7 +11,9 @@ from numpy.testing import assert_allclose
 
 from arl.fourier_transforms.convolutional_gridding import w_beam, coordinates, \
     coordinates2, coordinateBounds, anti_aliasing_calculate, \
-    convolutional_degrid, convolutional_grid
+    convolutional_degrid, convolutional_grid, tile_sort, weight_gridding, oversampled_kernel, batch_chunksize, \
+    frac_coord
+from arl.fourier_transforms.fft_support import ifft, pad_mid
 
 
 class TestConvolutionalGridding(unittest.TestCase):
@@ -49,6 +52,23 @@ class TestConvolutionalGridding(unittest.TestCase):
         self.assertAlmostEqualScalar(w_beam(10, 0.1, 100)[5, 5], 1)
         self.assertAlmostEqualScalar(w_beam(11, 0.1, 1000)[5, 5], 1)
     
+    def test_oversampled_kernel(self):
+        npixel = 64
+        screen = w_beam(npixel, 0.2, 50.0) / anti_aliasing_calculate((npixel, npixel))[0]
+        for oversampling in [1, 4]:
+            kernelwidth = 16
+            kernel = oversampled_kernel(screen, oversampling, kernelwidth)
+            assert kernel.shape == (oversampling, oversampling, kernelwidth, kernelwidth)
+            # Compare to the padded FFT as in w_kernel_list(method='fft')
+            npadded = oversampling * npixel
+            full = ifft(pad_mid(screen, npadded)) * oversampling ** 2
+            start = npadded // 2 - oversampling * kernelwidth // 2
+            end = npadded // 2 + oversampling * kernelwidth // 2
+            for yf in range(oversampling):
+                for xf in range(oversampling):
+                    expected = full[end + yf:start + yf:-oversampling, end + xf:start + xf:-oversampling]
+                    assert_allclose(kernel[yf, xf], expected, atol=1e-12 * numpy.max(numpy.abs(full)))
+    
     def test_convolutional_grid(self):
         npixel = 256
         nvis = 10000
@@ -92,6 +112,177 @@ class TestConvolutionalGridding(unittest.TestCase):
         assert vis.shape[0] == nvis
         assert vis.shape[1] == npol
 
+    @staticmethod
+    def _random_w_kernels(nkernels, oversampling=8, width=8):
+        kernels = numpy.random.uniform(size=[nkernels, oversampling, oversampling, width, width]) + \
+                  1j * numpy.random.uniform(size=[nkernels, oversampling, oversampling, width, width])
+        return list(kernels)
+    
+    @unittest.skipUnless(importlib.util.find_spec('numba'), "numba is not installed")
+    def test_convolutional_grid_numba(self):
+        npixel = 256
+        nvis = 10000
+        npol = 4
+        numpy.random.seed(180555)
+        uvcoords = numpy.random.uniform(-0.25, 0.25, [nvis, 2])
+        vis = numpy.random.uniform(size=[nvis, npol]) + 1j * numpy.random.uniform(size=[nvis, npol])
+        visweights = numpy.random.uniform(size=[nvis, npol])
+        frequencymap = numpy.random.randint(0, 2, [nvis])
+        _, kernel = anti_aliasing_calculate((npixel, npixel), 8)
+        for kernels in [(numpy.zeros([nvis], dtype='int'), [kernel]),
+                        (numpy.random.randint(0, 5, [nvis]), self._random_w_kernels(5))]:
+            uvgrid, sumwt = convolutional_grid(kernels, numpy.zeros([2, npol, npixel, npixel], dtype='complex'),
+                                               vis, visweights, uvcoords, frequencymap)
+            uvgrid_numba, sumwt_numba = convolutional_grid(kernels,
+                                                           numpy.zeros([2, npol, npixel, npixel], dtype='complex'),
+                                                           vis, visweights, uvcoords, frequencymap,
+                                                           gridder='numba')
+            assert_allclose(uvgrid, uvgrid_numba, atol=1e-12)
+            assert_allclose(sumwt, sumwt_numba, rtol=1e-12)
+    
+    @unittest.skipUnless(importlib.util.find_spec('numba'), "numba is not installed")
+    def test_convolutional_degrid_numba(self):
+        npixel = 256
+        nvis = 10000
+        npol = 4
+        numpy.random.seed(180555)
+        uvgrid = numpy.random.uniform(size=[2, npol, npixel, npixel]) + \
+                 1j * numpy.random.uniform(size=[2, npol, npixel, npixel])
+        uvcoords = numpy.random.uniform(-0.25, 0.25, [nvis, 2])
+        frequencymap = numpy.random.randint(0, 2, [nvis])
+        _, kernel = anti_aliasing_calculate((npixel, npixel), 8)
+        for kernels in [(numpy.zeros([nvis], dtype='int'), [kernel]),
+                        (numpy.random.randint(0, 5, [nvis]), self._random_w_kernels(5))]:
+            vis = convolutional_degrid(kernels, [nvis, npol], uvgrid, uvcoords, frequencymap)
+            vis_numba = convolutional_degrid(kernels, [nvis, npol], uvgrid, uvcoords, frequencymap,
+                                             gridder='numba')
+            assert_allclose(vis, vis_numba, rtol=1e-12)
+
+    def test_convolutional_degrid_batch(self):
+        npixel = 256
+        nvis = 10000
+        npol = 4
+        numpy.random.seed(180555)
+        uvgrid = numpy.random.uniform(size=[2, npol, npixel, npixel]) + \
+                 1j * numpy.random.uniform(size=[2, npol, npixel, npixel])
+        uvcoords = numpy.random.uniform(-0.25, 0.25, [nvis, 2])
+        frequencymap = numpy.random.randint(0, 2, [nvis])
+        _, kernel = anti_aliasing_calculate((npixel, npixel), 8)
+        for kernels in [(numpy.zeros([nvis], dtype='int'), [kernel]),
+                        (numpy.random.randint(0, 5, [nvis]), self._random_w_kernels(5))]:
+            vis = convolutional_degrid(kernels, [nvis, npol], uvgrid, uvcoords, frequencymap)
+            vis_batch = convolutional_degrid(kernels, [nvis, npol], uvgrid, uvcoords, frequencymap,
+                                             gridder='batch', chunksize=3000)
+            assert_allclose(vis, vis_batch, rtol=1e-12)
+            vis_batch = convolutional_degrid(kernels, [nvis, npol], uvgrid, uvcoords, frequencymap,
+                                             gridder='batch')
+            assert_allclose(vis, vis_batch, rtol=1e-12)
+
+    def test_batch_chunksize(self):
+        assert batch_chunksize(4, 8, 8) * 8 * 8 * (4 * 24 + 16) <= 64 * 1024 * 1024
+        assert batch_chunksize(4, 64, 64) == batch_chunksize(4, 8, 8) // 64
+        assert batch_chunksize(4, 8, 8, maxbytes=1) == 1
+
+    def test_tile_sort(self):
+        npixel = 256
+        nvis = 10000
+        numpy.random.seed(180555)
+        uvcoords = numpy.random.uniform(-0.25, 0.25, [nvis, 2])
+        frequencymap = numpy.random.randint(0, 2, [nvis])
+        perm, bounds, tiles = tile_sort([2, 1, npixel, npixel], uvcoords, frequencymap, tilesize=32)
+        assert numpy.array_equal(numpy.sort(perm), numpy.arange(nvis))
+        assert bounds[0] == 0 and bounds[-1] == nvis
+        assert len(tiles) == len(bounds) - 1
+        for tile, (chan, ty, tx) in enumerate(tiles):
+            rows = perm[bounds[tile]:bounds[tile + 1]]
+            assert (frequencymap[rows] == chan).all()
+            assert (numpy.floor(npixel // 2 + uvcoords[rows, 1] * npixel + 0.5) // 32 == ty).all()
+            assert (numpy.floor(npixel // 2 + uvcoords[rows, 0] * npixel + 0.5) // 32 == tx).all()
+    
+    def test_convolutional_grid_tiled(self):
+        npixel = 256
+        nvis = 10000
+        npol = 4
+        numpy.random.seed(180555)
+        uvcoords = numpy.random.uniform(-0.25, 0.25, [nvis, 2])
+        vis = numpy.random.uniform(size=[nvis, npol]) + 1j * numpy.random.uniform(size=[nvis, npol])
+        visweights = numpy.random.uniform(size=[nvis, npol])
+        frequencymap = numpy.random.randint(0, 2, [nvis])
+        _, kernel = anti_aliasing_calculate((npixel, npixel), 8)
+        for kernels in [(numpy.zeros([nvis], dtype='int'), [kernel]),
+                        (numpy.random.randint(0, 5, [nvis]), self._random_w_kernels(5, width=16))]:
+            uvgrid, sumwt = convolutional_grid(kernels, numpy.zeros([2, npol, npixel, npixel], dtype='complex'),
+                                               vis, visweights, uvcoords, frequencymap)
+            for tilesize in [16, 64]:
+                uvgrid_tiled, sumwt_tiled = convolutional_grid(kernels,
+                                                               numpy.zeros([2, npol, npixel, npixel], dtype='complex'),
+                                                               vis, visweights, uvcoords, frequencymap,
+                                                               gridder='tiled', tilesize=tilesize, chunksize=1000)
+                assert_allclose(uvgrid, uvgrid_tiled, atol=1e-12)
+                assert_allclose(sumwt, sumwt_tiled, rtol=1e-12)
+
+    def test_convolutional_grid_threaded(self):
+        npixel = 256
+        nvis = 10000
+        npol = 2
+        numpy.random.seed(180555)
+        uvcoords = numpy.random.uniform(-0.25, 0.25, [nvis, 2])
+        vis = numpy.random.uniform(size=[nvis, npol]) + 1j * numpy.random.uniform(size=[nvis, npol])
+        visweights = numpy.random.uniform(size=[nvis, npol])
+        frequencymap = numpy.random.randint(0, 2, [nvis])
+        kernels = (numpy.random.randint(0, 5, [nvis]), self._random_w_kernels(5))
+        uvgrid, sumwt = convolutional_grid(kernels, numpy.zeros([2, npol, npixel, npixel], dtype='complex'),
+                                           vis, visweights, uvcoords, frequencymap)
+        gridders = ['numpy', 'tiled']
+        if importlib.util.find_spec('numba') is not None:
+            gridders.append('numba')
+        for gridder in gridders:
+            for shard in ['rows', 'tiles']:
+                uvgrid_threaded, sumwt_threaded = \
+                    convolutional_grid(kernels, numpy.zeros([2, npol, npixel, npixel], dtype='complex'), vis,
+                                       visweights, uvcoords, frequencymap, gridder=gridder, tilesize=32,
+                                       nthreads=3, shard=shard)
+                assert_allclose(uvgrid, uvgrid_threaded, atol=1e-12)
+                assert_allclose(sumwt, sumwt_threaded, rtol=1e-12)
+        sort = tile_sort([2, npol, npixel, npixel], uvcoords, frequencymap, tilesize=32)
+        uvgrid_tiled, _ = convolutional_grid(kernels, numpy.zeros([2, npol, npixel, npixel], dtype='complex'),
+                                             vis, visweights, uvcoords, frequencymap, gridder='tiled', sort=sort,
+                                             tilesize=32)
+        uvgrid_threaded, _ = convolutional_grid(kernels, numpy.zeros([2, npol, npixel, npixel], dtype='complex'),
+                                                vis, visweights, uvcoords, frequencymap, gridder='tiled',
+                                                sort=sort, tilesize=32, nthreads=3, shard='tiles')
+        assert numpy.array_equal(uvgrid_tiled, uvgrid_threaded)
+        # An unknown shard is an error for every gridder and number of threads
+        for gridder in gridders:
+            for nthreads in [1, 3]:
+                with self.assertRaisesRegex(ValueError, "Unknown shard tile"):
+                    convolutional_grid(kernels, numpy.zeros([2, npol, npixel, npixel], dtype='complex'), vis,
+                                       visweights, uvcoords, frequencymap, gridder=gridder, nthreads=nthreads,
+                                       shard='tile')
+
+    def test_weight_gridding(self):
+        npixel = 256
+        nvis = 10000
+        npol = 2
+        numpy.random.seed(180555)
+        shape = [2, npol, npixel, npixel]
+        uvcoords = numpy.random.uniform(-0.25, 0.25, [nvis, 2])
+        visweights = numpy.random.uniform(size=[nvis, npol])
+        frequencymap = numpy.random.randint(0, 2, [nvis])
+        densitygrid = numpy.zeros(shape)
+        for flip in [-1.0, 1.0]:
+            y, _ = frac_coord(npixel, 1.0, flip * uvcoords[:, 1])
+            x, _ = frac_coord(npixel, 1.0, flip * uvcoords[:, 0])
+            for row in range(nvis):
+                densitygrid[frequencymap[row], :, y[row], x[row]] += visweights[row]
+        y, _ = frac_coord(npixel, 1.0, uvcoords[:, 1])
+        x, _ = frac_coord(npixel, 1.0, uvcoords[:, 0])
+        density = densitygrid[frequencymap, :, y, x]
+        newvisweights, result_density, result_densitygrid = weight_gridding(shape, visweights, uvcoords,
+                                                                             frequencymap)
+        assert_allclose(result_densitygrid, densitygrid, rtol=1e-12)
+        assert_allclose(result_density, density, rtol=1e-12)
+        assert_allclose(newvisweights, visweights / density, rtol=1e-12)
 
 if __name__ == '__main__':
     unittest.main()
@@ -2,12 +2,15 @@
 
 
 """
+import importlib.util
 import numpy
+import tracemalloc
 import unittest
 
 from numpy.testing import assert_allclose
 
-from arl.fourier_transforms.fft_support import extract_mid, pad_mid, extract_oversampled
+from arl.fourier_transforms.fft_support import extract_mid, pad_mid, extract_oversampled, fft, ifft, \
+    set_fft_backend, get_fft_backend, insert_mid, rfft2, irfft2
 from arl.fourier_transforms.convolutional_gridding import coordinates2
 
 
@@ -39,6 +42,97 @@ class TestFFTSupport(unittest.TestCase):
             ex = extract_oversampled(a, 0, 0, kernel_oversampling, npixel) / kernel_oversampling ** 2
             assert_allclose(ex, 1 + self._pattern(npixel))
 
+    def test_fft_single_precision(self):
+        cs = 1 + self._pattern(128)
+        cs32 = cs.astype('complex64')
+        assert fft(cs32).dtype == numpy.complex64
+        assert ifft(cs32).dtype == numpy.complex64
+        assert fft(cs).dtype == numpy.complex128
+        assert_allclose(ifft(fft(cs32)), cs, atol=1e-4)
+
+    @unittest.skipUnless(importlib.util.find_spec('scipy.fft') or
+                         numpy.lib.NumpyVersion(numpy.__version__) >= '2.0.0', "no single precision FFT")
+    def test_fft_single_precision_memory(self):
+        saved = get_fft_backend()
+        try:
+            set_fft_backend('numpy')
+            a = numpy.random.random_sample((2, 512, 512)) + 1j * numpy.random.random_sample((2, 512, 512))
+            a32 = a.astype('complex64')
+            # Make the checkerboards before measuring
+            fft(a32[0:1])
+            tracemalloc.start()
+            result = fft(a32, overwrite=True)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            assert result.dtype == numpy.complex64
+            # No full size temporaries: a double precision transform would need at least 2 * a32.nbytes
+            assert peak < 0.5 * a32.nbytes, peak
+            expected = fft(a)
+            assert numpy.max(numpy.abs(result - expected)) < 1e-5 * numpy.max(numpy.abs(expected))
+        finally:
+            set_fft_backend(*saved)
+
+    def test_fft_shift_free(self):
+        # Even sizes use the checkerboard, odd sizes the explicit shifts
+        for shape in [(3, 2, 64, 32), (2, 1, 63, 65), (128, 128)]:
+            a = numpy.random.random_sample(shape) + 1j * numpy.random.random_sample(shape)
+            expected = numpy.fft.fftshift(numpy.fft.fft2(numpy.fft.ifftshift(a, axes=(-2, -1))), axes=(-2, -1))
+            assert_allclose(fft(a), expected, atol=1e-10)
+            expected = numpy.fft.fftshift(numpy.fft.ifft2(numpy.fft.ifftshift(a, axes=(-2, -1))), axes=(-2, -1))
+            assert_allclose(ifft(a), expected, atol=1e-12)
+
+    def test_insert_mid(self):
+        for npixel, N2 in [(100, 128), (128, 256)]:
+            cs = 1 + self._pattern(npixel)
+            weight = numpy.random.random_sample((N2, N2))
+            a = numpy.zeros((2, 1, N2, N2), dtype='complex')
+            assert insert_mid(a, cs, weight) is a
+            assert_allclose(a[0, 0], pad_mid(cs, N2) * weight)
+            assert_allclose(a[1, 0], pad_mid(cs, N2) * weight)
+
+    def test_fft_overwrite(self):
+        a = numpy.random.random_sample((2, 1, 64, 64)) + 1j * numpy.random.random_sample((2, 1, 64, 64))
+        expected = fft(a)
+        result = fft(a.copy(), overwrite=True)
+        assert_allclose(result, expected, atol=1e-10)
+        assert_allclose(ifft(result, overwrite=True), a, atol=1e-12)
+
+    def test_rfft2(self):
+        for shape in [(3, 64, 32), (63, 65)]:
+            a = numpy.random.random_sample(shape)
+            assert_allclose(rfft2(a), numpy.fft.rfft2(a), atol=1e-10)
+            assert_allclose(irfft2(rfft2(a), shape[-2:]), a, atol=1e-12)
+
+    def _check_backend(self, backend):
+        saved = get_fft_backend()
+        a = numpy.random.random_sample((2, 2, 64, 64)) + 1j * numpy.random.random_sample((2, 2, 64, 64))
+        expected = fft(a)
+        try:
+            set_fft_backend(backend, nthreads=2)
+            assert_allclose(fft(a), expected, atol=1e-10)
+            assert_allclose(ifft(fft(a)), a, atol=1e-12)
+            assert_allclose(ifft(fft(a.copy(), overwrite=True), overwrite=True), a, atol=1e-12)
+            # pyfftw reuses its plan on the second call
+            assert_allclose(fft(a), expected, atol=1e-10)
+            assert fft(a.astype('complex64')).dtype == numpy.complex64
+            assert_allclose(irfft2(rfft2(a.real), a.shape[-2:]), a.real, atol=1e-12)
+        finally:
+            set_fft_backend(*saved)
+
+    def test_fft_unknown_backend(self):
+        saved = get_fft_backend()
+        with self.assertRaisesRegex(ValueError, "valid backends are numpy, scipy, pyfftw"):
+            set_fft_backend('fftpack')
+        assert get_fft_backend() == saved
+
+    @unittest.skipUnless(importlib.util.find_spec('scipy.fft'), "scipy.fft is not available")
+    def test_fft_scipy(self):
+        self._check_backend('scipy')
+
+    @unittest.skipUnless(importlib.util.find_spec('pyfftw'), "pyfftw is not installed")
+    def test_fft_pyfftw(self):
+        self._check_backend('pyfftw')
+
 
 if __name__ == '__main__':
     unittest.main()
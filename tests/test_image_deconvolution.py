@@ -2,6 +2,8 @@
 
 
 """
+import functools
+import importlib.util
 import logging
 import os
 import unittest
@@ -11,8 +13,8 @@ import numpy
 from astropy.coordinates import SkyCoord
 
 from arl.data.polarisation import PolarisationFrame
-from arl.image.cleaners import overlapIndices
-from arl.image.deconvolution import deconvolve_cube, restore_cube
+from arl.image.cleaners import overlapIndices, hogbom
+from arl.image.deconvolution import deconvolve_cube, deconvolve_planes, restore_cube, _deconvolve_plane_shared
 from arl.image.operations import export_image_to_fits, create_image_from_array
 from arl.util.testing_support import create_test_image, create_named_configuration
 from arl.visibility.base import create_visibility
@@ -77,6 +79,54 @@ class TestImageDeconvolution(unittest.TestCase):
         export_image_to_fits(self.cmodel, "%s/test_deconvolve_hogbom-clean.fits" % (self.dir))
         assert numpy.max(self.residual.data) < 1.2
 
+    def _check_deconvolve_planes(self, pool):
+        # Three channels, the middle one with no PSF, deconvolved serially and by a pool of workers
+        dirty = numpy.repeat(self.dirty.data, 3, axis=0)
+        dirty[2] *= 0.5
+        psf = numpy.repeat(self.psf.data, 3, axis=0)
+        psf[1] = 0.0
+        clean = functools.partial(hogbom, gain=0.1, thresh=0.01, niter=1000, fracthresh=0.1)
+        comp, residual = deconvolve_planes(clean, dirty, psf)
+        assert numpy.max(numpy.abs(comp[1])) == 0.0
+        pcomp, presidual = deconvolve_planes(clean, dirty, psf, nworkers=2, pool=pool)
+        numpy.testing.assert_array_equal(comp, pcomp)
+        numpy.testing.assert_array_equal(residual, presidual)
+    
+    def test_deconvolve_planes_threads(self):
+        self._check_deconvolve_planes('thread')
+    
+    @unittest.skipUnless(importlib.util.find_spec('multiprocessing.shared_memory'),
+                         "multiprocessing.shared_memory is not available")
+    def test_deconvolve_planes_processes(self):
+        self._check_deconvolve_planes('process')
+    
+    def test_deconvolve_hogbom_nworkers(self):
+        comp, residual = deconvolve_cube(self.dirty, self.psf, niter=10000, gain=0.1, algorithm='hogbom',
+                                         threshold=0.01, nworkers=2)
+        assert numpy.max(residual.data) < 1.2
+
+    def test_deconvolve_clark(self):
+        
+        self.comp, self.residual = deconvolve_cube(self.dirty, self.psf, niter=10000, gain=0.1, algorithm='clark',
+                                                   threshold=0.01, psf_support=32)
+        export_image_to_fits(self.residual, "%s/test_deconvolve_clark-residual.fits" % (self.dir))
+        self.cmodel = restore_cube(self.comp, self.psf, self.residual)
+        export_image_to_fits(self.cmodel, "%s/test_deconvolve_clark-clean.fits" % (self.dir))
+        assert numpy.max(self.residual.data) < 1.2
+
+    def test_deconvolve_clark_inner_quarter(self):
+        
+        self.comp, self.residual = deconvolve_cube(self.dirty, self.psf, window_shape='quarter', niter=10000,
+                                                   gain=0.1, algorithm='clark', threshold=0.01)
+        export_image_to_fits(self.residual, "%s/test_deconvolve_clark_innerquarter-residual.fits" % (self.dir))
+        self.cmodel = restore_cube(self.comp, self.psf, self.residual)
+        export_image_to_fits(self.cmodel, "%s/test_deconvolve_clark_innerquarter-clean.fits" % (self.dir))
+        assert numpy.max(self.residual.data[..., 129:384, 129:384]) < 1.2
+        # No components outside the inner quarter
+        outside = numpy.abs(self.comp.data) * (1.0 - self.innerquarter.data)
+        assert numpy.sum(outside) == 0.0
+        assert numpy.sum(numpy.abs(self.comp.data)) > 0.0
+
     def test_deconvolve_msclean(self):
         self.comp, self.residual = deconvolve_cube(self.dirty, self.psf, niter=1000, gain=0.7, algorithm='msclean',
                                                    scales=[0, 3, 10, 30], threshold=0.01)
@@ -143,3 +193,27 @@ class TestImageDeconvolution(unittest.TestCase):
         self.cmodel = restore_cube(self.comp, self.psf, self.residual)
         export_image_to_fits(self.cmodel, "%s/test_deconvolve_msclean_subpsf-clean.fits" % (self.dir))
         assert numpy.max(self.residual.data[..., 56:456, 56:456]) < 1.0
+
+
+def failing_clean(dirty, psf, window):
+    raise RuntimeError("clean failed")
+
+
+class TestDeconvolvePlanesShared(unittest.TestCase):
+    
+    @unittest.skipUnless(importlib.util.find_spec('multiprocessing.shared_memory'),
+                         "multiprocessing.shared_memory is not available")
+    def test_deconvolve_plane_shared_error(self):
+        # The exception of the clean reaches the caller, rather than an error from closing the shared memory
+        from multiprocessing import shared_memory
+        shapes = {'dirty': (1, 1, 16, 16), 'psf': (1, 1, 8, 8), 'comp': (1, 1, 16, 16), 'residual': (1, 1, 16, 16)}
+        shms = {name: shared_memory.SharedMemory(create=True, size=8 * int(numpy.prod(shape)))
+                for name, shape in shapes.items()}
+        try:
+            specs = {name: (shms[name].name, shape, numpy.dtype('float').str) for name, shape in shapes.items()}
+            with self.assertRaisesRegex(RuntimeError, "clean failed"):
+                _deconvolve_plane_shared(failing_clean, specs, 0, 0)
+        finally:
+            for shm in shms.values():
+                shm.close()
+                shm.unlink()
@@ -0,0 +1,74 @@
+""" Unit tests for the Hogbom clean minor cycle
+
+
+"""
+import importlib
+import unittest
+
+import numpy
+
+from arl.image.cleaners import hogbom, overlapIndices
+
+import logging
+
+log = logging.getLogger(__name__)
+
+
+def hogbom_reference(dirty, psf, window, gain, thresh, niter):
+    """ Hogbom clean with a full search of the residual at every iteration
+
+    """
+    comps = numpy.zeros(dirty.shape)
+    res = numpy.array(dirty)
+    pmax = psf.max()
+    for i in range(niter):
+        if window is not None:
+            mx, my = numpy.unravel_index((numpy.fabs(res * window)).argmax(), dirty.shape)
+        else:
+            mx, my = numpy.unravel_index((numpy.fabs(res)).argmax(), dirty.shape)
+        mval = res[mx, my] * gain / pmax
+        comps[mx, my] += mval
+        a1o, a2o = overlapIndices(dirty, psf, mx, my)
+        res[a1o[0]:a1o[1], a1o[2]:a1o[3]] -= psf[a2o[0]:a2o[1], a2o[2]:a2o[3]] * mval
+        if numpy.abs(res[mx, my]) < thresh:
+            break
+    return comps, res
+
+
+class TestImageHogbom(unittest.TestCase):
+    def setUp(self):
+        numpy.random.seed(180555)
+        self.npixel = 200
+        y, x = numpy.mgrid[-32:32, -32:32]
+        self.psf = numpy.exp(-(x ** 2 + y ** 2) / 20.0) * numpy.cos(x / 3.0)
+        self.dirty = numpy.zeros([self.npixel, self.npixel])
+        for i in range(30):
+            cy, cx = numpy.random.randint(0, self.npixel, 2)
+            a1o, a2o = overlapIndices(self.dirty, self.psf, cy, cx)
+            self.dirty[a1o[0]:a1o[1], a1o[2]:a1o[3]] += numpy.random.uniform(0.1, 1.0) * \
+                self.psf[a2o[0]:a2o[1], a2o[2]:a2o[3]]
+        self.dirty += 0.001 * numpy.random.normal(size=self.dirty.shape)
+        self.window = numpy.zeros_like(self.dirty)
+        self.window[50:150, 40:170] = 1.0
+    
+    def test_hogbom_tiles(self):
+        # The tile maxima are kept only for the smaller PSF and tiles
+        for psf in [self.psf, self.psf[16:48, 16:48]]:
+            for window in [None, self.window]:
+                expected_comps, expected_res = hogbom_reference(self.dirty, psf, window, 0.1, 0.0, 500)
+                for tilesize in [16, 25, 37, 256]:
+                    comps, res = hogbom(self.dirty, psf, window, 0.1, 0.0, 500, 0.0, tilesize=tilesize)
+                    numpy.testing.assert_array_equal(comps, expected_comps)
+                    numpy.testing.assert_array_equal(res, expected_res)
+    
+    @unittest.skipUnless(importlib.util.find_spec('numba'), "numba is not installed")
+    def test_hogbom_numba(self):
+        for window in [None, self.window]:
+            expected_comps, expected_res = hogbom_reference(self.dirty, self.psf, window, 0.1, 0.0, 500)
+            comps, res = hogbom(self.dirty, self.psf, window, 0.1, 0.0, 500, 0.0, loop='numba')
+            numpy.testing.assert_array_equal(comps, expected_comps)
+            numpy.testing.assert_array_equal(res, expected_res)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,11 +7,81 @@ import numpy
 import logging
 
 from arl.image.cleaners import create_scalestack, convolve_scalestack, convolve_convolve_scalestack,\
-    argmax
+    argmax, spheroidal_function, msclean, scalestack_symmetric, scalestack_transform, get_scalestack_cache
+from arl.fourier_transforms.kernel_cache import get_kernel_cache
 
 log = logging.getLogger(__name__)
 
 
+def spheroidal_function_reference(vnu):
+    """ Prolate spheroidal wavefunction of a scalar argument, evaluated term by term
+
+    """
+    p = [[8.203343e-2, -3.644705e-1, 6.278660e-1, -5.335581e-1, 2.312756e-1],
+         [4.028559e-3, -3.697768e-2, 1.021332e-1, -1.201436e-1, 6.412774e-2]]
+    q = [[1.0000000, 8.212018e-1, 2.078043e-1],
+         [1.0000000, 9.599102e-1, 2.918724e-1]]
+    if 0.0 <= vnu < 0.75:
+        part, nuend = 0, 0.75
+    elif 0.75 <= vnu <= 1.0:
+        part, nuend = 1, 1.0
+    else:
+        return 0.0
+    delnusq = vnu ** 2 - nuend ** 2
+    top = p[part][0]
+    for k in range(1, 5):
+        top += p[part][k] * delnusq ** k
+    bot = q[part][0]
+    for k in range(1, 3):
+        bot += q[part][k] * delnusq ** k
+    value = top / bot if bot != 0.0 else 0.0
+    return max(value, 0.0)
+
+
+def create_scalestack_reference(scaleshape, scales, norm=True):
+    """ Scale stack calculated pixel by pixel
+
+    """
+    basis = numpy.zeros(scaleshape)
+    xcen = int(numpy.ceil(float(scaleshape[1]) / 2.0))
+    ycen = int(numpy.ceil(float(scaleshape[2]) / 2.0))
+    for iscale, scale in enumerate(scales):
+        halfscale = int(numpy.ceil(scale / 2.0))
+        if scale > 0.0:
+            rscale2 = 1.0 / (float(scale) / 2.0) ** 2
+            for y in range(ycen - halfscale - 1, ycen + halfscale + 1):
+                for x in range(xcen - halfscale - 1, xcen + halfscale + 1):
+                    r = numpy.sqrt(rscale2 * (float(x - xcen) ** 2 + float(y - ycen) ** 2))
+                    basis[iscale, x, y] = spheroidal_function_reference(r) * (1.0 - r ** 2)
+            basis[basis < 0.0] = 0.0
+            if norm:
+                basis[iscale, :, :] /= numpy.sum(basis[iscale, :, :])
+        else:
+            basis[iscale, xcen, ycen] = 1.0
+    return basis
+
+
+def complex_transform(a):
+    """ Centred complex FFT of the last two axes, as used by the scale convolutions before the real FFTs
+
+    """
+    return numpy.fft.fftshift(numpy.fft.fft2(numpy.fft.fftshift(a, axes=(-2, -1))), axes=(-2, -1))
+
+
+def complex_inverse_transform(a):
+    return numpy.real(numpy.fft.ifftshift(numpy.fft.ifft2(numpy.fft.ifftshift(a, axes=(-2, -1))), axes=(-2, -1)))
+
+
+def convolve_scalestack_reference(scalestack, img):
+    return complex_inverse_transform(complex_transform(img) * numpy.conjugate(complex_transform(scalestack)))
+
+
+def convolve_convolve_scalestack_reference(scalestack, img):
+    xscale = complex_transform(scalestack)
+    xmult = complex_transform(img) * xscale[numpy.newaxis, :] * numpy.conjugate(xscale[:, numpy.newaxis])
+    return complex_inverse_transform(xmult)
+
+
 class TestImageMSClean(unittest.TestCase):
     def setUp(self):
         self.npixel = 256
@@ -46,3 +116,79 @@ class TestImageMSClean(unittest.TestCase):
         # convolution
         numpy.testing.assert_array_almost_equal(result[1, 1, 75, 31], self.scalestack[2, self.npixel // 2,
                                                                                       self.npixel // 2], 2)
+    
+    def _stacks(self, shape):
+        """ A stack of the usual (symmetric) scales and one of random, asymmetric scales
+
+        """
+        scalestack = create_scalestack([len(self.scales), *shape], self.scales)
+        randomstack = numpy.random.random_sample([2, *shape])
+        return [scalestack, randomstack]
+    
+    def test_scalestack_transform(self):
+        numpy.random.seed(180555)
+        for shape in [(64, 64), (63, 65), (64, 63)]:
+            for stack in self._stacks(shape):
+                nx = stack.shape[2]
+                expected = numpy.fft.fft2(numpy.fft.fftshift(stack, axes=(1, 2)))[..., :nx // 2 + 1]
+                numpy.testing.assert_allclose(scalestack_transform(stack), expected, atol=1e-12 * stack.size)
+    
+    def test_scalestack_symmetric(self):
+        numpy.random.seed(180555)
+        scalestack, randomstack = self._stacks((64, 64))
+        assert scalestack_symmetric(scalestack)
+        assert not scalestack_symmetric(randomstack)
+    
+    def test_convolve_equivalence(self):
+        numpy.random.seed(180555)
+        for shape in [(64, 64), (63, 65), (64, 63)]:
+            img = numpy.random.random_sample(shape)
+            for stack in self._stacks(shape):
+                expected = convolve_scalestack_reference(stack, img)
+                numpy.testing.assert_allclose(convolve_scalestack(stack, img), expected,
+                                              atol=1e-12 * numpy.max(numpy.abs(expected)))
+                expected = convolve_convolve_scalestack_reference(stack, img)
+                numpy.testing.assert_allclose(convolve_convolve_scalestack(stack, img), expected,
+                                              atol=1e-12 * numpy.max(numpy.abs(expected)))
+    
+    def test_spheroidal_function(self):
+        vnu = numpy.linspace(-0.2, 1.2, 141)
+        expected = numpy.array([spheroidal_function_reference(v) for v in vnu])
+        numpy.testing.assert_allclose(spheroidal_function(vnu), expected, rtol=1e-12, atol=1e-15)
+        assert spheroidal_function(0.5) == spheroidal_function_reference(0.5)
+    
+    def test_create_scalestack(self):
+        for shape in [(64, 64), (63, 65)]:
+            scales = [0.0, 3.0, 8.0 / numpy.sqrt(2.0), 10.0]
+            for norm in [True, False]:
+                numpy.testing.assert_allclose(create_scalestack([len(scales), *shape], scales, norm=norm),
+                                              create_scalestack_reference([len(scales), *shape], scales, norm=norm),
+                                              rtol=1e-12, atol=1e-15)
+    
+    def test_msclean_cache(self):
+        numpy.random.seed(180555)
+        y, x = numpy.mgrid[-32:32, -32:32]
+        psf = numpy.exp(-(x ** 2 + y ** 2) / 20.0) * numpy.cos(x / 3.0)
+        dirty = numpy.zeros([128, 128])
+        dirty[32:96, 40:104] += psf
+        dirty += 0.01 * numpy.random.normal(size=dirty.shape)
+        cache = get_scalestack_cache()
+        cache.clear()
+        kernel_entries = len(get_kernel_cache())
+        comps, res = msclean(dirty, psf, None, 0.7, 0.001, 100, self.scales, 0.01)
+        misses = cache.statistics()['misses']
+        assert misses > 0
+        # The second call finds all the stacks in the cache
+        ccomps, cres = msclean(dirty, psf, None, 0.7, 0.001, 100, self.scales, 0.01)
+        assert cache.statistics()['misses'] == misses
+        assert cache.statistics()['hits'] > 0
+        numpy.testing.assert_array_equal(ccomps, comps)
+        numpy.testing.assert_array_equal(cres, res)
+        # The stacks are not put in the kernel cache, nor on disk
+        assert len(get_kernel_cache()) == kernel_entries
+        assert cache.directory is None
+        cache.clear()
+
+
+if __name__ == '__main__':
+    unittest.main()
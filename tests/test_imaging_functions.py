@@ -199,7 +199,39 @@ class TestImagingFunctions(unittest.TestCase):
         imagecentre = pixel_to_skycoord(nx // 2 + 1.0, ny // 2 + 1.0, wcs=psf2d.wcs, origin=1)
         assert imagecentre.separation(self.phasecentre).value < 1e-15, \
             "Image phase centre %s not as expected %s" % (imagecentre, self.phasecentre)
-    
+
+    def test_invert_2d_single_precision(self):
+        # The single precision dirty image should have nearly the same dynamic range as the double
+        self.actualSetUp()
+        self.componentvis.data['uvw'][:, 2] = 0.0
+        self.componentvis.data['vis'][...] = 0.0
+        self.componentvis = predict_skycomponent_visibility(self.componentvis, self.components)
+
+        dirty = create_empty_image_like(self.model)
+        dirty, sumwt = invert_2d(self.componentvis, dirty, **self.params)
+        dirty32, sumwt32 = invert_2d(self.componentvis, create_empty_image_like(self.model), precision='single',
+                                     **self.params)
+        assert sumwt32.dtype == numpy.float64
+        numpy.testing.assert_allclose(sumwt32, sumwt)
+
+        self._checkcomponents(dirty32)
+        peak = numpy.max(numpy.abs(dirty.data))
+        dr = peak / numpy.max(numpy.abs(dirty.data - dirty32.data))
+        assert dr > 1e5, "Dynamic range of single precision image %.1f is too low" % dr
+
+    def test_predict_2d_single_precision(self):
+        self.actualSetUp()
+        self.componentvis.data['uvw'][:, 2] = 0.0
+
+        modelvis = copy_visibility(self.componentvis, zero=True)
+        modelvis = predict_2d(modelvis, self.model, **self.params)
+        modelvis32 = copy_visibility(self.componentvis, zero=True)
+        modelvis32 = predict_2d(modelvis32, self.model, precision='single', **self.params)
+
+        peak = numpy.max(numpy.abs(modelvis.data['vis']))
+        dr = peak / numpy.max(numpy.abs(modelvis.data['vis'] - modelvis32.data['vis']))
+        assert dr > 1e5, "Dynamic range of single precision prediction %.1f is too low" % dr
+
     @unittest.skip("Insufficiently accurate")
     def test_predict_facets(self):
         self.params['facets'] = 9
@@ -14,8 +14,9 @@ from arl.data.polarisation import PolarisationFrame
 from arl.util.testing_support import create_named_configuration, create_low_test_image_from_s3, \
     create_low_test_image_from_gleam
 from arl.visibility.base import create_visibility
-from arl.imaging import create_image_from_visibility
-from arl.imaging.params import get_frequency_map, w_kernel_list
+from arl.imaging import create_image_from_visibility, invert_2d, predict_2d
+from arl.imaging.params import get_frequency_map, w_kernel_list, get_imaging_plan, ImagingPlan, get_tile_sort
+from arl.fourier_transforms.kernel_cache import clear_kernel_cache, kernel_cache_statistics
 from arl.image.operations import export_image_to_fits, create_image_from_array
 
 log = logging.getLogger(__name__)
@@ -101,6 +102,103 @@ class TestFTProcessorParams(unittest.TestCase):
                                                     wstep=50, oversampling=3,
                                                     maxsupport=128)
 
+    def test_w_kernel_list_dft(self):
+        oversampling = 4
+        kernelwidth = 32
+        _, kernels = w_kernel_list(self.vis, self.model, kernelwidth=kernelwidth, wstep=50,
+                                   oversampling=oversampling, use_cache=False)
+        _, fft_kernels = w_kernel_list(self.vis, self.model, kernelwidth=kernelwidth, wstep=50,
+                                       oversampling=oversampling, use_cache=False, method='fft')
+        assert len(kernels) == len(fft_kernels)
+        for kernel, fft_kernel in zip(kernels, fft_kernels):
+            assert kernel.shape == fft_kernel.shape
+            numpy.testing.assert_allclose(kernel, fft_kernel, atol=1e-10 * numpy.max(numpy.abs(fft_kernel)))
+
+    def test_w_kernel_list_cache(self):
+        clear_kernel_cache()
+        kernel_indices, kernels = w_kernel_list(self.vis, self.model, kernelwidth=32, wstep=50, oversampling=4)
+        stats = kernel_cache_statistics()
+        assert stats['misses'] == len(kernels)
+        assert stats['hits'] == 0
+        cached_indices, cached_kernels = w_kernel_list(self.vis, self.model, kernelwidth=32, wstep=50,
+                                                       oversampling=4)
+        stats = kernel_cache_statistics()
+        assert stats['hits'] == len(kernels)
+        assert stats['nbytes'] == sum(kernel.nbytes for kernel in kernels)
+        numpy.testing.assert_array_equal(kernel_indices, cached_indices)
+        for kernel, cached_kernel in zip(kernels, cached_kernels):
+            assert kernel is cached_kernel
+            assert not cached_kernel.flags.writeable
+        # By default the cached kernels are those calculated without the cache
+        _, uncached_kernels = w_kernel_list(self.vis, self.model, kernelwidth=32, wstep=50, oversampling=4,
+                                            use_cache=False)
+        for kernel, uncached_kernel in zip(kernels, uncached_kernels):
+            numpy.testing.assert_array_equal(kernel, uncached_kernel)
+        _, quantised_kernels = w_kernel_list(self.vis, self.model, kernelwidth=32, wstep=50, oversampling=4,
+                                             wquantum=1e-6)
+        for kernel, uncached_kernel in zip(quantised_kernels, uncached_kernels):
+            numpy.testing.assert_allclose(kernel, uncached_kernel, atol=1e-5 * numpy.max(numpy.abs(kernel)))
+        # Parameters that do not change the kernel are not in the key, and need not be hashable
+        clear_kernel_cache()
+        w_kernel_list(self.vis, self.model, kernelwidth=32, wstep=50, oversampling=4, vis_slices=[1, 2],
+                      facets=numpy.ones([2]))
+        assert kernel_cache_statistics()['misses'] == 0
+        clear_kernel_cache()
+
+    def test_get_tile_sort(self):
+        plan = get_imaging_plan(self.vis, self.model)
+        shape = (7, 1, 1024, 1024)
+        sort = get_tile_sort(self.vis, self.model, shape, plan.vuvwmap, plan.vfrequencymap, 64)
+        assert get_tile_sort(self.vis, self.model, shape, plan.vuvwmap, plan.vfrequencymap, 64) is sort
+        # Shifted uv coordinates or a different image centre give a new sort
+        vuvwmap = plan.vuvwmap.copy()
+        vuvwmap[:, 0] += 1.0 / 1024
+        assert get_tile_sort(self.vis, self.model, shape, vuvwmap, plan.vfrequencymap, 64) is not sort
+        model = create_image_from_visibility(self.vis, npixel=512, cellsize=0.001, nchan=self.vnchan,
+                                             frequency=self.startfrequency)
+        model.wcs.wcs.crpix[0] += 1.0
+        assert get_tile_sort(self.vis, model, shape, plan.vuvwmap, plan.vfrequencymap, 64) is not sort
+
+    def test_imaging_plan(self):
+        plan = ImagingPlan()
+        assert get_imaging_plan(self.vis, self.model, imaging_plan=plan, padding=2) is plan
+        assert plan.padding == 2
+        vuvwmap = plan.vuvwmap
+        coords = plan.grid_coordinates((7, 1, 1024, 1024))
+        assert plan.grid_coordinates((7, 1, 1024, 1024)) is coords
+        # Same visibility and parameters: nothing is recalculated
+        get_imaging_plan(self.vis, self.model, imaging_plan=plan, padding=2)
+        assert plan.vuvwmap is vuvwmap
+        assert plan.grid_coordinates((7, 1, 1024, 1024)) is coords
+        # A change of the uvw or of the parameters invalidates the plan
+        self.vis.data['uvw'][:, 2] += 1.0
+        get_imaging_plan(self.vis, self.model, imaging_plan=plan, padding=2)
+        assert plan.vuvwmap is not vuvwmap
+        vuvwmap = plan.vuvwmap
+        # Swapping two rows leaves the sum of the uvw unchanged
+        self.vis.data['uvw'][[0, 1]] = self.vis.data['uvw'][[1, 0]]
+        get_imaging_plan(self.vis, self.model, imaging_plan=plan, padding=2)
+        assert plan.vuvwmap is not vuvwmap
+        vuvwmap = plan.vuvwmap
+        get_imaging_plan(self.vis, self.model, imaging_plan=plan, padding=1)
+        assert plan.vuvwmap is not vuvwmap
+        assert plan.padding == 1
+        # Without a plan in kwargs a new one is made each time
+        assert get_imaging_plan(self.vis, self.model) is not get_imaging_plan(self.vis, self.model)
+
+    def test_imaging_plan_results(self):
+        plan = ImagingPlan()
+        self.model.data[..., 256, 256] = 1.0
+        dirty, sumwt = invert_2d(self.vis, self.model, padding=2)
+        for i in range(2):
+            plan_dirty, plan_sumwt = invert_2d(self.vis, self.model, padding=2, imaging_plan=plan)
+            numpy.testing.assert_array_equal(plan_dirty.data, dirty.data)
+            numpy.testing.assert_array_equal(plan_sumwt, sumwt)
+        vis = predict_2d(self.vis, self.model, padding=2).data['vis'].copy()
+        for i in range(2):
+            plan_vis = predict_2d(self.vis, self.model, padding=2, imaging_plan=plan).data['vis']
+            numpy.testing.assert_array_equal(plan_vis, vis)
+
 
 if __name__ == '__main__':
     unittest.main()
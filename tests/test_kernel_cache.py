@@ -0,0 +1,118 @@
+""" Unit tests for the kernel cache
+
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from arl.fourier_transforms import kernel_cache
+from arl.fourier_transforms.kernel_cache import KernelCache
+
+
+class TestKernelCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = KernelCache(maxbytes=3 * 8 * 100)
+        self.ncalls = 0
+    
+    def generate(self, value):
+        self.ncalls += 1
+        return value * numpy.ones([100])
+    
+    def test_hits_and_misses(self):
+        first = self.cache.get('a', lambda: self.generate(1.0))
+        second = self.cache.get('a', lambda: self.generate(2.0))
+        assert first is second
+        assert self.ncalls == 1
+        assert not first.flags.writeable
+        stats = self.cache.statistics()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['nbytes'] == 800
+    
+    def test_lru_eviction(self):
+        for key in ['a', 'b', 'c']:
+            self.cache.get(key, lambda: self.generate(1.0))
+        # Touch 'a' so that 'b' is the least recently used
+        self.cache.get('a', lambda: self.generate(1.0))
+        self.cache.get('d', lambda: self.generate(1.0))
+        assert 'a' in self.cache
+        assert 'b' not in self.cache
+        assert len(self.cache) == 3
+        assert self.cache.statistics()['evictions'] == 1
+        self.cache.resize(800)
+        assert len(self.cache) == 1
+        assert 'd' in self.cache
+        assert self.cache.nbytes == 800
+    
+    def test_too_large(self):
+        self.cache.get('big', lambda: numpy.ones([1000]))
+        assert len(self.cache) == 0
+        assert self.cache.nbytes == 0
+    
+    def test_clear(self):
+        self.cache.get('a', lambda: self.generate(1.0))
+        self.cache.clear()
+        assert len(self.cache) == 0
+        assert self.cache.statistics()['misses'] == 0
+
+    def test_disk(self):
+        directory = tempfile.mkdtemp()
+        try:
+            cache = KernelCache(directory=directory)
+            first = cache.get(('a', 1), lambda: self.generate(2.0))
+            assert cache.statistics()['disk_writes'] == 1
+            assert isinstance(first, numpy.memmap)
+            
+            # A second process would find the kernel on disk
+            other = KernelCache(directory=directory)
+            second = other.get(('a', 1), lambda: self.generate(3.0))
+            assert self.ncalls == 1
+            assert other.statistics()['disk_hits'] == 1
+            assert isinstance(second, numpy.memmap)
+            assert not second.flags.writeable
+            numpy.testing.assert_array_equal(second, 2.0)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_disk_version(self):
+        directory = tempfile.mkdtemp()
+        version = kernel_cache.KERNEL_CACHE_VERSION
+        try:
+            KernelCache(directory=directory).get('a', lambda: self.generate(2.0))
+            # Kernels stored by another version of the code are not loaded
+            kernel_cache.KERNEL_CACHE_VERSION = version + 1
+            other = KernelCache(directory=directory)
+            numpy.testing.assert_array_equal(other.get('a', lambda: self.generate(3.0)), 3.0)
+            assert other.statistics()['disk_hits'] == 0
+            assert self.ncalls == 2
+        finally:
+            kernel_cache.KERNEL_CACHE_VERSION = version
+            shutil.rmtree(directory)
+
+    def test_disk_bound(self):
+        directory = tempfile.mkdtemp()
+        try:
+            # Room on disk for two arrays including the .npy headers
+            cache = KernelCache(maxbytes=3 * 8 * 100, directory=directory, maxdiskbytes=2 * 1000)
+            for i, key in enumerate(['a', 'b', 'c']):
+                cache.get(key, lambda: self.generate(1.0))
+                # Make the order of the modification times certain
+                os.utime(cache._path(key), (i, i))
+            assert not os.path.exists(cache._path('a'))
+            assert os.path.exists(cache._path('b'))
+            assert os.path.exists(cache._path('c'))
+            # Arrays larger than the bound are neither cached nor stored
+            cache.get('big', lambda: numpy.ones([1000]))
+            assert not os.path.exists(cache._path('big'))
+            assert 'big' not in cache
+            assert cache.statistics()['disk_writes'] == 3
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,8 +15,9 @@ from arl.image.operations import export_image_to_fits
 from arl.imaging import predict_2d, invert_2d
 from arl.imaging import predict_skycomponent_visibility
 from arl.skycomponent.operations import insert_skycomponent, create_skycomponent
+from arl.util.coordinate_support import simulate_point, skycoord_to_lmn
 from arl.util.testing_support import create_test_image, create_named_configuration
-from arl.visibility.base import create_visibility
+from arl.visibility.base import create_visibility, create_blockvisibility
 
 log = logging.getLogger(__name__)
 
@@ -71,6 +72,56 @@ class TestSkycomponent(unittest.TestCase):
         export_image_to_fits(im, '%s/test_skycomponent_dft.fits' % self.dir)
         assert numpy.max(numpy.abs(self.vis.vis.imag)) < 1e-3
     
+    def _components(self, ncomp=20):
+        return [create_skycomponent(direction=SkyCoord(ra=(180.0 + 0.5 * numpy.sin(icomp)) * u.deg,
+                                                       dec=(-60.0 + 0.5 * numpy.cos(icomp)) * u.deg,
+                                                       frame='icrs', equinox='J2000'),
+                                     flux=numpy.array([[1.0 + icomp]]), frequency=self.frequency,
+                                     polarisation_frame=PolarisationFrame('stokesI'))
+                for icomp in range(ncomp)]
+
+    def test_predict_skycomponent_dft_many(self):
+        comps = self._components()
+        expected = numpy.zeros_like(self.vis.vis)
+        for comp in comps:
+            l, m, n = skycoord_to_lmn(comp.direction, self.vis.phasecentre)
+            expected[:, 0] += comp.flux[0, 0] * simulate_point(self.vis.uvw, l, m)
+        for nthreads in [1, 4]:
+            self.vis.data['vis'][...] = 0.0
+            self.vis = predict_skycomponent_visibility(self.vis, comps, dft_chunksize=1000, nthreads=nthreads)
+            numpy.testing.assert_allclose(self.vis.vis, expected, atol=1e-9)
+
+    def test_predict_skycomponent_dft_many_blockvisibility(self):
+        comps = self._components()
+        bvis = create_blockvisibility(self.lowcore, self.times, self.frequency,
+                                      channel_bandwidth=self.channel_bandwidth,
+                                      phasecentre=self.phasecentre, weight=1.0,
+                                      polarisation_frame=PolarisationFrame('stokesI'))
+        k = self.frequency[0] / 299792458.0
+        expected = numpy.zeros_like(bvis.vis)
+        for comp in comps:
+            l, m, n = skycoord_to_lmn(comp.direction, bvis.phasecentre)
+            expected[..., 0, 0] += comp.flux[0, 0] * simulate_point(bvis.uvw * k, l, m)
+        bvis.data['vis'][...] = 0.0
+        bvis = predict_skycomponent_visibility(bvis, comps, dft_chunksize=1000, nthreads=2)
+        numpy.testing.assert_allclose(bvis.vis, expected, atol=1e-9)
+
+    def test_predict_skycomponent_dft_chunks(self):
+        # More components than phases in a chunk, so that both the rows and the components are split
+        comps = self._components(30)
+        vis = create_visibility(self.lowcore, self.times[3:4], self.frequency,
+                                channel_bandwidth=self.channel_bandwidth, phasecentre=self.phasecentre, weight=1.0,
+                                polarisation_frame=PolarisationFrame('stokesI'))
+        bvis = create_blockvisibility(self.lowcore, self.times[3:4], self.frequency,
+                                      channel_bandwidth=self.channel_bandwidth, phasecentre=self.phasecentre,
+                                      weight=1.0, polarisation_frame=PolarisationFrame('stokesI'))
+        for v in [vis, bvis]:
+            v.data['vis'][...] = 0.0
+            expected = predict_skycomponent_visibility(v, comps).vis.copy()
+            v.data['vis'][...] = 0.0
+            v = predict_skycomponent_visibility(v, comps, dft_chunksize=20, nthreads=2)
+            numpy.testing.assert_allclose(v.vis, expected, atol=1e-9)
+
     def test_insert_skycomponent_nearest(self):
         dphasecentre = SkyCoord(ra=+181.0 * u.deg, dec=-58.0 * u.deg, frame='icrs', equinox='J2000')
         sc = create_skycomponent(direction=dphasecentre, flux=numpy.array([[1.0]]), frequency=self.frequency,
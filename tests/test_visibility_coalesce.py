@@ -6,12 +6,14 @@ import unittest
 
 import numpy
 
+from astropy import constants
 from astropy.coordinates import SkyCoord
 import astropy.units as u
 from arl.data.polarisation import PolarisationFrame
+from arl.util.array_functions import average_chunks, average_chunks2
 from arl.util.testing_support import create_named_configuration
 from arl.visibility.coalesce import coalesce_visibility, decoalesce_visibility, \
-    convert_blockvisibility_to_visibility
+    convert_blockvisibility_to_visibility, average_in_blocks
 from arl.visibility.base import create_blockvisibility, create_visibility_from_rows
 from arl.visibility.iterators import vis_timeslice_iter
 
@@ -20,6 +22,139 @@ import logging
 log = logging.getLogger(__name__)
 
 
+def average_in_blocks_reference(vis, uvw, wts, times, integration_time, frequency, channel_bandwidth,
+                                time_coal=1.0, max_time_coal=100, frequency_coal=1.0, max_frequency_coal=100):
+    """ Reference version of average_in_blocks that loops over baselines, as before it was vectorised
+
+    This is used for testing and benchmarking only. It gives the same rows as average_in_blocks when all
+    baselines have some weight, but its index for decoalescence is only correct if there is no averaging.
+    """
+    # Calculate the averaging factors for time and frequency making them the same for all times
+    # for this baseline
+    # Find the maximum possible baseline and then scale to this.
+
+    # The input visibility is a block of shape [ntimes, nant, nant, nchan, npol]. We will map this
+    # into rows like vis[npol] and with additional columns antenna1, antenna2, frequency
+
+    ntimes, nant, _, nchan, npol = vis.shape
+
+    # Pol independent weighting
+    allpwtsgrid = numpy.sum(wts, axis=4)
+    # Pol and frequency independent weighting
+    allcpwtsgrid = numpy.sum(allpwtsgrid, axis=3)
+    # Pol and time independent weighting
+    alltpwtsgrid = numpy.sum(allpwtsgrid, axis=0)
+
+    # Now calculate on a baseline basis the time and frequency averaging. We do this by looking at
+    # the maximum uv distance for all data and for a given baseline. The integration time and
+    # channel bandwidth are scale appropriately.
+    uvmax = numpy.sqrt(numpy.max(uvw[:, 0] ** 2 + uvw[:, 1] ** 2 + uvw[:, 2] ** 2))
+    time_average = numpy.ones([nant, nant], dtype='int')
+    frequency_average = numpy.ones([nant, nant], dtype='int')
+    ua = numpy.arange(nant)
+    for a2 in ua:
+        for a1 in ua:
+            if allpwtsgrid[:, a2, a1, :].any() > 0.0:
+                uvdist = numpy.max(numpy.sqrt(uvw[:, a2, a1, 0] ** 2 + uvw[:, a2, a1, 1] ** 2), axis=0)
+                if uvdist > 0.0:
+                    time_average[a2, a1] = min(max_time_coal,
+                                               max(1, int(round((time_coal * uvmax / uvdist)))))
+                    frequency_average[a2, a1] = min(max_frequency_coal,
+                                                    max(1, int(round(frequency_coal * uvmax / uvdist))))
+                else:
+                    time_average[a2, a1] = max_time_coal
+                    frequency_average[a2, a1] = max_frequency_coal
+
+    # See how many time chunks and frequency we need for each baseline. To do this we use the same averaging that
+    # we will use later for the actual data. This tells us the number of chunks required for each baseline.
+    frequency_grid, time_grid = numpy.meshgrid(frequency, times)
+    channel_bandwidth_grid, integration_time_grid = numpy.meshgrid(channel_bandwidth, integration_time)
+    cnvis = 0
+    time_chunk_len = numpy.ones([nant, nant], dtype='int')
+    frequency_chunk_len = numpy.ones([nant, nant], dtype='int')
+    for a2 in ua:
+        for a1 in ua:
+            if (time_average[a2, a1] > 0) & (frequency_average[a2, a1] > 0 & (allpwtsgrid[:, a2, a1, ...].any() > 0.0)):
+                time_chunks, _ = average_chunks(times, allcpwtsgrid[:, a2, a1], time_average[a2, a1])
+                time_chunk_len[a2, a1] = time_chunks.shape[0]
+                frequency_chunks, _ = average_chunks(frequency, alltpwtsgrid[a2, a1, :], frequency_average[a2, a1])
+                frequency_chunk_len[a2, a1] = frequency_chunks.shape[0]
+                nrows = time_chunk_len[a2, a1] * frequency_chunk_len[a2, a1]
+                cnvis += nrows
+
+    # Now we know enough to define the output coalesced arrays. The shape will be
+    # succesive a1, a2: [len_time_chunks[a2,a1], a2, a1, len_frequency_chunks[a2,a1]]
+    ctime = numpy.zeros([cnvis])
+    cfrequency = numpy.zeros([cnvis])
+    cchannel_bandwidth = numpy.zeros([cnvis])
+    cvis = numpy.zeros([cnvis, npol], dtype='complex')
+    cwts = numpy.zeros([cnvis, npol])
+    cuvw = numpy.zeros([cnvis, 3])
+    ca1 = numpy.zeros([cnvis], dtype='int')
+    ca2 = numpy.zeros([cnvis], dtype='int')
+    cintegration_time = numpy.zeros([cnvis])
+
+    # For decoalescence we keep an index to map back to the original BlockVisibility
+    rowgrid = numpy.zeros([ntimes, nant, nant, nchan], dtype='int')
+    rowgrid.flat = range(rowgrid.size)
+
+    cindex = numpy.zeros([rowgrid.size], dtype='int')
+
+    # Now go through, chunking up the various arrays. Everything is converted into an array with
+    # axes [time, channel] and then it is averaged over time and frequency chunks for
+    # this baseline.
+    # To aid decoalescence we will need an index of which output elements a given input element
+    # contributes to. This is a many to one. The decoalescence will then just consist of using
+    # this index to extract the coalesced value that a given input element contributes towards.
+
+    visstart = 0
+    for a2 in ua:
+        for a1 in ua:
+            if (time_chunk_len[a2, a1] > 0) & (frequency_chunk_len[a2, a1] > 0) & \
+                    (allpwtsgrid[:, a2, a1, :].any() > 0.0):
+
+                nrows = time_chunk_len[a2, a1] * frequency_chunk_len[a2, a1]
+                rows = slice(visstart, visstart + nrows)
+
+                cindex.flat[rowgrid[:, a2, a1, :]] = numpy.array(range(visstart, visstart + nrows))
+
+                ca1[rows] = a1
+                ca2[rows] = a2
+
+                # Average over time and frequency for case where polarisation isn't an issue
+                def average_from_grid(arr):
+                    return average_chunks2(arr, allpwtsgrid[:, a2, a1, :],
+                                           (time_average[a2, a1], frequency_average[a2, a1]))[0]
+
+                ctime[rows] = average_from_grid(time_grid).flatten()
+                cfrequency[rows] = average_from_grid(frequency_grid).flatten()
+
+                for axis in range(3):
+                    uvwgrid = numpy.outer(uvw[:, a2, a1, axis], frequency / constants.c.value)
+                    cuvw[rows, axis] = average_from_grid(uvwgrid).flatten()
+
+                # For some variables, we need the sum not the average
+                def sum_from_grid(arr):
+                    result = average_chunks2(arr, allpwtsgrid[:, a2, a1, :],
+                                             (time_average[a2, a1], frequency_average[a2, a1]))
+                    return result[0] * result[0].size
+
+                cintegration_time[rows] = sum_from_grid(integration_time_grid).flatten()
+                cchannel_bandwidth[rows] = sum_from_grid(channel_bandwidth_grid).flatten()
+
+                # For the polarisations we have to perform the time-frequency average separately for each polarisation
+                for pol in range(npol):
+                    result = average_chunks2(vis[:, a2, a1, :, pol], wts[:, a2, a1, :, pol],
+                                             (time_average[a2, a1], frequency_average[a2, a1]))
+                    cvis[rows, pol], cwts[rows, pol] = result[0].flatten(), result[1].flatten()
+
+                visstart += nrows
+
+    assert cnvis == visstart, "Mismatch between number of rows in coalesced visibility and index"
+
+    return cvis, cuvw, cwts, ctime, cfrequency, cchannel_bandwidth, ca1, ca2, cintegration_time, cindex
+
+
 class TestCoalesce(unittest.TestCase):
     def setUp(self):
 
@@ -51,6 +186,26 @@ class TestCoalesce(unittest.TestCase):
         dvis = decoalesce_visibility(cvis, overwrite=True)
         assert dvis.nvis == self.blockvis.nvis
 
+    def test_convert_decoalesce_values(self):
+        blockvis = create_blockvisibility(self.lowcore, self.times, self.frequency, phasecentre=self.phasecentre,
+                                          weight=1.0, polarisation_frame=PolarisationFrame('linear'),
+                                          channel_bandwidth=self.channel_bandwidth)
+        blockvis.data['vis'] = numpy.random.normal(size=blockvis.vis.shape) + \
+                               1j * numpy.random.normal(size=blockvis.vis.shape)
+        original = numpy.copy(blockvis.vis)
+        cvis = convert_blockvisibility_to_visibility(blockvis)
+        row = 7
+        itime = numpy.argmin(numpy.abs(self.blockvis.time - cvis.time[row]))
+        chan = numpy.argmin(numpy.abs(self.frequency - cvis.frequency[row]))
+        a1, a2 = cvis.antenna1[row], cvis.antenna2[row]
+        assert a1 < a2
+        numpy.testing.assert_array_equal(cvis.vis[row], original[itime, a2, a1, chan])
+        numpy.testing.assert_allclose(cvis.uvw[row], blockvis.uvw[itime, a2, a1] * self.frequency[chan] /
+                                      299792458.0)
+        dvis = decoalesce_visibility(cvis, overwrite=True)
+        a1, a2 = numpy.triu_indices(len(self.lowcore.names), 1)
+        numpy.testing.assert_array_equal(dvis.vis[:, a2, a1], original[:, a2, a1])
+
     def test_coalesce_decoalesce(self):
         cvis = coalesce_visibility(self.blockvis, time_coal=1.0, frequency_coal=1.0)
         assert numpy.min(cvis.frequency) == numpy.min(self.frequency)
@@ -60,6 +215,27 @@ class TestCoalesce(unittest.TestCase):
         dvis = decoalesce_visibility(cvis, overwrite=True)
         assert dvis.nvis == self.blockvis.nvis
 
+    def test_average_in_blocks(self):
+        self.blockvis.data['vis'] = numpy.random.normal(size=self.blockvis.vis.shape) + \
+                                    1j * numpy.random.normal(size=self.blockvis.vis.shape)
+        for time_coal, frequency_coal in [(0.0, 1.0), (1.0, 0.0), (1.0, 1.0)]:
+            args = (self.blockvis.vis, self.blockvis.uvw, self.blockvis.weight, self.blockvis.time,
+                    self.blockvis.integration_time, self.frequency, self.channel_bandwidth, time_coal, 100,
+                    frequency_coal, 100)
+            result = average_in_blocks(*args)
+            expected = average_in_blocks_reference(*args)
+            # The index for decoalescence is the last item
+            for col, ecol in zip(result[:-1], expected[:-1]):
+                numpy.testing.assert_allclose(col, ecol, rtol=1e-12, atol=1e-12)
+            # Every element of the block maps to a row with the same antennas
+            cvis, _, _, ctime, _, _, ca1, ca2, _, cindex = result
+            ntimes, nant, _, nchan, npol = self.blockvis.vis.shape
+            cindex = cindex.reshape([ntimes, nant, nant, nchan])
+            a2 = numpy.arange(nant)[numpy.newaxis, :, numpy.newaxis, numpy.newaxis]
+            a1 = numpy.arange(nant)[numpy.newaxis, numpy.newaxis, :, numpy.newaxis]
+            assert numpy.all(ca2[cindex] == a2)
+            assert numpy.all(ca1[cindex] == a1)
+
     def test_coalesce_decoalesce_frequency(self):
         cvis = coalesce_visibility(self.blockvis, time_coal=0.0, max_time_coal=1, frequency_coal=1.0)
         assert numpy.min(cvis.frequency) == numpy.min(self.frequency)
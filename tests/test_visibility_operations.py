@@ -14,13 +14,14 @@ import astropy.units as u
 
 from arl.data.data_models import Skycomponent
 from arl.data.polarisation import PolarisationFrame
+from arl.util.coordinate_support import xyz_to_uvw
 from arl.util.testing_support import create_named_configuration
 from arl.imaging import predict_skycomponent_visibility
 from arl.visibility.coalesce import convert_blockvisibility_to_visibility
 from arl.visibility.operations import append_visibility, qa_visibility, \
-    sum_visibility, subtract_visibility
+    sum_visibility, subtract_visibility, sort_visibility
 from arl.visibility.base import copy_visibility, create_visibility, create_blockvisibility, create_visibility_from_rows,\
-    phaserotate_visibility
+    phaserotate_visibility, create_visibility_view, create_visibility_iter
 
 
 class TestVisibilityOperations(unittest.TestCase):
@@ -49,6 +50,36 @@ class TestVisibilityOperations(unittest.TestCase):
         assert self.vis.nvis == len(self.vis.time)
         assert self.vis.nvis == len(self.vis.frequency)
 
+    def test_create_visibility_uvw(self):
+        vis = create_visibility(self.lowcore, self.times, self.frequency,
+                                channel_bandwidth=self.channel_bandwidth,
+                                phasecentre=self.phasecentre, weight=1.0)
+        bvis = create_blockvisibility(self.lowcore, self.times, self.frequency, phasecentre=self.phasecentre,
+                                      weight=1.0, channel_bandwidth=self.channel_bandwidth)
+        for row in [0, 1234, vis.nvis - 1]:
+            itime = numpy.argmin(numpy.abs(self.times * 43200.0 / numpy.pi - vis.time[row]))
+            a1, a2 = vis.antenna1[row], vis.antenna2[row]
+            assert a1 < a2
+            ant_pos = xyz_to_uvw(self.lowcore.xyz, self.times[itime], self.phasecentre.dec.rad)
+            assert_allclose(bvis.uvw[itime, a2, a1], ant_pos[a2] - ant_pos[a1])
+            assert_allclose(bvis.uvw[itime, a1, a2], ant_pos[a1] - ant_pos[a2])
+            assert_allclose(vis.uvw[row], (ant_pos[a2] - ant_pos[a1]) * vis.frequency[row] / 299792458.0)
+
+    def test_create_visibility_iter(self):
+        bvis = create_blockvisibility(self.lowcore, self.times, self.frequency, phasecentre=self.phasecentre,
+                                      weight=1.0, channel_bandwidth=self.channel_bandwidth)
+        chunks = list(create_visibility_iter(self.lowcore, self.times, self.frequency, self.phasecentre,
+                                             times_per_chunk=3, weight=1.0,
+                                             channel_bandwidth=self.channel_bandwidth))
+        assert len(chunks) == 4
+        assert_allclose(numpy.concatenate([chunk.uvw for chunk in chunks]), bvis.uvw)
+        chunks = create_visibility_iter(self.lowcore, self.times, self.frequency, self.phasecentre,
+                                        times_per_chunk=4, fmt='vis', weight=1.0,
+                                        channel_bandwidth=self.channel_bandwidth)
+        vis = create_visibility(self.lowcore, self.times, self.frequency, channel_bandwidth=self.channel_bandwidth,
+                                phasecentre=self.phasecentre, weight=1.0)
+        assert sum(chunk.nvis for chunk in chunks) == vis.nvis
+
     def test_create_visibility_polarisation(self):
         self.vis = create_visibility(self.lowcore, self.times, self.frequency,
                                      channel_bandwidth=self.channel_bandwidth,
@@ -57,6 +88,44 @@ class TestVisibilityOperations(unittest.TestCase):
         assert self.vis.nvis == len(self.vis.time)
         assert self.vis.nvis == len(self.vis.frequency)
 
+    def test_create_visibility_columnar(self):
+        vis = create_visibility(self.lowcore, self.times, self.frequency,
+                                channel_bandwidth=self.channel_bandwidth,
+                                phasecentre=self.phasecentre, weight=1.0, columnar=True)
+        svis = create_visibility(self.lowcore, self.times, self.frequency,
+                                 channel_bandwidth=self.channel_bandwidth,
+                                 phasecentre=self.phasecentre, weight=1.0)
+        assert vis.columnar
+        assert not svis.columnar
+        assert vis.data.dtype == svis.data.dtype
+        for col in vis.data.dtype.fields.keys():
+            assert vis.data[col].flags['C_CONTIGUOUS']
+            assert vis.data[col].dtype.isnative
+            assert_allclose(vis.data[col], svis.data[col])
+        assert vis.size() == svis.size()
+        
+        rows = vis.time > 150.0
+        selected_vis = create_visibility_from_rows(vis, rows)
+        assert selected_vis.columnar
+        assert selected_vis.nvis == numpy.sum(rows)
+        selected_vis.data['vis'][...] = 1.0
+        vis.data[rows] = selected_vis.data
+        assert numpy.sum(numpy.abs(vis.vis)) == numpy.sum(rows)
+        
+        vis = append_visibility(vis, selected_vis)
+        assert vis.nvis == svis.nvis + selected_vis.nvis
+        vis = sort_visibility(vis, ['index'])
+        assert numpy.all(numpy.diff(vis.index) >= 0)
+
+    def test_convert_blockvisibility_columnar(self):
+        bvis = create_blockvisibility(self.lowcore, self.times, self.frequency, phasecentre=self.phasecentre,
+                                      weight=1.0, channel_bandwidth=self.channel_bandwidth, columnar=True)
+        assert bvis.columnar
+        assert bvis.vis.flags['C_CONTIGUOUS']
+        vis = convert_blockvisibility_to_visibility(bvis)
+        assert vis.columnar
+        assert vis.nvis == len(vis.time)
+
     def test_create_visibility_from_rows1(self):
         self.vis = create_visibility(self.lowcore, self.times, self.frequency,
                                      channel_bandwidth=self.channel_bandwidth,
@@ -66,6 +135,41 @@ class TestVisibilityOperations(unittest.TestCase):
             selected_vis = create_visibility_from_rows(self.vis, rows, makecopy=makecopy)
             assert selected_vis.nvis == numpy.sum(numpy.array(rows))
             
+    def test_create_visibility_view(self):
+        self.vis = create_visibility(self.lowcore, self.times, self.frequency,
+                                     channel_bandwidth=self.channel_bandwidth,
+                                     phasecentre=self.phasecentre, weight=1.0)
+        rows = self.vis.time > 150.0
+        view = create_visibility_view(self.vis, rows)
+        assert isinstance(view.rows, slice)
+        assert not view.materialised
+        assert view.nvis == numpy.sum(rows)
+        assert numpy.may_share_memory(view.vis, self.vis.vis)
+        assert_allclose(view.uvw, self.vis.uvw[rows])
+        with self.assertRaises(ValueError):
+            view.data['vis'][...] = 1.0
+        view.materialise()
+        view.data['vis'][...] = 1.0
+        assert numpy.max(numpy.abs(self.vis.vis)) == 0.0
+        
+        rows = numpy.abs(self.vis.time - 150.0) > 60.0
+        view = create_visibility_view(self.vis, rows)
+        assert not isinstance(view.rows, slice)
+        assert_allclose(view.time, self.vis.time[rows])
+        
+        copied = copy_visibility(create_visibility_view(self.vis, self.vis.time > 150.0), zero=True)
+        copied.data['vis'][...] = 1.0
+        assert numpy.max(numpy.abs(self.vis.vis)) == 0.0
+
+    def test_create_blockvisibility_view(self):
+        bvis = create_blockvisibility(self.lowcore, self.times, self.frequency, phasecentre=self.phasecentre,
+                                      weight=1.0, channel_bandwidth=self.channel_bandwidth, columnar=True)
+        rows = bvis.time > 150.0
+        view = create_visibility_view(bvis, rows)
+        assert isinstance(view.rows, slice)
+        assert numpy.may_share_memory(view.vis, bvis.vis)
+        assert view.nvis == numpy.sum(rows)
+
     def test_create_visibility_time(self):
         self.vis = create_visibility(self.lowcore, self.times, self.frequency, phasecentre=self.phasecentre,
                                           weight=1.0, channel_bandwidth=self.channel_bandwidth)